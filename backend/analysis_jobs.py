@@ -0,0 +1,151 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from structured_log import get_logger
+
+log = get_logger("analysis_jobs")
+
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+class AnalysisJobs:
+    """
+    Background AI analyses the client polls for.
+
+    submit(key, fn, *args) runs fn(*args) on a bounded thread pool and returns
+    a job ID right away. A job already pending (or finished within the TTL) for
+    the same key is reused instead of starting another one. Jobs expire
+    `ttl_s` after they were submitted, and at most `max_jobs` are kept: the
+    oldest finished ones are dropped first. When `max_pending` jobs are
+    already queued or running, submit() returns None and the caller keeps its
+    instant answer.
+
+    If `shared` (a SharedCache) is given, job states are mirrored there so a
+    poll that lands on another worker process still finds the job.
+    """
+
+    def __init__(self, workers=4, max_pending=64, ttl_s=600, max_jobs=1000, shared=None):
+        self.ttl_s = ttl_s
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self.shared = shared
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-job")
+        self._jobs = OrderedDict()   # job_id -> job dict, oldest first
+        self._by_key = {}            # key -> job_id
+        self._done_events = {}       # job_id -> threading.Event, while pending
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _expire(self, now):
+        # Oldest first: stop at the first job still within its TTL
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            if now - job["createdAt"] < self.ttl_s:
+                break
+            self._drop(job_id)
+        if len(self._jobs) > self.max_jobs:
+            for job_id in [j for j, job in self._jobs.items() if job["status"] != PENDING]:
+                self._drop(job_id)
+                if len(self._jobs) <= self.max_jobs:
+                    break
+
+    def _drop(self, job_id):
+        job = self._jobs.pop(job_id)
+        if self._by_key.get(job["key"]) == job_id:
+            del self._by_key[job["key"]]
+        event = self._done_events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def _publish(self, job):
+        if self.shared is not None:
+            remaining = max(1, int(self.ttl_s - (time.time() - job["createdAt"])))
+            self.shared.set("job:" + job["id"], self._public(job), ttl=remaining)
+
+    @staticmethod
+    def _public(job):
+        return {k: job[k] for k in ("id", "status", "result", "createdAt", "finishedAt")}
+
+    def submit(self, key, fn, *args):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            job_id = self._by_key.get(key)
+            if job_id is not None and self._jobs[job_id]["status"] != FAILED:
+                self.deduplicated += 1
+                return job_id
+            if len(self._done_events) >= self.max_pending:
+                self.rejected += 1
+                return None
+            job_id = uuid.uuid4().hex
+            job = {"id": job_id, "key": key, "status": PENDING, "result": None,
+                   "createdAt": now, "finishedAt": None}
+            self._jobs[job_id] = job
+            self._by_key[key] = job_id
+            self._done_events[job_id] = threading.Event()
+            self.submitted += 1
+        self._publish(job)
+        # copy_context() carries the request's LLM priority, user and request ID
+        self._pool.submit(contextvars.copy_context().run, self._run, job, fn, args)
+        return job_id
+
+    def _run(self, job, fn, args):
+        try:
+            result, status = fn(*args), DONE
+        except Exception as e:
+            log.warning("Analysis job failed: %s", e)
+            result, status = None, FAILED
+        with self._lock:
+            job.update(status=status, result=result, finishedAt=time.time())
+            if status == FAILED:
+                self.failed += 1
+            event = self._done_events.pop(job["id"], None)
+        self._publish(job)
+        if event is not None:
+            event.set()
+
+    def get(self, job_id, wait_s=0.0):
+        """
+        The job's {id, status, result, createdAt, finishedAt}, or None if it is
+        unknown or expired. wait_s > 0 long-polls until the job finishes.
+        """
+        with self._lock:
+            self._expire(time.time())
+            job = self._jobs.get(job_id)
+            event = self._done_events.get(job_id)
+        if job is not None:
+            if event is not None and wait_s > 0:
+                event.wait(wait_s)
+            with self._lock:
+                return self._public(job)
+
+        # Submitted by another worker process
+        if self.shared is None:
+            return None
+        deadline = time.monotonic() + wait_s
+        while True:
+            job = self.shared.get("job:" + job_id)
+            if job is None or job["status"] != PENDING or time.monotonic() >= deadline:
+                return job
+            time.sleep(0.25)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "jobs": len(self._jobs),
+                "pending": len(self._done_events),
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "failed": self.failed,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
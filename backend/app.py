@@ -1,143 +1,386 @@
 import os
+import re
 import json
-from flask import Flask, request, jsonify
+import atexit
+import hashlib
+import itertools
+import threading
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from groq import Groq
-from database import init_db, update_order_status, get_user, create_user
+from database import (
+    init_db, get_product_analysis, save_product_analysis, product_analysis_to_dict,
+    to_minor_units, add_llm_usage, get_llm_usage, add_to_catalog, get_catalog_product,
+    search_products, set_product_category, PRICE_SCALE,
+)
+from analysis_jobs import AnalysisJobs
+from cache_warmer import CacheWarmer, CoOccurrence, DemandCounter, WarmStats
+from confidence_gate import ConfidenceGate
+from export import FIELDS as EXPORT_TABLES, iter_export, parse_time
+from json_stream import IncrementalJSONParser, parse_stream
+from llm_scheduler import LLMScheduler, INTERACTIVE, BACKGROUND
+from llm_usage import LLMUsage, parse_budgets
+from model_router import ModelRouter, load_routes
+from near_duplicates import NearDuplicateIndex, material_mask, normalize_title
+from price_forecast import start_schedule as start_forecast_schedule
+from shared_cache import SharedCache
+from storage import SQLiteStore, make_store
+from structured_log import (
+    get_logger, log_stats, new_request_id, phase, phase_var, request_id_var, setup_logging,
+    shutdown_logging,
+)
+from urls import canonical_url
+from worker_lock import hold_lock
+from scoring import (
+    compute_heuristic_score,
+    map_score_to_grade,
+    clamp,
+    classify_fallback,
+    fallback_analysis,
+    heuristic_confidence,
+    score_batch,
+)
 
 load_dotenv()
 
+# JSON logs through a bounded queue drained by a background thread
+setup_logging(
+    os.getenv("LOG_LEVEL", "INFO"),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    burst=int(os.getenv("LOG_BURST", "5")),
+    window_s=float(os.getenv("LOG_WINDOW_S", "60")),
+)
+atexit.register(shutdown_logging)
+log = get_logger("app")
+
 app = Flask(__name__)
-CORS(app)  
+CORS(app, expose_headers=["ETag"])
 app.config["MAX_CONTENT_LENGTH"] = 2 * 1024 * 1024  # 2 MB limit
 with app.app_context():
     init_db()
 
+# Users, orders, prices and watches (STORAGE_BACKEND=sqlite|memory)
+store = make_store()
+
 # Groq client
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+AI_MODEL = "llama-3.1-8b-instant"
+HEURISTIC_VERSION = "heuristic-v1"  # stored as model_version for fallback results
+
+# Ordered models per call site with per-model timeouts, from LLM_ROUTES_FILE
+# or LLM_ROUTES (JSON); AI_MODEL everywhere by default. See model_router.py.
+model_router = ModelRouter(
+    load_routes(
+        os.getenv("LLM_ROUTES"), os.getenv("LLM_ROUTES_FILE"),
+        default_model=AI_MODEL, default_timeout_s=float(os.getenv("LLM_TIMEOUT_S", "10")),
+    ),
+    max_error_rate=float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5")),
+    slow_ratio=float(os.getenv("LLM_ROUTER_SLOW_RATIO", "0.8")),
+    probe_interval_s=float(os.getenv("LLM_ROUTER_PROBE_S", "30")),
+)
+# Model that answered the current request's last LLM call
+llm_model_used = contextvars.ContextVar("llm_model_used", default=None)
+
+# Skip the LLM when the heuristic is confident. Opt-in: set LLM_CONFIDENCE_GATE
+# to a threshold that held up on held-out items in bench/bench_confidence_gate.py
+confidence_gate = ConfidenceGate(
+    threshold=float(os.environ["LLM_CONFIDENCE_GATE"]) if os.getenv("LLM_CONFIDENCE_GATE") else None,
+    audit_rate=float(os.getenv("LLM_CONFIDENCE_AUDIT_RATE", "0.02")),
+)
+
+# Near-duplicate index: size/colour variants of an already scored product
+# reuse its score instead of calling the model again.
+NEAR_DUP_SNAPSHOT = os.getenv(
+    "NEAR_DUP_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "near_dup_index.npz"),
+)
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_SAVE_EVERY = 200  # new entries between background snapshots
+
+variant_index = NearDuplicateIndex.load_or_create(NEAR_DUP_SNAPSHOT, threshold=NEAR_DUP_THRESHOLD)
+_snapshot_lock = threading.Lock()
+
+
+def save_variant_snapshot():
+    # One worker writes the snapshot; the others' scores reach it through the
+    # shared cache (lookup_score adds shared hits to this index)
+    if not hold_lock(NEAR_DUP_SNAPSHOT + ".lock"):
+        return
+    if not _snapshot_lock.acquire(blocking=False):
+        return  # a snapshot is already being written
+    try:
+        variant_index.save(NEAR_DUP_SNAPSHOT)
+    except Exception as e:
+        log.warning("Near-duplicate snapshot failed: %s", e)
+    finally:
+        _snapshot_lock.release()
 
-MATERIALS = [
-    # textiles & natural fibers
-    "cotton", "organic cotton", "egyptian cotton", "bamboo", "hemp", "linen",
-    "jute", "wool", "silk",
-    # synthetics
-    "polyester", "microfiber", "nylon", "acrylic", "viscose",
-    # materials & packaging
-    "plastic", "recycled plastic", "recycled polyester", "rubber", "latex",
-    "leather", "metal", "steel", "aluminum", "glass",
-    # eco labels
-    "recycled", "biodegradable", "compostable", "eco-friendly", "sustainable",
-]
 
+atexit.register(save_variant_snapshot)
 
-MATERIAL_WEIGHTS = {
-    
-    "organic cotton": +4,
-    "bamboo": +4,
-    "hemp": +4,
-    "linen": +3,
-    "jute": +3,
-    "recycled": +3,
-    "recycled plastic": +2,
-    "recycled polyester": +1,
-    "biodegradable": +3,
-    "compostable": +3,
-    "eco-friendly": +2,
-    "sustainable": +2,
-
-    "cotton": +2,
-    "egyptian cotton": +2,
-    "wool": +1,
-    "silk": +1,
-
-    "polyester": -3,
-    "microfiber": -3,
-    "nylon": -3,
-    "acrylic": -3,
-    "viscose": -2,
-    "plastic": -3,
-    "rubber": -1,
-    "latex": -1,
-    "leather": -2,
-}
-
-
-def detect_materials(text: str):
-    if not text:
-        return []
-    lower = text.lower()
-    found = [mat for mat in MATERIALS if mat in lower]
-    return sorted(set(found))
-
-
-def compute_heuristic_score(text: str) -> int:
+
+# Cache shared by all worker processes on this host (SQLite file in WAL
+# mode): a product scored by one gunicorn worker is a hit in all others.
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared_cache.db"),
+)
+shared_cache = SharedCache(
+    SHARED_CACHE_PATH,
+    max_entries=int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "200000")),
+)
+SHARED_CACHE_PRICE_TTL_S = 3600  # same as the /track_price debounce window
+
+
+def score_cache_keys(title: str):
     """
-    Simple keyword-based sustainability score:
-    positive materials add points, harmful synthetics subtract.
-    Result is clamped to [-10, 10].
+    (full analysis key, score-only key) of a title in the shared cache. The
+    title's material mask is part of the key, like in the near-duplicate
+    index: a cotton and a polyester bedsheet don't share a score.
     """
-    if not text:
-        return 0
-
-    lower = text.lower()
-    score = 0
-
-    for kw, weight in MATERIAL_WEIGHTS.items():
-        if kw in lower:
-            score += weight
-
-    if "recycled" in lower and "recycled " not in lower:
-        score += 2
-
-    if score > 10:
-        score = 10
-    if score < -10:
-        score = -10
-    return score
-
-
-def map_score_to_grade(score: int) -> str:
-    if score >= 8:
-        return "A"
-    if score >= 5:
-        return "B"
-    if score >= 2:
-        return "C"
-    if score >= 0:
-        return "D"
-    return "F"
-
-
-def build_explanation(materials, score: int) -> str:
-    parts = []
-
-    if materials:
-        parts.append("Detected materials/keywords: " + ", ".join(materials) + ".")
-
-    if score >= 8:
-        parts.append("Overall this product appears highly eco-friendly based on the detected terms.")
-    elif score >= 5:
-        parts.append("Overall this product shows good sustainability characteristics.")
-    elif score >= 2:
-        parts.append("This product has a mix of positive and neutral sustainability traits.")
-    elif score >= 0:
-        parts.append("This product has mixed or unclear sustainability signals.")
-    else:
-        parts.append("This product likely has notable environmental drawbacks.")
+    normalized = normalize_title(title)
+    if not normalized:
+        return None, None
+    suffix = f"{normalized}|m{material_mask(title):x}"
+    return "analysis:" + suffix, "score:" + suffix
 
-    lower_materials = " ".join(materials).lower() if materials else ""
 
-    if any(x in lower_materials for x in ["bamboo", "hemp", "organic", "recycled", "compostable", "biodegradable"]):
-        parts.append("The presence of natural or recycled materials is a positive sign.")
-    if any(x in lower_materials for x in ["plastic", "polyester", "nylon", "synthetic"]):
-        parts.append("However, plastic or synthetic components can increase carbon footprint and reduce recyclability.")
+def remember_score(title: str, result: dict):
+    """
+    Adds an AI result to the near-duplicate index (snapshotting in the
+    background) and to the cross-worker cache.
+    """
+    if not title or not isinstance(result, dict):
+        return
+    variant_index.add(title, result)
+    if variant_index.adds_since_save >= NEAR_DUP_SAVE_EVERY:
+        threading.Thread(target=save_variant_snapshot, daemon=True).start()
+
+    analysis_key, score_key = score_cache_keys(title)
+    if score_key:
+        mask = material_mask(title)
+        if is_full_analysis(result):
+            shared_cache.set(analysis_key, {"titleMaterials": mask, "result": result})
+        score = {"numericScore": result.get("numericScore"), "grade": result.get("grade")}
+        if result.get("warmed"):
+            score["warmed"] = True
+        shared_cache.set(score_key, {"titleMaterials": mask, "result": score})
+
+
+# Lookups made on behalf of users, and how many hit an entry the cache warmer stored
+warm_stats = WarmStats()
 
-    return " ".join(parts).strip()
+
+def lookup_score(title: str, full: bool = True, record: bool = True):
+    """
+    Stored result for `title` or one of its variants: this worker's
+    near-duplicate index first, then the cache shared with the other workers.
+    full=False also accepts score-only entries (numericScore + grade).
+    """
+    hit = variant_index.lookup(title, accept=is_full_analysis if full else None)
+    if hit is None:
+        analysis_key, score_key = score_cache_keys(title)
+        if score_key:
+            entry = shared_cache.get(analysis_key if full else score_key)
+            # Only an entry scored for the same materials is reused and spread
+            # to this worker's index
+            if isinstance(entry, dict) and entry.get("titleMaterials") == material_mask(title):
+                hit = entry["result"]
+                variant_index.add(title, hit)
+    if record:
+        warm_stats.record(hit)
+    return hit
+
+
+# gunicorn.conf.py exports the worker count to its workers. Each worker has
+# its own scheduler, so the configured limits are totals split between them.
+WEB_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Every Groq call goes through the scheduler: global concurrency limit,
+# per-user rate limit, interactive calls ahead of background ones, and
+# shedding (LLMShed -> heuristic fallback) when the wait would be too long.
+llm_scheduler = LLMScheduler(
+    max_concurrency=max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "4")) // WEB_WORKERS),
+    user_rate=float(os.getenv("LLM_USER_RATE", "2")) / WEB_WORKERS,
+    user_burst=max(1.0, float(os.getenv("LLM_USER_BURST", "10")) / WEB_WORKERS),
+    max_wait={
+        INTERACTIVE: float(os.getenv("LLM_INTERACTIVE_MAX_WAIT_S", "2")),
+        BACKGROUND: float(os.getenv("LLM_BACKGROUND_MAX_WAIT_S", "15")),
+    },
+)
+
+# (priority, user key) of the LLM calls made by the current request
+llm_call_context = contextvars.ContextVar("llm_call_context", default=(INTERACTIVE, None))
+# user_id the current request's LLM usage is booked to, once a route knows it
+llm_usage_user = contextvars.ContextVar("llm_usage_user", default=None)
+
+# Tokens, latency and cost per call site and user; daily token budgets per
+# call site (LLM_DAILY_TOKEN_BUDGETS="ai_score=2000000,classify=200000")
+# switch that call site to the heuristic once used up.
+llm_usage = LLMUsage(
+    budgets=parse_budgets(os.getenv("LLM_DAILY_TOKEN_BUDGETS")),
+    price_per_m=(
+        float(os.getenv("LLM_PRICE_PROMPT_PER_M", "0.05")),
+        float(os.getenv("LLM_PRICE_COMPLETION_PER_M", "0.08")),
+    ),
+    persist=add_llm_usage,
+    flush_s=float(os.getenv("LLM_USAGE_FLUSH_S", "60")),
+)
+llm_usage.start()
+atexit.register(llm_usage.stop)
+
+
+@app.before_request
+def _reset_llm_context():
+    # Interactive by default, rate-limited per client address until a
+    # route knows the user_id
+    llm_call_context.set((INTERACTIVE, request.remote_addr))
+    llm_usage_user.set(None)
+    # Request ID for the logs: the client's X-Request-ID if it sent one
+    request_id_var.set(request.headers.get("X-Request-ID") or new_request_id())
+    phase_var.set(None)
+
+
+@app.after_request
+def _add_request_id(response):
+    request_id = request_id_var.get()
+    if request_id:
+        response.headers["X-Request-ID"] = request_id
+    return response
+
+
+def set_llm_context(priority, user_id=None):
+    _, current_user = llm_call_context.get()
+    llm_call_context.set((priority, user_id or current_user))
+    if user_id:
+        llm_usage_user.set(user_id)
+
+
+def completion_usage(obj):
+    """(prompt_tokens, completion_tokens) reported on a completion or stream chunk, or None."""
+    usage = getattr(obj, "usage", None) or getattr(getattr(obj, "x_groq", None), "usage", None)
+    if usage is None:
+        return None
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def open_routed_stream(prompt: str, call_site: str):
+    """
+    Opens a completion stream on the first model of the call site's route
+    that starts producing text within its timeout, failing over down the
+    route. Returns (model, started, stream, chunks, pending): pending holds
+    the chunks already read, up to the first text. Raises the last error.
+    """
+    candidates = model_router.candidates(call_site)
+    for i, (model, timeout_s) in enumerate(candidates):
+        started = time.perf_counter()
+        stream = None
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                timeout=timeout_s,
+            )
+            chunks = iter(stream)
+            pending = []
+            for chunk in chunks:
+                pending.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+            return model, started, stream, chunks, pending
+        except Exception as e:
+            if stream is not None:
+                stream.close()
+            model_router.record(model, timeout_s, ok=False)
+            if i == len(candidates) - 1:
+                raise
+            model_router.failed_over(call_site, model, e)
+
+
+def complete_routed(prompt: str, call_site: str):
+    """Non-streamed completion with the same model routing and failover. Returns (model, completion)."""
+    candidates = model_router.candidates(call_site)
+    for i, (model, timeout_s) in enumerate(candidates):
+        started = time.perf_counter()
+        try:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout_s,
+            )
+        except Exception as e:
+            model_router.record(model, timeout_s, ok=False)
+            if i == len(candidates) - 1:
+                raise
+            model_router.failed_over(call_site, model, e)
+            continue
+        model_router.record(model, time.perf_counter() - started, ok=True)
+        llm_model_used.set(model)
+        return model, completion
 
 
-def clamp(value, min_value, max_value):
-    return max(min_value, min(max_value, value))
+def stream_completion_text(prompt: str, call_site: str = "ai_score"):
+    """
+    Streams a Groq completion and yields the text deltas as they arrive.
+    Closing the generator early also closes the HTTP stream, so callers
+    that stop reading once their JSON is complete don't pay for the rest.
+    The scheduler slot is held until the stream is closed.
+
+    The model comes from the call site's route (open_routed_stream); once
+    text has arrived there is no failover. Usage is booked to call_site.
+    Groq reports it on the last chunk (x_groq.usage); a stream closed
+    before that is booked with estimated token counts.
+    """
+    priority, user_id = llm_call_context.get()
+    usage_user = llm_usage_user.get()
+    llm_usage.check_budget(call_site)
+    # Records logged while the stream is open are tagged phase=llm. The
+    # generator may be closed from another frame, so restore by value, not token.
+    previous_phase = phase_var.get()
+    phase_var.set("llm")
+    t0 = time.perf_counter()
+    started = None
+    model = None
+    usage = None
+    text_chars = 0
+    failed = False
+    try:
+        with llm_scheduler.slot(priority, user_id):
+            started = time.perf_counter()
+            model, model_started, stream, chunks, pending = open_routed_stream(prompt, call_site)
+            llm_model_used.set(model)
+            try:
+                for chunk in itertools.chain(pending, chunks):
+                    usage = completion_usage(chunk) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        text_chars += len(delta)
+                        yield delta
+            finally:
+                stream.close()
+    except Exception:
+        failed = True
+        raise
+    finally:
+        if model is not None:
+            model_router.record(model, time.perf_counter() - model_started, ok=not failed)
+        if started is not None:
+            estimated = usage is None
+            if estimated:
+                usage = (estimate_tokens(prompt), text_chars // 4) if not failed else (0, 0)
+            llm_usage.record(call_site, usage_user, usage[0], usage[1], time.perf_counter() - started,
+                             error=failed, estimated=estimated and not failed)
+        log.debug("llm phase done", extra={"duration_ms": round((time.perf_counter() - t0) * 1000, 2)})
+        phase_var.set(previous_phase)
 
 
 def calculate_trend(prices_data):
@@ -149,8 +392,6 @@ def calculate_trend(prices_data):
     if not prices_data or len(prices_data) < 2:
         return {'trend': 'insufficient_data', 'slope': 0, 'prediction_next_week': None}
 
-    import time
-    
     sorted_data = sorted(prices_data, key=lambda x: x['timestamp'])
     base_time = sorted_data[0]['timestamp'].timestamp()
     
@@ -191,29 +432,10 @@ def calculate_trend(prices_data):
     }
 
 
-def fallback_analysis(text: str) -> dict:
-    materials = detect_materials(text)
-    numeric_score = compute_heuristic_score(text)
-    grade = map_score_to_grade(numeric_score)
-    explanation = build_explanation(materials, numeric_score)
-
-    carbon_kg = clamp(abs(numeric_score) * 0.8 + 1, 0.2, 12)
-    water_l = clamp(abs(numeric_score) * 150 + 200, 50, 3000)
-
-    return {
-        "numericScore": numeric_score,
-        "grade": grade,
-        "materials": materials,
-        "carbonFootprintKg": carbon_kg,
-        "waterUsageLiters": water_l,
-        "explanation": explanation,
-        "used": "fallback",
-    }
-
 def ai_score(text: str) -> dict:
     """
     Calls Groq (Llama 3) with a structured prompt.
-    Returns parsed JSON. Tries to be robust if the model adds extra text.
+    Returns parsed JSON. Prose before or after the JSON is ignored.
     """
 
     prompt = f"""
@@ -305,25 +527,50 @@ Now analyze this product and return JSON only:
 {text}
 """
 
-    completion = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": prompt}],
-    )
-    content = completion.choices[0].message.content.strip()
+    # Stream the completion and stop at the closing brace of the score object.
+    # Objects without a score (e.g. a category "analysis" the model sometimes
+    # prints first) are skipped.
+    with closing(stream_completion_text(prompt)) as chunks:
+        return parse_stream(
+            chunks,
+            target="object",
+            accept=lambda obj: "numericScore" in obj or "grade" in obj,
+        )
+
+def conditional_json(body: dict):
+    """
+    JSON response with an ETag over the body. If the client already has this
+    exact body (If-None-Match), answer 304 without sending it again.
+    """
+    etag = hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify(body)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def is_full_analysis(payload: dict) -> bool:
+    return "explanation" in payload and "materials" in payload
+
+
+def ai_score_variant_aware(title: str, text: str = None, full: bool = True) -> dict:
+    """
+    ai_score() that first looks up an already scored near-duplicate of `title`
+    (same product in another size/colour/pack) and reuses its result.
+    full=False also accepts score-only entries (numericScore + grade) such as
+    those stored by /alternatives.
+    """
+    hit = lookup_score(title, full=full)
+    if hit is not None:
+        return hit
+
+    result = ai_score(text or title)
+    remember_score(title, result)
+    return result
 
- 
-    try:
-        return json.loads(content)
-    except Exception:
-        json_blocks = content.split("\n\n")
-        for block in reversed(json_blocks):
-            block = block.strip()
-            if block.startswith("{") and block.endswith("}"):
-                try:
-                    return json.loads(block)
-                except:
-                    pass
-        raise
 
 @app.post("/classify")
 def classify():
@@ -333,6 +580,7 @@ def classify():
     """
 
     payload = request.get_json(silent=True) or {}
+    set_llm_context(BACKGROUND, payload.get("user_id"))
 
     text = " ".join([
         payload.get("title", ""),
@@ -343,7 +591,11 @@ def classify():
     if not text.strip():
         return jsonify({"category": "unknown", "gender": "unisex"})
 
-   
+    cache_key = "classify:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+    cached = shared_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+
     try:
         prompt = f"""
         You will classify an e-commerce product.
@@ -375,9 +627,19 @@ def classify():
         }}
         """
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
+        llm_usage.check_budget("classify")
+        with phase("llm", log), llm_scheduler.slot(*llm_call_context.get()):
+            started = time.perf_counter()
+            try:
+                _, completion = complete_routed(prompt, "classify")
+            except Exception:
+                llm_usage.record("classify", llm_usage_user.get(), 0, 0, time.perf_counter() - started, error=True)
+                raise
+        usage = completion_usage(completion)
+        llm_usage.record(
+            "classify", llm_usage_user.get(),
+            *(usage or (estimate_tokens(prompt), estimate_tokens(completion.choices[0].message.content or ""))),
+            time.perf_counter() - started, estimated=usage is None,
         )
 
         raw = completion.choices[0].message.content.strip()
@@ -386,6 +648,12 @@ def classify():
             data = json.loads(raw)
             cat = data.get("category", "unknown")
             gen = data.get("gender", "unisex")
+            shared_cache.set(cache_key, {"category": cat, "gender": gen})
+            if payload.get("url") and cat != "unknown":
+                try:
+                    set_product_category(canonical_url(payload["url"]), cat)  # for /suggest_alternatives
+                except Exception as e:
+                    log.error("Could not store product category: %s", e)
             return jsonify({"category": cat, "gender": gen})
         except Exception:
             pass
@@ -393,100 +661,9 @@ def classify():
     except Exception:
         pass  # fail to heuristic fallback
 
-    if any(x in text for x in ["saree", "lehenga", "anarkali", "salwar", "kurti"]):
-        category = "women_ethnic"
-    elif any(x in text for x in ["shirt", "tshirt", "dress", "jeans", "trouser", "hoodie", "top"]):
-        category = "clothing_textiles"
-    elif any(x in text for x in ["shoe", "sandal", "sneaker", "boot"]):
-        category = "footwear"
-    elif any(x in text for x in ["phone", "laptop", "earphone", "headphone", "smartwatch", "camera"]):
-        category = "electronics"
-    elif any(x in text for x in ["cream", "shampoo", "lipstick", "lotion", "soap"]):
-        category = "beauty_personal_care"
-    elif any(x in text for x in ["towel", "bottle", "pan", "cookware", "bedsheet", "pillow", "mattress"]):
-        category = "home_kitchen"
-    else:
-        category = "generic_other"
-
-    if any(x in text for x in ["women", "ladies", "girl", "female"]):
-        gender = "female"
-    elif any(x in text for x in ["men", "male", "boy"]):
-        gender = "male"
-    else:
-        gender = "unisex"
-
-    return jsonify({"category": category, "gender": gender})
+    return jsonify(classify_fallback(text))
 
 
-def ai_score_alternatives(names: list[str]) -> list[dict]:
-    """
-    Fast multi-product scoring:
-    Takes a list of product names (strings) and returns
-    a list of { "name", "numericScore", "grade" } dicts.
-    Only ONE Groq call for all products.
-    """
-
-    if not names:
-        return []
-
-    numbered_list = "\n".join(f"{i+1}. {n}" for i, n in enumerate(names))
-
-    prompt = f"""
-You are GreenChoice, an AI sustainability expert.
-
-You will receive a numbered list of product names (titles). For EACH product,
-estimate how eco-friendly it is based ONLY on the name (assume typical materials):
-
-- Higher scores for: organic cotton, bamboo, hemp, linen, wool, recycled materials,
-  eco-friendly / biodegradable / compostable, plant-based, low-plastic.
-- Lower scores for: plastic, polyester, nylon, disposable, synthetic-heavy,
-  fossil-fuel intensive, single-use items.
-
-For each product, output:
-- "name": exactly the original product name as given
-- "numericScore": an integer from -10 (very bad) to +10 (very good)
-- "grade": A, B, C, D, or F
-
-SCORING:
-- A: 8 to 10
-- B: 5 to 7
-- C: 2 to 4
-- D: 0 to 1
-- F: -10 to -1
-
-IMPORTANT:
-Return a JSON ARRAY only, no extra text, no explanations.
-Example:
-[
-  {{"name": "Organic bamboo toothbrush", "numericScore": 9, "grade": "A"}},
-  {{"name": "Plastic single-use razor", "numericScore": -4, "grade": "F"}}
-]
-
-Now score the following products:
-
-{numbered_list}
-"""
-
-    completion = client.chat.completions.create(
-        model="llama-3.1-8b-instant",   # make sure you're using a valid Groq model
-        messages=[{"role": "user", "content": prompt}],
-    )
-
-    content = completion.choices[0].message.content.strip()
-
-    try:
-        return json.loads(content)
-    except Exception:
-        blocks = [b.strip() for b in content.split("\n\n") if b.strip()]
-        for block in reversed(blocks):
-            if block.startswith("[") and block.endswith("]"):
-                try:
-                    return json.loads(block)
-                except Exception:
-                    pass
-        # if everything fails, let caller handle fallback
-        raise
-
 @app.post("/analyze")
 def analyze():
     """
@@ -494,15 +671,61 @@ def analyze():
     expects JSON { url, title, description } from the extension.
     """
     payload = request.get_json(silent=True) or {}
+    set_llm_context(INTERACTIVE, payload.get("user_id"))
     url = payload.get("url", "") or ""
     title = payload.get("title", "") or ""
     description = payload.get("description", "") or ""
 
     text = "\n".join([title, description, url])
+    if title.strip():
+        product_views.record([title.strip()])
+
+    # Reuse the stored analysis for this product URL unless the scraped text
+    # changed. Fallback results are not reused, so the AI gets another try;
+    # gate-skipped ones are, as long as the gate is on.
+    product_key = canonical_url(url)
+    content_hash = hashlib.sha256("\n".join([title, description]).encode("utf-8")).hexdigest()
+    with phase("db", log):
+        stored = get_product_analysis(product_key) if product_key else None
+    reusable = ("AI", "heuristic-gated") if confidence_gate.enabled else ("AI",)
+    if stored and stored["content_hash"] == content_hash and stored["source"] in reusable:
+        return conditional_json(product_analysis_to_dict(stored))
+
+    if payload.get("async") or request.args.get("async") == "1":
+        # Instant heuristic answer; the AI result is fetched from /analysis/<job_id>
+        result = fallback_analysis(text)
+        job_key = product_key or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        job_id = analysis_jobs.submit(job_key + ":" + content_hash, analyze_with_ai,
+                                      title, text, product_key, content_hash)
+        result["jobId"] = job_id
+        result["pending"] = job_id is not None
+        return jsonify(result)
+
+    return conditional_json(analyze_with_ai(title, text, product_key, content_hash))
+
+
+def analyze_with_ai(title, text, product_key, content_hash):
+    """
+    AI analysis, stored for the product URL. The heuristic answers instead
+    when it is confident (see confidence_gate) or the model fails.
+    """
+    llm_model_used.set(None)
+    heuristic = fallback_analysis(text)
+    decision = "llm"
+    if not (title.strip() and lookup_score(title, record=False) is not None):
+        heuristic["confidence"] = heuristic_confidence(text, heuristic["numericScore"])
+        decision = confidence_gate.decide("analyze", heuristic["confidence"])
+
+    if decision == "skip":
+        heuristic["used"] = "heuristic-gated"
+        return store_analysis(product_key, heuristic, HEURISTIC_VERSION, content_hash, title)
 
     try:
-        ai = ai_score(text)
-        return jsonify({
+        if title.strip():
+            ai = ai_score_variant_aware(title, text)
+        else:
+            ai = ai_score(text)
+        result = {
             "numericScore": ai.get("numericScore"),
             "grade": ai.get("grade"),
             "materials": ai.get("materials", []),
@@ -510,23 +733,112 @@ def analyze():
             "waterUsageLiters": ai.get("waterUsageLiters"),
             "explanation": ai.get("explanation"),
             "used": "AI",
-        })
+        }
+        model_version = llm_model_used.get() or AI_MODEL
+        if decision == "audit":
+            confidence_gate.record_audit("analyze", heuristic["grade"], result["grade"])
     except Exception as e:
-        print("AI failed, using fallback:", e, flush=True)
-        fb = fallback_analysis(text)
-        return jsonify(fb)
+        log.warning("AI failed, using fallback: %s", e)
+        result = heuristic
+        model_version = HEURISTIC_VERSION
 
-def ai_score_alternatives(names: list[str]) -> list[dict]:
+    return store_analysis(product_key, result, model_version, content_hash, title)
+
+
+def store_analysis(product_key, result, model_version, content_hash, title=None):
+    """Saves an /analyze result for the product URL (if any) and returns it."""
+    if product_key:
+        try:
+            with phase("db", log):
+                save_product_analysis(product_key, result, model_version, content_hash, name=(title or "").strip() or None)
+        except Exception as e:
+            log.error("Could not store product analysis: %s", e)
+
+    return result
+
+
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+ANALYSIS_JOB_TTL_S = int(os.getenv("ANALYSIS_JOB_TTL_S", "600"))
+ANALYSIS_JOB_MAX = int(os.getenv("ANALYSIS_JOB_MAX", "1000"))
+analysis_jobs = AnalysisJobs(
+    workers=ANALYSIS_JOB_WORKERS, max_pending=ANALYSIS_JOB_WORKERS * 16,
+    ttl_s=ANALYSIS_JOB_TTL_S, max_jobs=ANALYSIS_JOB_MAX, shared=shared_cache,
+)
+
+
+@app.get("/analysis/<job_id>")
+def analysis_job_route(job_id):
+    """
+    State of an /analyze async job: {status: pending|done|failed, result}.
+    ?wait=S long-polls up to S seconds (max 25) for the result.
+    """
+    try:
+        wait_s = min(max(float(request.args.get("wait", 0)), 0.0), 25.0)
+    except ValueError:
+        return jsonify({"error": "wait must be a number"}), 400
+    job = analysis_jobs.get(job_id, wait_s)
+    if job is None:
+        return jsonify({"error": "unknown or expired job"}), 404
+    return jsonify(job)
+
+
+@app.get("/analysis_jobs_stats")
+def analysis_jobs_stats_route():
+    return jsonify(analysis_jobs.stats())
+
+VALID_GRADES = {"A", "B", "C", "D", "F"}
+
+
+def validate_alternative_item(raw, names: list[str]):
+    """
+    Checks one element of the model's answer against the batch schema:
+      { "id": 1..len(names), "numericScore": int -10..10, "grade": A-F }
+    Returns { "id", "name", "numericScore", "grade" } with `name` taken from
+    the request (never from the model), or None if the element is unusable.
+    A missing/invalid grade is derived from the score.
+    """
+    if not isinstance(raw, dict):
+        return None
+
+    item_id = raw.get("id")
+    if isinstance(item_id, str) and item_id.strip().isdigit():
+        item_id = int(item_id.strip())
+    if not isinstance(item_id, int) or isinstance(item_id, bool):
+        # Older answer format: exact name echo
+        name = raw.get("name")
+        item_id = names.index(name) + 1 if name in names else None
+    if item_id is None or not 1 <= item_id <= len(names):
+        return None
+
+    score = raw.get("numericScore")
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        return None
+    if score != score or not -10 <= score <= 10 or score != int(score):
+        return None
+    score = int(score)
+
+    grade = str(raw.get("grade") or "").strip().upper()
+    if grade not in VALID_GRADES:
+        grade = map_score_to_grade(score)
+
+    return {"id": item_id, "name": names[item_id - 1], "numericScore": score, "grade": grade}
+
+
+def iter_ai_score_alternatives(names: list[str]):
     """
     Fast multi-product scoring:
-    Takes a list of product names (strings) and returns
-    a list of { "name", "numericScore", "grade" } dicts.
+    Takes a list of product names (strings) and yields validated
+    { "id", "name", "numericScore", "grade" } dicts one by one,
+    as soon as each array element has been streamed in.
+    Items are matched back by their position in the list ("id"),
+    so a model that rewrites a title can't lose the score.
     Only ONE Groq call for all products.
     """
 
     if not names:
-        return []
-
+        return
 
     numbered_list = "\n".join(f"{i+1}. {n}" for i, n in enumerate(names))
 
@@ -542,7 +854,7 @@ estimate how eco-friendly it is based ONLY on the name (assume typical materials
   fossil-fuel intensive, single-use items.
 
 For each product, output:
-- "name": exactly the original product name as given
+- "id": the product's number in the list
 - "numericScore": an integer from -10 (very bad) to +10 (very good)
 - "grade": A, B, C, D, or F
 
@@ -554,11 +866,12 @@ SCORING:
 - F: -10 to -1
 
 IMPORTANT:
-- Return a JSON ARRAY only, no extra text, no explanations.
+- Return a JSON ARRAY only, one object per product, no extra text, no explanations.
+- Do NOT repeat the product names.
 - JSON format example:
 [
-  {{"name": "Organic bamboo toothbrush", "numericScore": 9, "grade": "A"}},
-  {{"name": "Plastic single-use razor", "numericScore": -4, "grade": "F"}}
+  {{"id": 1, "numericScore": 9, "grade": "A"}},
+  {{"id": 2, "numericScore": -4, "grade": "F"}}
 ]
 
 Now score the following products:
@@ -566,33 +879,336 @@ Now score the following products:
 {numbered_list}
 """
 
-    completion = client.chat.completions.create(
-        model="llama-3.1-8b-instant",   # fast Groq model
-        messages=[{"role": "user", "content": prompt}],
+    parser = IncrementalJSONParser(
+        target="array",
+        accept=lambda arr: any(isinstance(x, dict) for x in arr),
+        accept_element=lambda x: isinstance(x, dict),
     )
+    with closing(stream_completion_text(prompt, call_site="ai_score_alternatives")) as chunks:
+        for chunk in chunks:
+            for raw in parser.feed(chunk):
+                item = validate_alternative_item(raw, names)
+                if item is not None:
+                    yield item
+            if parser.done:
+                return
+
+    # Stream ended without a closing "]": keep whatever items already came
+    # through, otherwise accept a lone object or let caller fall back.
+    if parser.elements:
+        return
+    for raw in parser.finish():
+        item = validate_alternative_item(raw, names)
+        if item is not None:
+            yield item
+
+
+def ai_score_alternatives(names: list[str]) -> list[dict]:
+    """
+    Same as iter_ai_score_alternatives() but collects the whole list.
+    """
+    return list(iter_ai_score_alternatives(names))
+
+# -----------------------------
+# Chunked, parallel scoring for /alternatives
+# -----------------------------
 
-    content = completion.choices[0].message.content.strip()
+ALTERNATIVES_CHUNK_TOKENS = int(os.getenv("ALTERNATIVES_CHUNK_TOKENS", "400"))
+ALTERNATIVES_MAX_CHUNK_ITEMS = 10
+ALTERNATIVES_WORKERS = int(os.getenv("ALTERNATIVES_WORKERS", "8"))
+ALTERNATIVES_DEADLINE_S = float(os.getenv("ALTERNATIVES_DEADLINE_S", "8"))
+ALTERNATIVES_RETRIES = 1             # follow-up calls for missing/invalid items
+ALTERNATIVES_RETRY_MIN_S = 1.0       # don't start a follow-up with less time left
 
-    # Robust JSON parsing: try direct, then block-by-block (use last valid JSON)
+_alternatives_pool = ThreadPoolExecutor(
+    max_workers=ALTERNATIVES_WORKERS, thread_name_prefix="alternatives"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English product titles
+    return len(text) // 4 + 1
+
+
+def chunk_names(names: list[str], token_budget: int = None, max_items: int = None) -> list[list[str]]:
+    """
+    Splits names into chunks that fit a token budget. Each name costs its
+    prompt tokens plus ~15 tokens for its {id, numericScore, grade} answer,
+    so chunk latency stays roughly constant regardless of list size.
+    """
+    token_budget = token_budget or ALTERNATIVES_CHUNK_TOKENS
+    max_items = max_items or ALTERNATIVES_MAX_CHUNK_ITEMS
+
+    chunks, current, used = [], [], 0
+    for name in names:
+        cost = estimate_tokens(name) + 15
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(name)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BatchMatchStats:
+    """
+    Match-rate bookkeeping for batched alternative scoring: how many of the
+    requested items came back valid on the first call and after follow-ups.
+    Keeps running totals plus the most recent batches.
+    """
+
+    def __init__(self, keep=100):
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=keep)
+        self.batches = 0
+        self.requested = 0
+        self.matched_first = 0
+        self.matched_total = 0
+        self.retries = 0
+
+    def record(self, requested, matched_first, matched_total, retries):
+        with self._lock:
+            self.batches += 1
+            self.requested += requested
+            self.matched_first += matched_first
+            self.matched_total += matched_total
+            self.retries += retries
+            self.recent.append({
+                "requested": requested,
+                "matchedFirstPass": matched_first,
+                "matched": matched_total,
+                "retries": retries,
+                "matchRate": round(matched_total / requested, 4) if requested else None,
+            })
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requested": self.requested,
+                "firstPassMatchRate": round(self.matched_first / self.requested, 4) if self.requested else None,
+                "matchRate": round(self.matched_total / self.requested, 4) if self.requested else None,
+                "retries": self.retries,
+                "recent": list(self.recent),
+            }
+
+
+alternatives_stats = BatchMatchStats()
+
+
+def score_chunk_with_retry(chunk: list[str], deadline_at: float, on_item) -> None:
+    """
+    Scores one chunk. Items that are missing or invalid in the answer (or the
+    whole chunk, if the call failed) are re-requested in a smaller follow-up
+    call, as long as there is time left before the deadline.
+    on_item(item) is called for every validated item.
+    """
+    pending = list(chunk)
+    matched_first = None
+    retries = 0
+    errors = []
+
+    for attempt in range(ALTERNATIVES_RETRIES + 1):
+        if attempt:
+            if time.monotonic() > deadline_at - ALTERNATIVES_RETRY_MIN_S:
+                break
+            retries += 1
+
+        got = set()
+        try:
+            for item in iter_ai_score_alternatives(pending):
+                if item["name"] in got:
+                    continue
+                got.add(item["name"])
+                on_item(item)
+        except Exception as e:
+            errors.append(e)
+
+        if matched_first is None:
+            matched_first = len(got)
+        pending = [n for n in pending if n not in got]
+        if not pending:
+            break
+
+    matched_total = len(chunk) - len(pending)
+    alternatives_stats.record(len(chunk), matched_first or 0, matched_total, retries)
+    if pending and errors:
+        raise errors[-1]
+
+
+def score_names_chunked(names: list[str], deadline_s: float = None) -> dict:
+    """
+    Scores names with one streamed AI call per chunk, all chunks running
+    concurrently on a bounded worker pool.
+    Returns {name: item} for every item that arrived before the deadline;
+    the caller fills in the rest with the heuristic. Chunks that miss the
+    deadline keep running and still land in the near-duplicate index.
+    """
+    deadline_s = ALTERNATIVES_DEADLINE_S if deadline_s is None else deadline_s
+    deadline_at = time.monotonic() + deadline_s
+    results = {}
+    lock = threading.Lock()
+
+    def on_item(item):
+        with lock:
+            results[item["name"]] = item
+        remember_score(item["name"], {
+            "numericScore": item["numericScore"],
+            "grade": item["grade"],
+        })
+
+    # copy_context() carries the request's LLM priority/user into the workers
+    futures = [
+        _alternatives_pool.submit(
+            contextvars.copy_context().run, score_chunk_with_retry, chunk, deadline_at, on_item
+        )
+        for chunk in chunk_names(names)
+    ]
+    done, not_done = wait(futures, timeout=deadline_s)
+
+    for f in done:
+        if f.exception() is not None:
+            log.warning("AI chunk failed for alternatives, using heuristic for it: %s", f.exception())
+    if not_done:
+        log.warning("%d alternatives chunk(s) missed the %gs deadline, using heuristic", len(not_done), deadline_s)
+
+    with lock:
+        return dict(results)
+
+
+# -----------------------------
+# Background cache warmer
+# -----------------------------
+
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "1") == "1"
+WARMER_WINDOW_DAYS = float(os.getenv("WARMER_WINDOW_DAYS", "7"))
+# Counted on the request path of every worker and added up in the shared
+# cache file, so the warmer's worker ranks the whole server's traffic:
+# uncached /alternatives candidates, titles opened in the popup (/analyze),
+# and the candidates each /alternatives call shows together
+alternatives_demand = DemandCounter(shared=shared_cache, kind="alternatives_demand")
+product_views = DemandCounter(shared=shared_cache, kind="product_views")
+alternatives_together = CoOccurrence(shared=shared_cache, kind="alternatives_together")
+
+
+def warmer_hot_products(limit):
+    """
+    Most viewed titles first, then products with the most stored prices
+    (/track_price keeps at most one an hour).
+    """
+    since = int(time.time() - WARMER_WINDOW_DAYS * 86400)
+    stored = [row['name'] for row in store.get_hot_products(since, limit)]
+    return list(dict.fromkeys(product_views.most_common(limit) + stored))[:limit]
+
+
+def warmer_score_full(title):
+    set_llm_context(BACKGROUND, "cache-warmer")
+    remember_score(title, dict(ai_score(title), warmed=True))
+
+
+def warmer_score_batch(titles):
+    """One batched call; returns how many titles were scored."""
+    set_llm_context(BACKGROUND, "cache-warmer")
+    scored = 0
+    for item in iter_ai_score_alternatives(titles):
+        remember_score(item["name"], {
+            "numericScore": item["numericScore"],
+            "grade": item["grade"],
+            "warmed": True,
+        })
+        scored += 1
+    return scored
+
+
+def llm_idle():
+    stats = llm_scheduler.stats()
+    return stats["active"] == 0 and stats["queued"] == 0
+
+
+cache_warmer = CacheWarmer(
+    hot_products=warmer_hot_products,
+    is_cached=lambda title, full: lookup_score(title, full=full, record=False) is not None,
+    score_full=warmer_score_full,
+    score_batch=warmer_score_batch,
+    is_idle=llm_idle,
+    demand=alternatives_demand,
+    co_occurrence=alternatives_together,
+    calls_per_hour=int(os.getenv("WARMER_CALLS_PER_HOUR", "20")),
+    interval_s=float(os.getenv("WARMER_INTERVAL_S", "300")),
+    batch_size=ALTERNATIVES_MAX_CHUNK_ITEMS,
+)
+# One warmer for the whole server: only the worker holding the lock runs it,
+# so WARMER_CALLS_PER_HOUR is not multiplied by the worker count
+if WARMER_ENABLED and hold_lock(SHARED_CACHE_PATH + ".warmer.lock"):
+    cache_warmer.start()
+
+
+# The price forecast job reruns in one worker; 0 leaves it to cron
+PRICE_FORECAST_INTERVAL_S = float(os.getenv("PRICE_FORECAST_INTERVAL_S", str(6 * 3600)))
+if (PRICE_FORECAST_INTERVAL_S > 0 and isinstance(store, SQLiteStore)
+        and hold_lock(SHARED_CACHE_PATH + ".forecast.lock")):
+    start_forecast_schedule(PRICE_FORECAST_INTERVAL_S)
+
+
+@app.get("/warmer_stats")
+def warmer_stats_route():
+    """Cache warmer activity and the share of user lookups answered by warmed entries."""
+    return jsonify({"warmer": cache_warmer.stats(), "lookups": warm_stats.snapshot()})
+
+
+@app.get("/llm_scheduler_stats")
+def llm_scheduler_stats_route():
+    """Concurrency, queue wait times and shed counts of the LLM scheduler."""
+    return jsonify(llm_scheduler.stats())
+
+
+@app.get("/model_router_stats")
+def model_router_stats_route():
+    """Routes per call site, recent error rate and p95 latency per model, and failovers."""
+    return jsonify(model_router.stats())
+
+
+@app.get("/llm_usage")
+def llm_usage_route():
+    """
+    LLM tokens, latency and estimated cost: today per call site (with the
+    daily budget left) and top users from this worker's rolling counters, and
+    the stored per-day totals of all workers for the last ?days= days.
+    """
     try:
-        return json.loads(content)
-    except Exception:
-        blocks = [b.strip() for b in content.split("\n\n") if b.strip()]
-        for block in reversed(blocks):
-            if block.startswith("[") and block.endswith("]"):
-                try:
-                    return json.loads(block)
-                except Exception:
-                    pass
-            if block.startswith("{") and block.endswith("}"):
-                try:
-                    single = json.loads(block)
-                    if isinstance(single, dict):
-                        return [single]
-                except Exception:
-                    pass
-        # If everything fails, let caller fall back to heuristic
-        raise
+        days = min(max(int(request.args.get("days", 7)), 1), 90)
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    stored = [
+        dict(row, seconds=round(row["seconds"], 3),
+             cost_usd=round(llm_usage.cost(row["prompt_tokens"], row["completion_tokens"]), 6))
+        for row in get_llm_usage(days)
+    ]
+    return jsonify(dict(llm_usage.stats(), stored=stored))
+
+
+@app.get("/confidence_gate_stats")
+def confidence_gate_stats_route():
+    """
+    Share of LLM calls the confident heuristic answered instead, per call
+    site, and how often sampled confident answers agreed with the LLM.
+    """
+    return jsonify(confidence_gate.stats())
+
+
+@app.get("/log_stats")
+def log_stats_route():
+    """Log records queued, dropped (queue full) and suppressed (rate limit) in this worker."""
+    return jsonify(log_stats())
+
+
+@app.get("/alternatives_stats")
+def alternatives_stats_route():
+    """Match rate of batched alternative scoring (totals + recent batches)."""
+    return jsonify(alternatives_stats.snapshot())
+
 
 @app.post("/alternatives")
 def alternatives():
@@ -616,6 +1232,7 @@ def alternatives():
       }
     """
     payload = request.get_json(silent=True) or {}
+    set_llm_context(INTERACTIVE, payload.get("user_id"))
     products = payload.get("products")
 
     if not isinstance(products, list):
@@ -625,7 +1242,7 @@ def alternatives():
     normalized = []
     names = []
 
-    for p in products[:8]:   # hard limit for speed
+    for p in products:
         if isinstance(p, dict):
        
             title = (
@@ -654,20 +1271,57 @@ def alternatives():
 
     if not names:
         return jsonify({"alternatives": []})
+    alternatives_together.record(names)
 
     results = []
 
-    # Try bulk AI scoring once for all names 
+    # Reuse scores of already seen products (incl. size/colour variants)
     score_map = {}
-    try:
-        ai_list = ai_score_alternatives(names)  # ONE Groq call
-        for item in ai_list:
-            n = item.get("name")
-            if not n:
-                continue
-            score_map[n] = item
-    except Exception as e:
-        print("AI bulk failed for alternatives, using heuristic only:", e, flush=True)
+    for n in names:
+        hit = lookup_score(n, full=False)
+        if hit is not None and hit.get("numericScore") is not None:
+            score_map[n] = hit
+
+    # One representative per normalized title goes to the model
+    representatives = {}
+    for n in names:
+        if n not in score_map:
+            representatives.setdefault(normalize_title(n) or n, n)
+
+    # Titles the heuristic grades confidently don't go to the model
+    confident, audited = set(), {}
+    for key, n in list(representatives.items()):
+        score = compute_heuristic_score(n)
+        decision = confidence_gate.decide("alternatives", heuristic_confidence(n, score))
+        if decision == "skip":
+            confident.add(normalize_title(n) or n)
+            del representatives[key]
+        elif decision == "audit":
+            audited[n] = map_score_to_grade(score)
+
+    # AI scoring for the rest: token-budgeted chunks in parallel, under a deadline
+    if representatives:
+        score_map.update(score_names_chunked(list(representatives.values())))
+        for n, grade in audited.items():
+            if n in score_map:
+                confidence_gate.record_audit("alternatives", grade, score_map[n].get("grade"))
+
+        # Variants of the representatives that were just scored
+        for n in names:
+            if n not in score_map:
+                hit = variant_index.lookup(n)
+                if hit is not None and hit.get("numericScore") is not None:
+                    score_map[n] = hit
+
+    # Heuristic scores for everything the AI didn't cover, in one vectorized pass
+    missing = [n for n in names if n not in score_map]
+    # the cache warmer scores these later
+    alternatives_demand.record([n for n in missing if (normalize_title(n) or n) not in confident])
+    heuristic = score_batch(missing)
+    heuristic_map = dict(zip(
+        missing,
+        zip(heuristic["numericScore"].tolist(), heuristic["grade"].tolist()),
+    ))
 
     # Build final results, preserving URL/price from normalized list 
     for prod in normalized:
@@ -680,8 +1334,7 @@ def alternatives():
             numeric_score = ai_item.get("numericScore")
             grade = ai_item.get("grade")
         else:
-            numeric_score = compute_heuristic_score(name)
-            grade = map_score_to_grade(numeric_score)
+            numeric_score, grade = heuristic_map[name]
 
         results.append({
             "name": name,
@@ -694,8 +1347,87 @@ def alternatives():
     #Sort best first (by numericScore)
     results.sort(key=lambda r: (r.get("numericScore") or 0), reverse=True)
 
+    # Scored candidates with a product URL feed /suggest_alternatives; a grade
+    # /analyze stored for the same product is kept
+    try:
+        with phase("db", log):
+            add_to_catalog([
+                (canonical_url(r["url"]), r["name"], None, None, r["grade"], r["numericScore"], "alternatives")
+                for r in results if r["url"]
+            ])
+    except Exception as e:
+        log.error("Could not add alternatives to the search catalog: %s", e)
+
     return jsonify({"alternatives": results})
 
+
+SUGGEST_MAX_TERMS = 16
+
+
+def catalog_item(row):
+    """A product_catalog row (with last_price_minor) as returned by /suggest_alternatives."""
+    price = row["last_price_minor"]
+    return {
+        "name": row["name"],
+        "url": row["canonical_url"],
+        "category": row["category"],
+        "grade": row["grade"],
+        "numericScore": row["numeric_score"],
+        "materials": [m for m in (row["materials"] or "").split(", ") if m],
+        "price": price / PRICE_SCALE if price is not None else None,
+    }
+
+
+@app.get("/suggest_alternatives")
+def suggest_alternatives():
+    """
+    Better graded products of the same category from the local search catalog
+    (products analyzed by /analyze or scored by /alternatives), most similar
+    first by BM25 over name and materials. No LLM call, so it also works offline.
+
+    Query args: url (a product in the catalog) or category + grade, optional
+    q (search text over name, materials and category; defaults to the
+    product's name),
+    max_price and limit (default 10, max 50).
+    """
+    started = time.perf_counter()
+    try:
+        max_price = float(request.args["max_price"]) if request.args.get("max_price") else None
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "max_price must be a number and limit an integer"}), 400
+
+    product = None
+    url = (request.args.get("url") or "").strip()
+    if url:
+        with phase("db", log):
+            product = get_catalog_product(canonical_url(url))
+    category = request.args.get("category") or (product["category"] if product else None)
+    grade = (request.args.get("grade") or (product["grade"] if product else "") or "").upper() or None
+    if not category:
+        return jsonify({"error": "product not analyzed yet; pass category (and grade)"}), 404
+    if grade is not None and grade not in VALID_GRADES:
+        return jsonify({"error": "grade must be one of A, B, C, D, F"}), 400
+
+    # Similar products by default: the viewed product's name, not its materials
+    text = request.args.get("q") or (product["name"] or "" if product else "")
+    # Model numbers and single letters only narrow an AND query down to nothing
+    terms = [t for t in dict.fromkeys(re.findall(r"[a-z0-9]+", normalize_title(text)))
+             if len(t) > 1 and not t.isdigit()]
+    terms = terms[:SUGGEST_MAX_TERMS]
+
+    with phase("db", log):
+        rows = search_products(
+            terms, category, better_than=grade, max_price=max_price,
+            exclude_id=product["product_id"] if product else None, limit=limit,
+        )
+    return jsonify({
+        "product": catalog_item(product) if product else None,
+        "category": category,
+        "alternatives": [dict(catalog_item(r), matched=r["rank"] is not None) for r in rows],
+        "tookMs": round((time.perf_counter() - started) * 1000, 2),
+    })
+
 # Compare products by cost + sustainability
 @app.post("/compare_products")
 def compare_products():
@@ -710,6 +1442,7 @@ def compare_products():
       - valueScore: valueIndex mapped to 0..100 (for UI)
     """
     payload = request.get_json(silent=True) or {}
+    set_llm_context(INTERACTIVE, payload.get("user_id"))
     products = payload.get("products", [])
 
     if not isinstance(products, list) or not products:
@@ -777,7 +1510,7 @@ def compare_products():
 
         #Sustainability score
         try:
-            ai = ai_score(name)
+            ai = ai_score_variant_aware(name, full=False)
             numeric = ai.get("numericScore")
         except Exception:
             numeric = compute_heuristic_score(name)
@@ -854,41 +1587,127 @@ def track_price():
     except:
         return jsonify({"error": "Invalid price"}), 400
         
-    import datetime
-    from database import get_db_connection
-    
-    conn = get_db_connection()
-    timestamp = datetime.datetime.now().isoformat()
+    product_key = canonical_url(url) or url
+    now = int(time.time())
     
     # Check if we recently added this price (debounce) to avoid duplicates from page reloads
-    # Look for same url and price within last hour
-    cursor = conn.cursor()
-    last_entry = cursor.execute('''
-        SELECT timestamp, price FROM price_history 
-        WHERE product_url = ? 
-        ORDER BY id DESC LIMIT 1
-    ''', (url,)).fetchone()
+    # Look for same url and price within last hour. The last price seen by
+    # any worker is in the shared cache; the database is only asked on a miss.
+    cache_key = "lastprice:" + product_key
+    last_entry = shared_cache.get(cache_key)
+    product_id = None
+    if last_entry is None:
+        with phase("db", log):
+            product_id = store.get_or_create_product(product_key, name)
+            last = store.get_last_price(product_id)
+        last_entry = {"ts": last[0], "price": last[1]} if last else None
     
     should_insert = True
+    alerts = 0
     if last_entry:
-        last_time = datetime.datetime.fromisoformat(last_entry['timestamp'])
-        last_price = last_entry['price']
-        now = datetime.datetime.now()
-        
         # If same price and less than 1 hour, skip
-        if last_price == price and (now - last_time).total_seconds() < 3600:
+        same_price = to_minor_units(last_entry['price']) == to_minor_units(price)
+        if same_price and now - last_entry['ts'] < 3600:
             should_insert = False
             
     if should_insert:
-        cursor.execute('''
-            INSERT INTO price_history (product_url, product_name, price, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (url, name, price, timestamp))
-        conn.commit()
-    
-    conn.close()
+        with phase("db", log):
+            if product_id is None:
+                product_id = store.get_or_create_product(product_key, name)
+            # Also fires price-drop alerts: only the watches on this URL the new price crossed
+            alerts = store.insert_price(product_id, product_key, price, now)
+        shared_cache.set(cache_key, {"price": price, "ts": now}, ttl=SHARED_CACHE_PRICE_TTL_S)
     
-    return jsonify({"success": True, "inserted": should_insert})
+    return jsonify({"success": True, "inserted": should_insert, "alerts": alerts})
+
+
+def watch_to_dict(row):
+    return {
+        "url": row['product_url'],
+        "name": row['product_name'],
+        "targetPrice": row['target_price'],
+        "createdAt": row['created_at'],
+        "triggeredAt": row['triggered_at'],
+    }
+
+
+@app.post("/watchlist")
+def add_watch_route():
+    """
+    Watch a product for a price drop.
+    Expects: { "user_id": str, "url": str, "target_price": float, "name"?: str }
+    Adding the same URL again updates the target price.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    url = data.get("url")
+    target_price = data.get("target_price")
+
+    if not user_id or not url or target_price is None:
+        return jsonify({"error": "Missing user_id, url or target_price"}), 400
+    try:
+        target_price = float(target_price)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid target_price"}), 400
+    if target_price <= 0:
+        return jsonify({"error": "Invalid target_price"}), 400
+
+    watch = store.add_watch(user_id, canonical_url(url) or url, target_price, data.get("name") or None)
+    return jsonify({"watch": watch_to_dict(watch)})
+
+
+@app.post("/watchlist/remove")
+def remove_watch_route():
+    """Expects: { "user_id": str, "url": str }"""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    url = data.get("url")
+    if not user_id or not url:
+        return jsonify({"error": "Missing user_id or url"}), 400
+    return jsonify({"removed": store.remove_watch(user_id, canonical_url(url) or url)})
+
+
+@app.get("/watchlist")
+def list_watches_route():
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+    return jsonify({"watches": [watch_to_dict(w) for w in store.list_watches(user_id)]})
+
+
+@app.get("/notifications")
+def notifications_route():
+    """
+    Pending price-drop alerts of a user, oldest first. Fetching doesn't change
+    them: an alert is returned until POST /notifications/ack confirms it.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+    rows = store.list_pending_notifications(user_id)
+    return jsonify({"notifications": [{
+        "id": r['id'],
+        "url": r['product_url'],
+        "name": r['product_name'],
+        "targetPrice": r['target_price'],
+        "price": r['price'],
+        "createdAt": r['created_at'],
+    } for r in rows]})
+
+
+@app.post("/notifications/ack")
+def ack_notifications_route():
+    """Expects: { "user_id": str, "ids": [int] } - the alerts the extension has shown."""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    ids = data.get("ids")
+    if not user_id or not isinstance(ids, list):
+        return jsonify({"error": "Missing user_id or ids"}), 400
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid ids"}), 400
+    return jsonify({"acked": store.ack_notifications(user_id, ids)})
 
 
 @app.post("/price_trend")
@@ -903,31 +1722,37 @@ def price_trend():
     if not url:
         return jsonify({"error": "Missing url"}), 400
         
-    from database import get_db_connection
     import datetime
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    rows = cursor.execute('''
-        SELECT price, timestamp FROM price_history
-        WHERE product_url = ?
-        ORDER BY timestamp ASC
-    ''', (url,)).fetchall()
-    
-    conn.close()
+    product_id = store.get_product_id(canonical_url(url) or url)
+    rows = store.get_price_history(product_id) if product_id is not None else []
     
     if not rows:
         return jsonify({"history": [], "trend": "no_data", "prediction": None})
         
-    parse_data = []
-    history = []
-    
-    for r in rows:
-        dt = datetime.datetime.fromisoformat(r['timestamp'])
-        parse_data.append({'price': r['price'], 'timestamp': dt})
-        history.append({'price': r['price'], 'date': dt.strftime('%Y-%m-%d')})
+    history = [
+        {'price': price, 'date': datetime.date.fromtimestamp(ts).isoformat()}
+        for ts, price in rows
+    ]
+
+    # Robust forecast precomputed by the batch job (price_forecast.py);
+    # products it hasn't seen yet, or that got a price since it ran, get the
+    # per-request regression.
+    forecast = store.get_price_forecast(product_id)
+    if forecast and forecast['last_ts'] >= rows[-1][0]:
+        return jsonify({
+            "history": history,
+            "trend": forecast['trend'],
+            "prediction": forecast['forecast'],
+            "slope": forecast['slope'],
+            "confidence": forecast['confidence'],
+            "forecastAt": forecast['computed_at'],
+        })
         
+    parse_data = [
+        {'price': price, 'timestamp': datetime.datetime.fromtimestamp(ts)}
+        for ts, price in rows
+    ]
     analysis = calculate_trend(parse_data)
     
     return jsonify({
@@ -936,8 +1761,59 @@ def price_trend():
         "prediction": analysis['prediction_next_week'],
         "slope": analysis['slope']
     })
+
+
+# Bulk export is off unless a token is configured: it returns every user's orders
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+
+
+@app.get("/export/<table>")
+def export_route(table):
+    """
+    Streams all of `prices` or `orders` as NDJSON (default) or CSV.
+    Query params: format=ndjson|csv, since, until (epoch seconds or ISO date),
+    url_prefix (prices only), after (resume after this row's `cursor`).
+    Requires "Authorization: Bearer <EXPORT_TOKEN>".
+    """
+    if not EXPORT_TOKEN or request.headers.get("Authorization") != f"Bearer {EXPORT_TOKEN}":
+        return jsonify({"error": "Not found"}), 404
+    if table not in EXPORT_TABLES:
+        return jsonify({"error": "table must be one of: " + ", ".join(sorted(EXPORT_TABLES))}), 400
+
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    try:
+        filters = {
+            "since": parse_time(request.args.get("since")),
+            "until": parse_time(request.args.get("until")),
+            "url_prefix": request.args.get("url_prefix") or None,
+            "after": request.args.get("after") or None,
+        }
+        chunks = iter_export(table, fmt, **filters)
+        first = next(chunks, "")  # surfaces a bad cursor as 400 instead of a broken stream
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+
+    def generate():
+        yield first
+        yield from chunks
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
 # -----------------------------
 
+def order_update_response(order, user):
+    return {
+        "message": "Order updated",
+        "order_status": order['order_status'],
+        "streak_awarded": order['streak_awarded'] == 1,
+        "current_streak": user['current_streak'],
+        "total_credits": user['total_carbon_credits'],
+        "carbon_rewards": user['carbon_rewards']
+    }
+
+
 @app.route("/update_order", methods=["POST"])
 def update_order_route():
     data = request.get_json(silent=True) or {}
@@ -948,16 +1824,39 @@ def update_order_route():
     if not all([user_id, order_id, status]):
         return jsonify({"error": "Missing required fields"}), 400
 
+    # The extension re-sends the same status on every page reload. An event
+    # that doesn't change the order's stored status is answered from the
+    # stored order, with no scoring and no writes.
+    with phase("db", log):
+        existing_order = store.get_order(order_id)
+        # An order_id belongs to the user who created it: another user_id must not
+        # read (or change) that user's order, streak and credits
+        if existing_order is not None and str(existing_order['user_id']) != str(user_id):
+            return jsonify({"error": "Order belongs to another user"}), 403
+        if existing_order is not None and str(existing_order['order_status']).lower() == str(status).lower():
+            user = store.get_user(existing_order['user_id'])
+            return jsonify(dict(order_update_response(existing_order, user), duplicate=True))
+
+    # Auto-scoring here is background work: it yields to popup requests
+    set_llm_context(BACKGROUND, user_id)
+
     product_name = data.get("product_name")
     sustainability_score = data.get("sustainability_score")
     carbon_credits = data.get("carbon_credits")
 
+    # A known order keeps the score it was created with: don't ask the model again
+    if sustainability_score is None:
+        if existing_order is not None and existing_order['sustainability_score'] is not None:
+            sustainability_score = existing_order['sustainability_score']
+            if carbon_credits is None:
+                carbon_credits = existing_order['carbon_credits']
+
     # Auto-calculate score if missing and product_name is present
     if product_name and sustainability_score is None:
         try:
             # Try AI score first
             # Note: ai_score returns a dict
-            score_data = ai_score(product_name)
+            score_data = ai_score_variant_aware(product_name, full=False)
             sustainability_score = score_data.get("numericScore", 0)
         except:
             # Fallback
@@ -975,30 +1874,22 @@ def update_order_route():
                 carbon_credits = 0.0
 
     try:
-        updated_order = update_order_status(
-            user_id, 
-            order_id, 
-            status, 
-            product_name, 
-            sustainability_score, 
-            carbon_credits
-        )
-        
-        # Get updated user
-        import database
-        # Need to re-import or use existing import? 'get_user' is imported.
-        user = get_user(user_id)
+        with phase("db", log):
+            updated_order = store.update_order_status(
+                user_id, 
+                order_id, 
+                status, 
+                product_name, 
+                sustainability_score, 
+                carbon_credits
+            )
+            
+            # Get updated user
+            user = store.get_user(user_id)
         
-        return jsonify({
-            "message": "Order updated", 
-            "order_status": updated_order['order_status'],
-            "streak_awarded": updated_order['streak_awarded'] == 1,
-            "current_streak": user['current_streak'],
-            "total_credits": user['total_carbon_credits'],
-            "carbon_rewards": user['carbon_rewards']
-        })
+        return jsonify(order_update_response(updated_order, user))
     except Exception as e:
-        print("Error in update_order:", e)
+        log.exception("Error in update_order: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/user_streak", methods=["GET"])
@@ -1007,10 +1898,10 @@ def get_user_streak_route():
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
         
-    user = get_user(user_id)
+    user = store.get_user(user_id)
     if not user:
-        create_user(user_id)
-        user = get_user(user_id)
+        store.create_user(user_id)
+        user = store.get_user(user_id)
     
     return jsonify({
         "current_streak": user['current_streak'],
@@ -1020,6 +1911,46 @@ def get_user_streak_route():
         "carbon_rewards": user['carbon_rewards']
     })
 
+@app.route("/user_impact", methods=["GET"])
+def user_impact_route():
+    """Dashboard figures per month from user_monthly_stats (no scan of orders)."""
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+    try:
+        months = min(max(int(request.args.get("months", 12)), 1), 120)
+    except ValueError:
+        return jsonify({"error": "months must be an integer"}), 400
+
+    rows = store.get_user_monthly_stats(user_id, months)
+    totals = {"sustainable": 0, "nonSustainable": 0, "credits": 0.0,
+              "carbonSavedKg": 0.0, "waterSavedLiters": 0.0}
+    score_sum, score_count = 0.0, 0
+    out = []
+    for row in rows:
+        out.append({
+            "month": row['month'],
+            "sustainable": row['sustainable_count'],
+            "nonSustainable": row['non_sustainable_count'],
+            "credits": round(row['credits'], 2),
+            "avgScore": round(row['score_sum'] / row['score_count'], 2) if row['score_count'] else None,
+            "carbonSavedKg": round(row['carbon_saved_kg'], 2),
+            "waterSavedLiters": round(row['water_saved_liters'], 1),
+        })
+        totals["sustainable"] += row['sustainable_count']
+        totals["nonSustainable"] += row['non_sustainable_count']
+        totals["credits"] += row['credits']
+        totals["carbonSavedKg"] += row['carbon_saved_kg']
+        totals["waterSavedLiters"] += row['water_saved_liters']
+        score_sum += row['score_sum']
+        score_count += row['score_count']
+
+    totals["credits"] = round(totals["credits"], 2)
+    totals["carbonSavedKg"] = round(totals["carbonSavedKg"], 2)
+    totals["waterSavedLiters"] = round(totals["waterSavedLiters"], 1)
+    totals["avgScore"] = round(score_sum / score_count, 2) if score_count else None
+    return jsonify({"user_id": user_id, "months": out, "totals": totals})
+
 if __name__ == "__main__":
 
     port = int(os.environ.get("PORT", 5000))
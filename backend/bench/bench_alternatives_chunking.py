@@ -0,0 +1,95 @@
+"""
+/alternatives latency: one prompt for the whole list vs. token-budgeted
+chunks scored in parallel.
+
+The Groq client is replaced by a stub that streams the JSON array back
+with a fixed time-to-first-token and a fixed delay per scored item, which
+is roughly how output length drives real completion latency.
+
+Run from backend/:  python bench/bench_alternatives_chunking.py [n_items]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace as NS
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ["NEAR_DUP_SNAPSHOT"] = os.path.join(tempfile.mkdtemp(), "near_dup_index.npz")
+
+import database  # noqa: E402
+
+database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import app as backend  # noqa: E402
+
+FIRST_TOKEN_S = 0.3
+PER_ITEM_S = 0.12
+
+
+class StubStream:
+    def __init__(self, prompt):
+        names = [line.split(". ", 1)[1] for line in prompt.splitlines()
+                 if ". " in line and line.split(". ", 1)[0].isdigit()]
+        self.items = [{"id": i + 1, "numericScore": 5, "grade": "B"} for i in range(len(names))]
+
+    def __iter__(self):
+        time.sleep(FIRST_TOKEN_S)
+        yield NS(choices=[NS(delta=NS(content="["))])
+        for i, item in enumerate(self.items):
+            time.sleep(PER_ITEM_S)
+            sep = "," if i else ""
+            yield NS(choices=[NS(delta=NS(content=sep + json.dumps(item)))])
+        yield NS(choices=[NS(delta=NS(content="]"))])
+
+    def close(self):
+        pass
+
+
+def stub_create(**kwargs):
+    return StubStream(kwargs["messages"][0]["content"])
+
+
+def fresh_index():
+    backend.variant_index = backend.NearDuplicateIndex()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    backend.client = NS(chat=NS(completions=NS(create=stub_create)))
+    names = [f"Brand{i} Organic Cotton Kurta Style{i}" for i in range(n)]
+
+    fresh_index()
+    t0 = time.perf_counter()
+    single = {item["name"]: item for item in backend.iter_ai_score_alternatives(names)}
+    t_single = time.perf_counter() - t0
+
+    fresh_index()
+    chunks = backend.chunk_names(names)
+    t0 = time.perf_counter()
+    chunked = backend.score_names_chunked(names)
+    t_chunked = time.perf_counter() - t0
+
+    fresh_index()
+    t0 = time.perf_counter()
+    one_chunk = backend.score_names_chunked(chunks[0])
+    t_one = time.perf_counter() - t0
+
+    fresh_index()
+    t0 = time.perf_counter()
+    partial = backend.score_names_chunked(names, deadline_s=FIRST_TOKEN_S + 3 * PER_ITEM_S)
+    t_deadline = time.perf_counter() - t0
+
+    print(f"items: {n}, chunks: {len(chunks)} (sizes {[len(c) for c in chunks]}), "
+          f"workers: {backend.ALTERNATIVES_WORKERS}")
+    print(f"single prompt:        {t_single:6.2f} s  ({len(single)}/{n} AI-scored)")
+    print(f"one chunk alone:      {t_one:6.2f} s  ({len(one_chunk)}/{len(chunks[0])} AI-scored)")
+    print(f"chunked + parallel:   {t_chunked:6.2f} s  ({len(chunked)}/{n} AI-scored)")
+    print(f"tight deadline:       {t_deadline:6.2f} s  ({len(partial)}/{n} AI-scored, rest heuristic)")
+
+
+if __name__ == "__main__":
+    main()
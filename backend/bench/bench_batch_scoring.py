@@ -0,0 +1,72 @@
+"""
+Scalar vs. vectorized heuristic scoring.
+
+Generates synthetic marketplace titles, checks that score_batch() /
+fallback_analysis_batch() match the scalar functions exactly, and
+reports titles/second for both paths on one core.
+
+Run from backend/:  python bench/bench_batch_scoring.py [n_titles]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring import (  # noqa: E402
+    compute_heuristic_score,
+    fallback_analysis,
+    fallback_analysis_batch,
+    map_score_to_grade,
+    score_batch,
+)
+
+BRANDS = ["Roadster", "HRX", "Puma", "Allen Solly", "Biba", "Prestige", "Milton", "boAt", "Mamaearth"]
+ADJECTIVES = ["Men's", "Women's", "Slim Fit", "Regular", "Printed", "Solid", "Premium", "Kids", "Eco-Friendly"]
+MATERIAL_WORDS = [
+    "Cotton", "Organic Cotton", "Polyester", "Bamboo", "Nylon", "Linen", "Recycled Polyester",
+    "Stainless Steel", "Plastic", "Glass", "Wool Blend", "Jute", "Leather", "Microfiber", "",
+]
+PRODUCTS = ["T-Shirt", "Kurta", "Water Bottle", "Toothbrush", "Backpack", "Saree", "Jacket", "Lunch Box", "Towel"]
+VARIANTS = ["Size M", "Blue", "Pack of 3", "XL", "1 L", "(Black)", "Set of 2", ""]
+
+
+def make_titles(n, seed=42):
+    rnd = random.Random(seed)
+    return [
+        " ".join(w for w in (
+            rnd.choice(BRANDS), rnd.choice(ADJECTIVES), rnd.choice(MATERIAL_WORDS),
+            rnd.choice(PRODUCTS), rnd.choice(VARIANTS),
+        ) if w)
+        for _ in range(n)
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    titles = make_titles(n)
+
+    t0 = time.perf_counter()
+    scalar = [compute_heuristic_score(t) for t in titles]
+    scalar_grades = [map_score_to_grade(s) for s in scalar]
+    t_scalar = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = score_batch(titles)
+    t_batch = time.perf_counter() - t0
+
+    assert batch["numericScore"].tolist() == scalar
+    assert batch["grade"].tolist() == scalar_grades
+
+    sample = titles[:5000]
+    assert fallback_analysis_batch(sample) == [fallback_analysis(t) for t in sample]
+
+    print(f"titles: {n}")
+    print(f"scalar compute_heuristic_score: {t_scalar:.3f} s  ({n / t_scalar:,.0f} titles/s)")
+    print(f"score_batch (vectorized):       {t_batch:.3f} s  ({n / t_batch:,.0f} titles/s)")
+    print("outputs identical: yes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Cache warmer: share of popup requests answered from warmed entries, and
+popup latency with and without a warming pass.
+
+Products get Zipf-distributed visits (stored prices); the warmer pre-scores
+the hot ones within its call budget, then simulated popup views drawn from
+the same distribution hit /analyze. The Groq client is a stub with a fixed
+latency per call.
+
+Run from backend/:  python bench/bench_cache_warmer.py [n_products] [n_views] [budget]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace as NS
+
+import numpy as np
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ["WARMER_ENABLED"] = "0"
+tmp = tempfile.mkdtemp()
+os.environ["NEAR_DUP_SNAPSHOT"] = os.path.join(tmp, "near_dup_index.npz")
+os.environ["SHARED_CACHE_PATH"] = os.path.join(tmp, "shared_cache.db")
+
+import database  # noqa: E402
+
+database.DB_FILE = os.path.join(tmp, "bench.db")
+
+import app as backend  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+CALL_S = 0.05
+FULL = {"materials": ["steel"], "numericScore": 6, "grade": "B", "carbonFootprintKg": 2.0,
+        "waterUsageLiters": 300, "explanation": "Durable steel."}
+
+
+class StubStream:
+    def __init__(self, prompt):
+        n = sum(1 for line in prompt.splitlines()
+                if ". " in line and line.split(". ", 1)[0].isdigit())
+        if n:
+            self.text = json.dumps([{"id": i + 1, "numericScore": 5, "grade": "B"} for i in range(n)])
+        else:
+            self.text = json.dumps(FULL)
+
+    def __iter__(self):
+        time.sleep(CALL_S)
+        yield NS(choices=[NS(delta=NS(content=self.text))])
+
+    def close(self):
+        pass
+
+
+calls = {"n": 0}
+
+
+def stub_create(**kwargs):
+    calls["n"] += 1
+    return StubStream(kwargs["messages"][0]["content"])
+
+
+def run(n_products, n_views, budget, warm):
+    rng = np.random.default_rng(11)
+    names = [f"Brand{i} Steel Bottle Model{i} Insulated" for i in range(n_products)]
+    weights = 1 / np.arange(1, n_products + 1) ** 1.1
+    weights /= weights.sum()
+
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+    database.init_db()
+    backend.store = SQLiteStore(database.DB_FILE)
+    backend.shared_cache = backend.SharedCache(os.path.join(tempfile.mkdtemp(), "cache.db"))
+    backend.variant_index = backend.NearDuplicateIndex()
+    backend.warm_stats.__init__()
+    conn = database.get_db_connection()
+    conn.executemany("INSERT INTO products (product_id, canonical_url, name) VALUES (?, ?, ?)",
+                     ((i + 1, f"https://shop.example/p/{i}", n) for i, n in enumerate(names)))
+    now = int(time.time())
+    visits = rng.choice(n_products, size=20 * n_products, p=weights)
+    conn.executemany("INSERT OR REPLACE INTO prices (product_id, ts, price_minor) VALUES (?, ?, ?)",
+                     ((int(p) + 1, now - k, 10_000) for k, p in enumerate(visits)))
+    conn.commit()
+    conn.close()
+
+    warmer = backend.CacheWarmer(
+        hot_products=backend.warmer_hot_products,
+        is_cached=lambda t, full: backend.lookup_score(t, full=full, record=False) is not None,
+        score_full=backend.warmer_score_full,
+        score_batch=backend.warmer_score_batch,
+        is_idle=backend.llm_idle,
+        calls_per_hour=budget,
+        full_top=budget // 2,
+    )
+    calls["n"] = 0
+    if warm:
+        warmer.run_once()
+    warm_calls = calls["n"]
+
+    http = backend.app.test_client()
+    calls["n"] = 0
+    latencies = []
+    for p in rng.choice(n_products, size=n_views, p=weights):
+        t0 = time.perf_counter()
+        http.post("/analyze", json={"title": names[p], "description": "", "url": ""})
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return {
+        "warm_calls": warm_calls,
+        "view_calls": calls["n"],
+        "stats": backend.warm_stats.snapshot(),
+        "p50": latencies[len(latencies) // 2],
+        "mean": sum(latencies) / len(latencies),
+    }
+
+
+def main():
+    n_products = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_views = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    budget = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+    backend.client = NS(chat=NS(completions=NS(create=stub_create)))
+    backend.llm_scheduler.user_rate = 0  # one simulated client; measure the cache, not the rate limiter
+
+    print(f"{n_products} products, {n_views} popup views, warmer budget {budget} calls, "
+          f"stub call {CALL_S * 1000:.0f} ms")
+    for warm in (False, True):
+        r = run(n_products, n_views, budget, warm)
+        s = r["stats"]
+        print(f"{'warmed' if warm else 'cold  '}: warmer calls {r['warm_calls']:3d}, "
+              f"view calls {r['view_calls']:3d}, hit ratio {s['hitRatio']:.1%}, "
+              f"warm-hit ratio {s['warmHitRatio']:.1%}, "
+              f"view latency mean {r['mean'] * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
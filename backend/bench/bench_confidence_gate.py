@@ -0,0 +1,127 @@
+"""
+Tunes LLM_CONFIDENCE_GATE on the labelled golden corpus.
+
+For each threshold, the items whose heuristic_confidence() reaches it are
+the ones /analyze and /alternatives would answer without the LLM. Printed
+per threshold: the share of items skipped, exact and within-one grade
+agreement of the heuristic on those items, and, when a recording of real
+completions exists (bench_golden_corpus.py --record), the exact agreement
+of the whole gated pipeline (heuristic on skipped items, the recorded LLM
+grade on the rest) next to the LLM alone.
+
+The table over all items is in-sample. To see how a tuned threshold holds
+up on items it was not picked on, the corpus is then split in halves
+--splits times (random, seeded): the threshold is picked on one half and
+its agreement is reported on the other. A threshold is picked as the lowest
+one whose exact agreement on skipped items is at least --target over at
+least --min-skipped items. Only the held-out numbers support turning the
+gate on.
+
+Run from backend/:
+  python bench/bench_confidence_gate.py [--corpus PATH] [--target 0.9] [--min-skipped 5] [--splits 20]
+"""
+import argparse
+import os
+import random
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, "bench"))
+
+from bench_golden_corpus import (  # noqa: E402
+    GRADES, agreement, corpus_path, item_text, load_jsonl, recording_path, run_llm_replay,
+)
+from scoring import compute_heuristic_score, heuristic_confidence, map_score_to_grade  # noqa: E402
+
+THRESHOLDS = [0.3, 0.4, 0.5, 0.55, 0.6, 0.65, 0.7, 0.8, 0.9]
+
+
+def skipped(indices, scored, threshold):
+    return [i for i in indices if scored[i][0] >= threshold]
+
+
+def pick_threshold(indices, scored, expected, target, min_skipped):
+    """Lowest threshold reaching `target` exact agreement on `min_skipped`+ skipped items, or None."""
+    for threshold in THRESHOLDS:
+        skip = skipped(indices, scored, threshold)
+        if len(skip) >= min_skipped:
+            exact, _ = agreement([expected[i] for i in skip], [scored[i][1] for i in skip], GRADES)
+            if exact >= target:
+                return threshold
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=corpus_path())
+    parser.add_argument("--target", type=float, default=0.9, help="exact agreement wanted on skipped items")
+    parser.add_argument("--min-skipped", type=int, default=5)
+    parser.add_argument("--splits", type=int, default=20, help="random tune/held-out splits")
+    args = parser.parse_args()
+
+    items = load_jsonl(args.corpus)
+    expected = [item["grade"] for item in items]
+    scored = []
+    for item in items:
+        text = item_text(item)
+        score = compute_heuristic_score(text)
+        scored.append((heuristic_confidence(text, score), map_score_to_grade(score)))
+    everything = range(len(items))
+
+    print(f"{len(items)} items in {os.path.basename(args.corpus)} (in-sample)")
+    llm = None
+    recording = recording_path(args.corpus)
+    if os.path.exists(recording):
+        llm, _, _ = run_llm_replay(items, load_jsonl(recording))
+        print(f"LLM alone: exact agreement {agreement(expected, llm, GRADES)[0]:.1%}")
+    print(f"{'threshold':>9} {'skipped':>9} {'exact':>7} {'within 1':>9}" + (f" {'pipeline':>9}" if llm else ""))
+    for threshold in THRESHOLDS:
+        skip = skipped(everything, scored, threshold)
+        line = f"{threshold:>9.2f} {len(skip) / len(items):>9.1%}"
+        if skip:
+            exact, within_one = agreement([expected[i] for i in skip], [scored[i][1] for i in skip], GRADES)
+            line += f" {exact:>7.1%} {within_one:>9.1%}"
+        else:
+            line += f" {'-':>7} {'-':>9}"
+        if llm:
+            skip = set(skip)
+            gated = [scored[i][1] if i in skip else llm[i] for i in range(len(items))]
+            line += f" {agreement(expected, gated, GRADES)[0]:>9.1%}"
+        print(line)
+
+    # Held-out: pick on one half, measure on the other
+    rng = random.Random(7)
+    half = len(items) // 2
+    agreed = total = picked = 0
+    print(f"\nheld-out: {args.splits} splits, {half} tuning / {len(items) - half} held-out items")
+    print(f"{'split':>5} {'picked':>7} {'skipped':>9} {'exact':>7}")
+    for split in range(args.splits):
+        order = list(everything)
+        rng.shuffle(order)
+        tune, held = order[:half], order[half:]
+        threshold = pick_threshold(tune, scored, expected, args.target, args.min_skipped)
+        if threshold is None:
+            print(f"{split:>5} {'-':>7}")
+            continue
+        picked += 1
+        skip = skipped(held, scored, threshold)
+        hits = sum(expected[i] == scored[i][1] for i in skip)
+        agreed += hits
+        total += len(skip)
+        exact = f"{hits / len(skip):.1%}" if skip else "-"
+        print(f"{split:>5} {threshold:>7.2f} {len(skip) / len(held):>9.1%} {exact:>7}")
+
+    if not total:
+        print(f"no split picked a threshold that skips held-out items ({picked}/{args.splits} picked one)")
+    else:
+        print(f"held-out exact agreement on skipped items: {agreed / total:.1%} over {total} items "
+              f"({picked}/{args.splits} splits picked a threshold)")
+        if agreed / total >= args.target:
+            print(f"in-sample pick: LLM_CONFIDENCE_GATE={pick_threshold(everything, scored, expected, args.target, args.min_skipped)}")
+        else:
+            print(f"below the {args.target:.0%} target on held-out items: leave LLM_CONFIDENCE_GATE unset")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Streaming export: throughput, peak memory, and write latency of
+/track_price-style inserts while an export is running.
+
+Run from backend/:  python bench/bench_export.py [n_rows]
+"""
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import database  # noqa: E402
+
+database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import export  # noqa: E402
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    per_product = 200
+    database.init_db()
+    conn = database.get_db_connection()
+    n_products = n_rows // per_product
+    conn.executemany(
+        "INSERT INTO products (product_id, canonical_url, name) VALUES (?, ?, ?)",
+        ((p, f"https://www.amazon.in/dp/B0{p:08d}", f"Product {p}") for p in range(1, n_products + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO prices (product_id, ts, price_minor) VALUES (?, ?, ?)",
+        ((p, 1_735_000_000 + i * 3600, 50_000 + i) for p in range(1, n_products + 1) for i in range(per_product)),
+    )
+    conn.commit()
+    conn.close()
+    print(f"{n_rows} price rows; peak RSS after loading: {rss_mb():.0f} MB")
+
+    # Concurrent writer: one insert + commit every 10 ms, like /track_price
+    latencies = []
+    stop = threading.Event()
+
+    def writer():
+        c = database.get_db_connection()
+        ts = 1_900_000_000
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            database.insert_price(c, 1, 123.0, ts)
+            c.commit()
+            latencies.append(time.perf_counter() - t0)
+            ts += 1
+            time.sleep(0.01)
+        c.close()
+
+    out = os.path.join(tempfile.mkdtemp(), "prices.ndjson.gz")
+    import gzip
+    t = threading.Thread(target=writer)
+    t.start()
+    t0 = time.perf_counter()
+    rows = 0
+    with gzip.open(out, "wt", encoding="utf-8") as f:
+        for chunk in export.iter_export("prices", "ndjson"):
+            rows += chunk.count("\n")
+            f.write(chunk)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    t.join()
+
+    latencies.sort()
+    print(f"exported {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s), "
+          f"{os.path.getsize(out) / 1e6:.1f} MB gzipped")
+    print(f"peak RSS after export: {rss_mb():.0f} MB")
+    print(f"concurrent inserts: {len(latencies)}, p50 {latencies[len(latencies) // 2] * 1e3:.1f} ms, "
+          f"max {latencies[-1] * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
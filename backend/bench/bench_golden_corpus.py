@@ -0,0 +1,248 @@
+"""
+Accuracy vs. speed of every scoring path on the labelled golden corpus.
+
+The corpus (bench/corpus/golden_v<N>.jsonl) holds product titles and
+descriptions with a hand-assigned grade (A..F), /classify category and gender.
+A released version is never edited: relabelling or adding items makes a new
+version, so results stay comparable over time.
+
+Paths:
+  heuristic   compute_heuristic_score() + map_score_to_grade()
+  fallback    fallback_analysis() (what /analyze returns without the model)
+  batch       score_batch(), the vectorized heuristic used for catalogs
+  llm         ai_score() replayed from a recording of real completions
+              (parsed with the same streaming parser); skipped if there is none
+  classify    classify_fallback(), /classify's keyword fallback (category, gender)
+
+For each path it prints grade agreement (exact and within one grade), a
+confusion matrix (rows: expected, columns: predicted), and per-item latency
+and throughput. --min-agreement makes it exit non-zero when a grading path
+falls below the given exact agreement, so a faster path can be gated on
+accuracy.
+
+Run from backend/:
+  python bench/bench_golden_corpus.py [--corpus PATH] [--min-agreement 0.5] [--json]
+  python bench/bench_golden_corpus.py --record    # calls Groq once per item (GROQ_API_KEY)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from json_stream import parse_stream  # noqa: E402
+from scoring import (  # noqa: E402
+    classify_fallback, compute_heuristic_score, fallback_analysis, map_score_to_grade, score_batch,
+)
+
+CORPUS_VERSION = 1
+CORPUS_DIR = os.path.join(BACKEND, "bench", "corpus")
+GRADES = ["A", "B", "C", "D", "F"]
+REPEAT = 200  # timing passes over the corpus for the cheap paths
+
+
+def corpus_path(version=CORPUS_VERSION):
+    return os.path.join(CORPUS_DIR, f"golden_v{version}.jsonl")
+
+
+def recording_path(corpus):
+    return corpus[:-len(".jsonl")] + ".llm.jsonl"
+
+
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def item_text(item):
+    return f"{item['title']}. {item['description']}"
+
+
+def timed(fn, items, repeat):
+    """(predictions, seconds per item) of fn over items, best of `repeat` passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = [fn(item) for item in items]
+        best = min(best, time.perf_counter() - t0)
+    return out, best / len(items)
+
+
+def grade_of(obj):
+    grade = str(obj.get("grade") or "").strip().upper()[:1]
+    if grade not in GRADES and obj.get("numericScore") is not None:
+        grade = map_score_to_grade(float(obj["numericScore"]))
+    return grade or "?"
+
+
+def replay_chunks(text, size=4):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def run_llm_replay(items, recording):
+    """Grades parsed from recorded completions; latency is the recorded call time."""
+    by_id = {r["id"]: r for r in recording}
+    preds, latencies = [], []
+    for item in items:
+        rec = by_id.get(item["id"])
+        if rec is None:
+            preds.append("?")
+            continue
+        t0 = time.perf_counter()
+        obj = parse_stream(replay_chunks(rec["completion"]), target="object",
+                           accept=lambda o: "numericScore" in o or "grade" in o)
+        parse_s = time.perf_counter() - t0
+        preds.append(grade_of(obj or {}))
+        latencies.append(rec["latency_s"] + parse_s)
+    per_item = sum(latencies) / len(latencies) if latencies else None
+    return preds, per_item, latencies
+
+
+def record_llm(items, path):
+    """Runs app.ai_score() for each item and stores the raw completion text and latency."""
+    import app as backend
+
+    real_stream = backend.stream_completion_text
+    captured = []
+
+    def capture(prompt, **kwargs):
+        for delta in real_stream(prompt, **kwargs):
+            captured.append(delta)
+            yield delta
+
+    backend.stream_completion_text = capture
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            captured.clear()
+            t0 = time.perf_counter()
+            try:
+                backend.ai_score(item_text(item))
+            except Exception as e:
+                print(f"{item['id']}: {e}", file=sys.stderr)
+                continue
+            f.write(json.dumps({
+                "id": item["id"], "model": backend.AI_MODEL,
+                "latency_s": round(time.perf_counter() - t0, 4), "completion": "".join(captured),
+            }) + "\n")
+    print(f"recorded {path}", file=sys.stderr)
+
+
+def agreement(expected, predicted, labels):
+    n = len(expected)
+    exact = sum(e == p for e, p in zip(expected, predicted)) / n
+    index = {g: i for i, g in enumerate(labels)}
+    within_one = sum(
+        e in index and p in index and abs(index[e] - index[p]) <= 1 for e, p in zip(expected, predicted)
+    ) / n
+    return exact, within_one
+
+
+def confusion(expected, predicted, labels):
+    cols = labels + sorted({p for p in predicted if p not in labels})
+    matrix = {e: {p: 0 for p in cols} for e in labels}
+    for e, p in zip(expected, predicted):
+        matrix[e][p] += 1
+    return cols, matrix
+
+
+def format_confusion(labels, cols, matrix, width=6):
+    head = " " * 22 + "".join(c[:width - 1].rjust(width) for c in cols)
+    rows = [head]
+    for e in labels:
+        rows.append(f"  {e[:19]:<20}" + "".join(str(matrix[e][c] or ".").rjust(width) for c in cols))
+    return "\n".join(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the golden corpus with every scoring path.")
+    parser.add_argument("--corpus", default=corpus_path())
+    parser.add_argument("--record", action="store_true", help="record real LLM completions and exit")
+    parser.add_argument("--min-agreement", type=float, help="fail if a grading path's exact agreement is lower")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    items = load_jsonl(args.corpus)
+    if args.record:
+        record_llm(items, recording_path(args.corpus))
+        return
+
+    expected = [item["grade"] for item in items]
+    texts = [item_text(item) for item in items]
+    results = {}
+
+    preds, per_item = timed(lambda it: map_score_to_grade(compute_heuristic_score(item_text(it))), items, REPEAT)
+    results["heuristic"] = (preds, per_item)
+    preds, per_item = timed(lambda it: fallback_analysis(item_text(it))["grade"], items, REPEAT)
+    results["fallback"] = (preds, per_item)
+
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        batch = score_batch(texts)
+        best = min(best, time.perf_counter() - t0)
+    results["batch"] = ([str(g) for g in batch["grade"]], best / len(items))
+
+    rec_path = recording_path(args.corpus)
+    if os.path.exists(rec_path):
+        preds, per_item, _ = run_llm_replay(items, load_jsonl(rec_path))
+        results["llm"] = (preds, per_item)
+
+    report = {"corpus": os.path.basename(args.corpus), "items": len(items), "paths": {}}
+    for name, (preds, per_item) in results.items():
+        exact, within_one = agreement(expected, preds, GRADES)
+        cols, matrix = confusion(expected, preds, GRADES)
+        report["paths"][name] = {
+            "exact": round(exact, 4), "withinOne": round(within_one, 4),
+            "usPerItem": round(per_item * 1e6, 2) if per_item else None,
+            "itemsPerS": round(1 / per_item) if per_item else None,
+            "confusion": matrix,
+        }
+
+    # /classify keyword fallback: category and gender accuracy
+    preds, per_item = timed(lambda it: classify_fallback(item_text(it).lower()), items, REPEAT)
+    categories = sorted({item["category"] for item in items})
+    cat_exp, cat_pred = [item["category"] for item in items], [p["category"] for p in preds]
+    cols, matrix = confusion(cat_exp, cat_pred, categories)
+    report["paths"]["classify"] = {
+        "category": round(sum(e == p for e, p in zip(cat_exp, cat_pred)) / len(items), 4),
+        "gender": round(sum(item["gender"] == p["gender"] for item, p in zip(items, preds)) / len(items), 4),
+        "usPerItem": round(per_item * 1e6, 2),
+        "itemsPerS": round(1 / per_item),
+        "confusion": matrix,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['corpus']}: {len(items)} items"
+              + ("" if "llm" in results else f"  (no LLM recording at {os.path.relpath(rec_path)})"))
+        print(f"{'path':<10} {'exact':>7} {'±1':>7} {'us/item':>10} {'items/s':>10}")
+        for name in results:
+            r = report["paths"][name]
+            per = f"{r['usPerItem']:.1f}" if r["usPerItem"] is not None else "-"
+            ips = f"{r['itemsPerS']}" if r["itemsPerS"] is not None else "-"
+            print(f"{name:<10} {r['exact']:>7.1%} {r['withinOne']:>7.1%} {per:>10} {ips:>10}")
+        r = report["paths"]["classify"]
+        print(f"{'classify':<10} category {r['category']:.1%}  gender {r['gender']:.1%}  "
+              f"{r['usPerItem']:.1f} us/item  {r['itemsPerS']} items/s")
+        for name in results:
+            cols, matrix = confusion(expected, results[name][0], GRADES)
+            print(f"\n{name} grades (rows expected, columns predicted)")
+            print(format_confusion(GRADES, cols, matrix))
+        cols, matrix = confusion(cat_exp, cat_pred, categories)
+        print("\nclassify categories (rows expected, columns predicted)")
+        print(format_confusion(categories, cols, matrix))
+
+    if args.min_agreement is not None:
+        failing = [n for n in results if report["paths"][n]["exact"] < args.min_agreement]
+        if failing:
+            print(f"below {args.min_agreement:.0%} exact agreement: {', '.join(failing)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
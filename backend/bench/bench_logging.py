@@ -0,0 +1,79 @@
+"""
+Caller-side cost of logging an error on every request during an outage:
+print(..., flush=True) vs. the queue-based structured logger.
+
+The output sink is slowed down (SINK_DELAY_S per write, like a busy pipe or
+log collector) to show what the request thread waits for. Also reports how
+many records the rate limit suppressed and the bounded queue dropped.
+
+Run from backend/:  python bench/bench_logging.py [records]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_log import get_logger, log_stats, request_id_var, setup_logging, shutdown_logging  # noqa: E402
+
+SINK_DELAY_S = 0.0002
+
+
+class SlowSink(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.lines = 0
+
+    def write(self, s):
+        time.sleep(SINK_DELAY_S)
+        self.lines += s.count("\n")
+        return len(s)
+
+    def flush(self):
+        time.sleep(SINK_DELAY_S)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(n):
+    error = ConnectionError("Groq: 503 Service Unavailable")
+
+    sink = SlowSink()
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        print("AI failed, using fallback:", error, flush=True, file=sink)
+        lat.append(time.perf_counter() - t0)
+    print(f"print+flush   p50 {percentile(lat, .5) * 1e6:8.1f} us   p99 {percentile(lat, .99) * 1e6:8.1f} us   "
+          f"written {sink.lines}")
+
+    sink = SlowSink()
+    setup_logging("INFO", queue_size=1000, burst=5, window_s=60.0, stream=sink)
+    log = get_logger("bench")
+    lat = []
+    for i in range(n):
+        request_id_var.set(f"req{i}")
+        t0 = time.perf_counter()
+        log.warning("AI failed, using fallback: %s", error)
+        lat.append(time.perf_counter() - t0)
+    # Distinct messages are not rate-limited: they fill the bounded queue instead
+    lat_distinct = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        log.warning(f"distinct failure {i}")
+        lat_distinct.append(time.perf_counter() - t0)
+    stats = log_stats()
+    shutdown_logging()
+    print(f"queue logger  p50 {percentile(lat, .5) * 1e6:8.1f} us   p99 {percentile(lat, .99) * 1e6:8.1f} us   "
+          f"(repeated error; suppressed {stats['suppressed']})")
+    print(f"queue logger  p50 {percentile(lat_distinct, .5) * 1e6:8.1f} us   "
+          f"p99 {percentile(lat_distinct, .99) * 1e6:8.1f} us   "
+          f"(distinct messages; dropped {stats['dropped']}, written {sink.lines})")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,110 @@
+"""
+ai_score() latency with a slow primary model: a single hard-coded model vs.
+the model router (per-model timeout, failover, health-based ordering).
+
+The Groq client is a stub. The primary model answers in PRIMARY_FAST_S, but
+a share of its calls (slow_share) take PRIMARY_SLOW_S; the secondary model
+always answers in SECONDARY_S. The stub honours the per-call timeout like
+the real client: a call slower than it raises after the timeout. Calls that
+fail on every model count as heuristic answers.
+
+Run from backend/:  python bench/bench_model_routing.py [calls] [slow_share]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace as NS
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ["WARMER_ENABLED"] = "0"
+os.environ["NEAR_DUP_SNAPSHOT"] = os.path.join(tempfile.mkdtemp(), "near_dup_index.npz")
+os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "shared_cache.db")
+
+import database  # noqa: E402
+
+database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import app as backend  # noqa: E402
+from model_router import ModelRouter, load_routes  # noqa: E402
+
+PRIMARY, SECONDARY = "primary-8b", "secondary-8b"
+PRIMARY_FAST_S = 0.05
+PRIMARY_SLOW_S = 0.6
+SECONDARY_S = 0.09
+ANSWER = json.dumps({"materials": ["cotton"], "numericScore": 6, "grade": "B",
+                     "carbonFootprintKg": 2.0, "waterUsageLiters": 300, "explanation": "ok"})
+
+
+class StubStream:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __iter__(self):
+        time.sleep(self.latency)
+        for i in range(0, len(ANSWER), 16):
+            yield NS(choices=[NS(delta=NS(content=ANSWER[i:i + 16]))])
+
+    def close(self):
+        pass
+
+
+def make_stub(slow_share, rng):
+    def create(model, timeout=None, **kwargs):
+        if model == PRIMARY:
+            latency = PRIMARY_SLOW_S if rng.random() < slow_share else PRIMARY_FAST_S
+        else:
+            latency = SECONDARY_S
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"{model}: no response within {timeout}s")
+        return StubStream(latency)
+    return create
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(label, routes, calls, slow_share):
+    backend.model_router = ModelRouter(load_routes(json.dumps(routes), default_model=PRIMARY), probe_interval_s=2.0)
+    backend.client = NS(chat=NS(completions=NS(create=make_stub(slow_share, random.Random(1)))))
+    lat, served = [], {}
+    for i in range(calls):
+        backend.llm_model_used.set(None)
+        t0 = time.perf_counter()
+        try:
+            backend.ai_score(f"Organic cotton t-shirt style {i}")
+            model = backend.llm_model_used.get()
+        except Exception:
+            model = "heuristic"
+        lat.append(time.perf_counter() - t0)
+        served[model] = served.get(model, 0) + 1
+    print(f"{label:<28} p50 {percentile(lat, .5) * 1000:6.0f} ms   p95 {percentile(lat, .95) * 1000:6.0f} ms   "
+          f"max {max(lat) * 1000:6.0f} ms   served {served}   failovers {backend.model_router.failovers}")
+    return percentile(lat, .95)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    slow_share = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    backend.llm_scheduler.user_rate = 0
+    print(f"{calls} calls, primary slow ({PRIMARY_SLOW_S * 1000:.0f} ms) on {slow_share:.0%} of calls, "
+          f"fast {PRIMARY_FAST_S * 1000:.0f} ms; secondary {SECONDARY_S * 1000:.0f} ms")
+    single = run("single model", {"ai_score": [{"model": PRIMARY, "timeout_s": 10}]}, calls, slow_share)
+    routed = run("router (timeout + failover)", {"ai_score": [
+        {"model": PRIMARY, "timeout_s": 0.15}, {"model": SECONDARY, "timeout_s": 1.0},
+    ]}, calls, slow_share)
+    run("router, primary down", {"ai_score": [
+        {"model": PRIMARY, "timeout_s": 0.15}, {"model": SECONDARY, "timeout_s": 1.0},
+    ]}, calls, 1.0)
+    print(f"p95 {single * 1000:.0f} ms -> {routed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Multi-worker throughput with and without the shared cross-worker cache.
+
+Starts N worker processes (like gunicorn workers), each importing the app
+with its own Flask test client, and splits a fixed stream of /alternatives
+and /classify requests over a catalog of products between them. The Groq
+client is a stub with a fixed latency per call. With the shared cache a
+product scored by one worker is a cache hit for all the others; without it
+(one cache file per worker) every worker pays for its own LLM calls.
+
+The speedup column is req/s relative to one worker with the same cache.
+Worker counts above the machine's CPU count are marked: there the workers
+share cores, so the numbers show the cache, not how throughput scales. Run
+it on a host with at least max_workers cores to measure scaling.
+
+Run from backend/:  python bench/bench_multiworker.py [requests] [max_workers]
+"""
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace as NS
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+CALL_S = 0.15          # stub latency of one Groq call
+CATALOG = 120          # distinct products
+NAMES_PER_REQUEST = 5
+
+
+def catalog():
+    materials = ["Organic Cotton", "Polyester", "Bamboo", "Nylon", "Linen", "Plastic"]
+    kinds = ["Kurta", "T-shirt", "Bottle", "Backpack", "Towel", "Jacket"]
+    return [f"Brand{i} {materials[i % 6]} {kinds[(i // 6) % 6]} Model{i}" for i in range(CATALOG)]
+
+
+class StubStream:
+    def __init__(self, prompt):
+        n = sum(1 for line in prompt.splitlines()
+                if ". " in line and line.split(". ", 1)[0].isdigit())
+        self.text = json.dumps([{"id": i + 1, "numericScore": 5, "grade": "B"} for i in range(n)])
+
+    def __iter__(self):
+        time.sleep(CALL_S)
+        yield NS(choices=[NS(delta=NS(content=self.text))])
+
+    def close(self):
+        pass
+
+
+def worker(args):
+    worker_id, requests, cache_path, tmp, result_queue = args
+    os.environ["GROQ_API_KEY"] = "bench"
+    os.environ["SHARED_CACHE_PATH"] = cache_path
+    os.environ["NEAR_DUP_SNAPSHOT"] = os.path.join(tmp, f"near_dup_{worker_id}.npz")
+
+    import database
+    database.DB_FILE = os.path.join(tmp, "bench.db")
+    import app as backend
+
+    calls = {"n": 0}
+
+    def stub_create(**kwargs):
+        calls["n"] += 1
+        if kwargs.get("stream"):
+            return StubStream(kwargs["messages"][0]["content"])
+        time.sleep(CALL_S)
+        return NS(choices=[NS(message=NS(content='{"category": "clothing_textiles", "gender": "unisex"}'))])
+
+    backend.client = NS(chat=NS(completions=NS(create=stub_create)))
+    backend.llm_scheduler.user_rate = 0  # measure the cache, not the rate limiter
+    http = backend.app.test_client()
+
+    t0 = time.perf_counter()
+    for kind, names in requests:
+        if kind == "alternatives":
+            http.post("/alternatives", json={"products": names})
+        else:
+            http.post("/classify", json={"title": names[0]})
+    result_queue.put((calls["n"], time.perf_counter() - t0))
+
+
+def run(n_workers, all_requests, shared):
+    tmp = tempfile.mkdtemp()
+    import database
+    database.DB_FILE = os.path.join(tmp, "bench.db")
+    database.init_db()
+
+    queue = multiprocessing.Queue()
+    procs = []
+    t0 = time.perf_counter()
+    for w in range(n_workers):
+        cache_path = os.path.join(tmp, "shared_cache.db" if shared else f"cache_{w}.db")
+        share = all_requests[w::n_workers]
+        p = multiprocessing.Process(target=worker, args=((w, share, cache_path, tmp, queue),))
+        p.start()
+        procs.append(p)
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - t0
+    return sum(r[0] for r in results), wall
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    rng = random.Random(7)
+    products = catalog()
+    all_requests = []
+    for _ in range(n_requests):
+        if rng.random() < 0.8:
+            all_requests.append(("alternatives", rng.sample(products, NAMES_PER_REQUEST)))
+        else:
+            all_requests.append(("classify", [rng.choice(products)]))
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{n_requests} requests over {CATALOG} products, stub LLM call {CALL_S * 1000:.0f} ms, "
+          f"{cpus} CPU(s) available")
+    print(f"{'workers':>7} {'cache':>9} {'LLM calls':>10} {'wall s':>8} {'req/s':>8} {'speedup':>8}")
+    baseline = {}
+    workers = 1
+    while workers <= max_workers:
+        for shared in (False, True):
+            calls, wall = run(workers, all_requests, shared)
+            rate = n_requests / wall
+            baseline.setdefault(shared, rate)
+            note = "  (more workers than CPUs)" if workers > cpus else ""
+            print(f"{workers:>7} {'shared' if shared else 'per-proc':>9} {calls:>10} "
+                  f"{wall:>8.2f} {rate:>8.1f} {rate / baseline[shared]:>7.2f}x{note}")
+        workers *= 2
+    if max_workers > cpus:
+        print(f"only {cpus} CPU(s): rerun on a host with {max_workers}+ cores to measure scaling")
+
+
+if __name__ == "__main__":
+    main()
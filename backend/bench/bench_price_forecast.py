@@ -0,0 +1,93 @@
+"""
+Batch price forecasting: job runtime on a synthetic price_history and trend
+accuracy of the robust fit vs. the per-request least squares in app.py.
+
+Each URL gets a known daily drift (up, down or flat) plus noise, and some
+series get one flash-sale price at 40% of the normal level.
+
+Run from backend/:  python bench/bench_price_forecast.py [n_rows] [rows_per_url]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import database  # noqa: E402
+
+database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import price_forecast  # noqa: E402
+
+
+def ols_trend(days, prices):
+    # Same fit and thresholds as calculate_trend() in app.py
+    n = len(days)
+    sx, sy = days.sum(), prices.sum()
+    sxy, sxx = (days * prices).sum(), (days ** 2).sum()
+    den = n * sxx - sx ** 2
+    slope = 0 if den == 0 else (n * sxy - sx * sy) / den
+    return "up" if slope > 0.5 else "down" if slope < -0.5 else "stable"
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_url = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    n_urls = n_rows // per_url
+    rng = np.random.default_rng(3)
+
+    base = rng.uniform(200, 5000, n_urls)
+    truth = rng.choice(["up", "down", "stable"], n_urls)
+    drift = np.where(truth == "up", 0.006, np.where(truth == "down", -0.006, 0.0))  # per day, relative
+    days = np.sort(rng.uniform(0, 60, (n_urls, per_url)), axis=1)
+    prices = base[:, None] * (1 + drift[:, None] * days) * rng.normal(1, 0.01, (n_urls, per_url))
+    outlier = rng.random(n_urls) < 0.3
+    prices[outlier, -1] *= 0.4  # flash sale on the latest price
+
+    stamps = (datetime.datetime(2025, 1, 1).timestamp() + days * 86400).astype(np.int64)
+
+    database.init_db()
+    conn = database.get_db_connection()
+    t0 = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO products (product_id, canonical_url) VALUES (?, ?)",
+        ((u + 1, f"https://shop.example/p/{u}") for u in range(n_urls)),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO prices (product_id, ts, price_minor) VALUES (?, ?, ?)",
+        ((u + 1, int(stamps[u, i]), int(round(prices[u, i] * 100)))
+         for u in range(n_urls) for i in range(per_url)),
+    )
+    conn.commit()
+    conn.close()
+    print(f"loaded {n_rows} rows for {n_urls} URLs in {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    rows, urls = price_forecast.run_forecast_job()
+    elapsed = time.perf_counter() - t0
+    print(f"forecast job: {rows} rows, {urls} URLs in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+
+    conn = database.get_db_connection()
+    robust = {r["product_id"] - 1: r["trend"] for r in conn.execute("SELECT product_id, trend FROM price_forecast")}
+    conn.close()
+
+    sample = range(0, n_urls, max(1, n_urls // 2000))
+    t0 = time.perf_counter()
+    ols = {u: ols_trend(days[u], prices[u]) for u in sample}
+    t_ols = (time.perf_counter() - t0) / len(ols)
+
+    for label, mask in (("all", np.ones(n_urls, bool)), ("with flash sale", outlier)):
+        idx = [u for u in sample if mask[u]]
+        acc_robust = np.mean([robust[u] == truth[u] for u in idx])
+        acc_ols = np.mean([ols[u] == truth[u] for u in idx])
+        print(f"trend accuracy ({label}, {len(idx)} URLs): Theil-Sen {acc_robust:.1%}, least squares {acc_ols:.1%}")
+    print(f"per-request least squares: {t_ols * 1e6:.0f} us/URL (vectorized job: {elapsed / urls * 1e6:.0f} us/URL)")
+
+
+if __name__ == "__main__":
+    main()
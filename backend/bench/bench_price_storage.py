@@ -0,0 +1,118 @@
+"""
+price_history (URL + name + ISO timestamp on every row) vs. the normalized
+products + prices (WITHOUT ROWID) layout: database size and history reads.
+
+Builds an old-layout database with marketplace-like URLs and titles, copies
+it, migrates the copy with database.init_db() and compares the two.
+
+Run from backend/:  python bench/bench_price_storage.py [n_rows] [rows_per_url]
+"""
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import database  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+def build_legacy_db(path, n_rows, per_url):
+    rng = random.Random(5)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE price_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_url TEXT NOT NULL,
+            product_name TEXT,
+            price REAL NOT NULL,
+            timestamp TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_price_history_url_time ON price_history (product_url, timestamp)')
+    n_urls = n_rows // per_url
+    urls = [
+        f"https://www.amazon.in/Brand{u}-Stainless-Steel-Bottle-Insulated/dp/B0{u:08d}"
+        f"?th=1&psc=1&keywords=steel+bottle+{u}&qid=17704{u:05d}&sr=8-{u % 40}"
+        for u in range(n_urls)
+    ]
+    names = [
+        f"Brand{u} Stainless Steel Water Bottle 1 Litre, Hot and Cold, Leak Proof, "
+        f"for Office, Gym, School, Model {u}" for u in range(n_urls)
+    ]
+    start = datetime.datetime(2025, 1, 1)
+    rows = []
+    # Rows of different products interleave, as they do when users browse
+    for i in range(n_rows):
+        u = rng.randrange(n_urls)
+        ts = start + datetime.timedelta(seconds=i * 37)
+        rows.append((urls[u], names[u], float(rng.randrange(300, 3000)), ts.isoformat()))
+        if len(rows) >= 100_000:
+            conn.executemany('INSERT INTO price_history (product_url, product_name, price, timestamp) VALUES (?, ?, ?, ?)', rows)
+            rows = []
+    if rows:
+        conn.executemany('INSERT INTO price_history (product_url, product_name, price, timestamp) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    return urls
+
+
+def read_legacy(conn, url):
+    # What /price_trend did before: text match + fromisoformat per row
+    rows = conn.execute(
+        'SELECT price, timestamp FROM price_history WHERE product_url = ? ORDER BY timestamp ASC', (url,)
+    ).fetchall()
+    return [(datetime.datetime.fromisoformat(ts).strftime('%Y-%m-%d'), price) for price, ts in rows]
+
+
+def read_normalized(store, url):
+    product_id = store.get_product_id(database.canonical_url(url) or url)
+    return [(datetime.date.fromtimestamp(ts).isoformat(), price)
+            for ts, price in store.get_price_history(product_id)]
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_url = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    tmp = tempfile.mkdtemp()
+    legacy_path = os.path.join(tmp, "legacy.db")
+    urls = build_legacy_db(legacy_path, n_rows, per_url)
+
+    database.DB_FILE = os.path.join(tmp, "migrated.db")
+    shutil.copy(legacy_path, database.DB_FILE)
+    t0 = time.perf_counter()
+    database.init_db()
+    t_migrate = time.perf_counter() - t0
+
+    size_old = os.path.getsize(legacy_path)
+    size_new = os.path.getsize(database.DB_FILE)
+    print(f"{n_rows} rows, {len(urls)} products, migration {t_migrate:.1f}s")
+    print(f"database size: {size_old / 1e6:.1f} MB -> {size_new / 1e6:.1f} MB "
+          f"({1 - size_new / size_old:.0%} smaller)")
+
+    sample = random.Random(1).sample(urls, min(300, len(urls)))
+    legacy = sqlite3.connect(legacy_path)
+    store = SQLiteStore(database.DB_FILE)
+    assert [p for _, p in read_legacy(legacy, sample[0])] == [p for _, p in read_normalized(store, sample[0])]
+
+    t0 = time.perf_counter()
+    for url in sample:
+        read_legacy(legacy, url)
+    t_old = (time.perf_counter() - t0) / len(sample)
+    t0 = time.perf_counter()
+    for url in sample:
+        read_normalized(store, url)
+    t_new = (time.perf_counter() - t0) / len(sample)
+    legacy.close()
+    print(f"history read (~{per_url} rows): {t_old * 1e3:.2f} ms -> {t_new * 1e3:.2f} ms "
+          f"({t_old / t_new:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
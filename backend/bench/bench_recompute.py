@@ -0,0 +1,130 @@
+"""
+recompute_streaks.recompute_user_totals() on a large synthetic orders table.
+
+First checks that a recompute after in-order delivery events (applied one by
+one through update_order_status) finds nothing to change. Then builds
+`n_orders` orders over `n_users` users with random statuses, dates and
+scores, stores deliberately wrong totals for some users, and times the dry run
+and the apply. The result is checked against a per-user Python replay.
+
+Run from backend/:  python bench/bench_recompute.py [n_orders] [n_users]
+"""
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import database  # noqa: E402
+import recompute_streaks  # noqa: E402
+
+STATUSES = ["delivered"] * 7 + ["cancelled", "returned", "refunded", "replaced", "shipped"]
+
+
+def check_matches_incremental(tmp):
+    database.DB_FILE = os.path.join(tmp, "incremental.db")
+    database.init_db()
+    rng = random.Random(3)
+    for i in range(600):
+        score = rng.choice([2, 4, 6, 8, 9])
+        database.update_order_status(f"u{i % 12}", f"o{i}", "delivered", "item", score, score / 2)
+    summary = recompute_streaks.recompute_user_totals()
+    assert summary["changed"] == 0 and summary["ordersRealigned"] == 0, summary
+    print(f"after {600} in-order deliveries: 0 of {summary['users']} users differ")
+
+
+def build(path, n_orders, n_users):
+    rng = random.Random(7)
+    start = datetime.date(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    rows = []
+    for i in range(n_orders):
+        status = rng.choice(STATUSES)
+        score = rng.randint(0, 10)
+        rows.append((
+            f"o{i:08d}", f"u{rng.randrange(n_users):07d}", "item", status, score, score / 2,
+            int(score >= 5), (start + datetime.timedelta(days=rng.randrange(600))).isoformat(),
+            int(rng.random() < 0.5),
+        ))
+        if len(rows) == 100_000:
+            conn.executemany('INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            rows.clear()
+    conn.executemany('INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    # Every user but a few; wrong totals for about a third
+    conn.executemany(
+        'INSERT INTO users (user_id, current_streak, longest_streak, total_carbon_credits, carbon_rewards) '
+        'VALUES (?, ?, ?, ?, ?)',
+        [(f"u{u:07d}", rng.randint(0, 9), rng.randint(0, 9), rng.random() * 50, 0)
+         for u in range(n_users) if u % 1000 != 999],
+    )
+    conn.commit()
+    conn.close()
+
+
+def replay(path):
+    """Expected totals per user, one Python pass per user."""
+    conn = sqlite3.connect(path)
+    expected, user = {}, None
+    for user_id, sustainable, credits in conn.execute(
+        "SELECT user_id, is_sustainable, carbon_credits FROM orders "
+        "WHERE lower(order_status) IN ('delivered', 'replaced') ORDER BY user_id, purchase_date, rowid"
+    ):
+        if user_id != user:
+            user, streak, longest, total = user_id, 0, 0, 0.0
+        if sustainable == 1:
+            streak, total = streak + 1, total + credits
+            longest = max(longest, streak)
+        else:
+            streak = 0
+        expected[user_id] = (streak, longest, total)
+    conn.close()
+    return expected
+
+
+def main(n_orders, n_users):
+    with tempfile.TemporaryDirectory() as tmp:
+        check_matches_incremental(tmp)
+
+        database.DB_FILE = os.path.join(tmp, "orders.db")
+        database.init_db()
+        t0 = time.perf_counter()
+        build(database.DB_FILE, n_orders, n_users)
+        print(f"built {n_orders} orders / {n_users} users in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        dry = recompute_streaks.recompute_user_totals(apply=False)
+        print(f"dry run  {time.perf_counter() - t0:6.1f}s  {dry['changed']} of {dry['users']} users differ, "
+              f"{dry['ordersRealigned']} orders misflagged, {dry['usersCreated']} users missing")
+
+        t0 = time.perf_counter()
+        applied = recompute_streaks.recompute_user_totals(apply=True)
+        print(f"apply    {time.perf_counter() - t0:6.1f}s  {applied['changed']} users updated, "
+              f"{applied['usersCreated']} created, {applied['monthlyRows']} monthly rows")
+
+        t0 = time.perf_counter()
+        again = recompute_streaks.recompute_user_totals(apply=False)
+        print(f"re-run   {time.perf_counter() - t0:6.1f}s  {again['changed']} users differ")
+        assert again["changed"] == 0 and again["ordersRealigned"] == 0
+
+        expected = replay(database.DB_FILE)
+        conn = sqlite3.connect(database.DB_FILE)
+        mismatches = 0
+        for user_id, streak, longest, total, rewards in conn.execute(
+            'SELECT user_id, current_streak, longest_streak, total_carbon_credits, carbon_rewards FROM users'
+        ):
+            exp = expected.get(user_id, (0, 0, 0.0))
+            if (streak, longest) != exp[:2] or abs(total - exp[2]) > 1e-6 or rewards != int(exp[2] // 5):
+                mismatches += 1
+        conn.close()
+        print(f"checked against Python replay: {mismatches} mismatches")
+        assert mismatches == 0
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
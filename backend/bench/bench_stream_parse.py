@@ -0,0 +1,160 @@
+"""
+Streaming vs. wait-for-full-completion parsing of LLM output.
+
+Replays a simulated token stream (fixed delay per chunk) for the
+/analyze object and the /alternatives array, and compares:
+  - time to first score (first usable result in the caller's hands)
+  - total time until the caller is done
+  - pure parse CPU overhead (no simulated network delay)
+
+Run from backend/:  python bench/bench_stream_parse.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_stream import IncrementalJSONParser, parse_stream  # noqa: E402
+
+CHUNK_CHARS = 4          # roughly one token per chunk
+CHUNK_DELAY_S = 0.002    # ~500 tokens/s, typical for a small hosted model
+
+ANALYZE_COMPLETION = (
+    "Category: clothing_textiles.\n\n"
+    + json.dumps({
+        "materials": ["organic cotton", "plastic packaging"],
+        "numericScore": 6,
+        "grade": "B",
+        "carbonFootprintKg": 2.1,
+        "waterUsageLiters": 900,
+        "explanation": "Mostly organic cotton with some plastic packaging. " * 3,
+    }, indent=2)
+    + "\n\nLet me know if you need anything else! " * 5
+)
+
+ALTERNATIVES_COMPLETION = (
+    "Here are the scores:\n\n"
+    + json.dumps([
+        {"name": f"Product number {i} organic cotton tee", "numericScore": i % 10, "grade": "B"}
+        for i in range(40)
+    ], indent=2)
+    + "\n\nNote: scores are estimates based on product names only."
+)
+
+
+def chunked(text):
+    return [text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS)]
+
+
+def delayed(chunks):
+    for c in chunks:
+        time.sleep(CHUNK_DELAY_S)
+        yield c
+
+
+def legacy_parse_object(content):
+    content = content.strip()
+    try:
+        return json.loads(content)
+    except Exception:
+        for block in reversed(content.split("\n\n")):
+            block = block.strip()
+            if block.startswith("{") and block.endswith("}"):
+                try:
+                    return json.loads(block)
+                except Exception:
+                    pass
+        raise
+
+
+def legacy_parse_array(content):
+    content = content.strip()
+    try:
+        return json.loads(content)
+    except Exception:
+        blocks = [b.strip() for b in content.split("\n\n") if b.strip()]
+        for block in reversed(blocks):
+            if block.startswith("[") and block.endswith("]"):
+                try:
+                    return json.loads(block)
+                except Exception:
+                    pass
+        raise
+
+
+def run_legacy(chunks, parse):
+    t0 = time.perf_counter()
+    content = "".join(delayed(chunks))
+    result = parse(content)
+    t = time.perf_counter() - t0
+    return t, t, result
+
+
+def run_stream_object(chunks):
+    t0 = time.perf_counter()
+    result = parse_stream(delayed(chunks), accept=lambda o: "numericScore" in o)
+    t = time.perf_counter() - t0
+    return t, t, result
+
+
+def run_stream_array(chunks):
+    t0 = time.perf_counter()
+    first = None
+    parser = IncrementalJSONParser(target="array")
+    for c in delayed(chunks):
+        if parser.feed(c) and first is None:
+            first = time.perf_counter() - t0
+        if parser.done:
+            break
+    return first, time.perf_counter() - t0, parser.finish()
+
+
+def parse_overhead(fn, repeat=200):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    obj_chunks = chunked(ANALYZE_COMPLETION)
+    arr_chunks = chunked(ALTERNATIVES_COMPLETION)
+
+    print(f"chunk={CHUNK_CHARS} chars, delay={CHUNK_DELAY_S * 1000:.1f} ms/chunk")
+    print()
+    print(f"{'case':<28}{'first score':>14}{'done':>12}")
+
+    first, done, legacy_obj = run_legacy(obj_chunks, legacy_parse_object)
+    print(f"{'analyze / legacy':<28}{first * 1000:>11.1f} ms{done * 1000:>9.1f} ms")
+    first, done, stream_obj = run_stream_object(obj_chunks)
+    print(f"{'analyze / streaming':<28}{first * 1000:>11.1f} ms{done * 1000:>9.1f} ms")
+    assert stream_obj == legacy_obj
+
+    first, done, legacy_arr = run_legacy(arr_chunks, legacy_parse_array)
+    print(f"{'alternatives / legacy':<28}{first * 1000:>11.1f} ms{done * 1000:>9.1f} ms")
+    first, done, stream_arr = run_stream_array(arr_chunks)
+    print(f"{'alternatives / streaming':<28}{first * 1000:>11.1f} ms{done * 1000:>9.1f} ms")
+    assert stream_arr == legacy_arr
+
+    print()
+    print("parse overhead per completion (no network delay):")
+
+    def stream_obj_cpu():
+        parse_stream(obj_chunks, accept=lambda o: "numericScore" in o)
+
+    def stream_arr_cpu():
+        parse_stream(arr_chunks, target="array")
+
+    for label, fn in [
+        ("analyze / legacy", lambda: legacy_parse_object("".join(obj_chunks))),
+        ("analyze / streaming", stream_obj_cpu),
+        ("alternatives / legacy", lambda: legacy_parse_array("".join(arr_chunks))),
+        ("alternatives / streaming", stream_arr_cpu),
+    ]:
+        print(f"  {label:<26}{parse_overhead(fn) * 1e6:>9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+/suggest_alternatives latency on a large local catalog.
+
+Fills a temp database with synthetic analyzed products (brand, style,
+materials and kind in the name; category, grade) and a few prices each, then times the endpoint through the
+Flask test client for random catalog products, with and without a price
+filter. No LLM is involved.
+
+Run from backend/:  python bench/bench_suggest_alternatives.py [products] [queries]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ["WARMER_ENABLED"] = "0"
+os.environ["NEAR_DUP_SNAPSHOT"] = os.path.join(tempfile.mkdtemp(), "near_dup_index.npz")
+os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "shared_cache.db")
+
+import database  # noqa: E402
+
+database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import app as backend  # noqa: E402
+from scoring import compute_heuristic_score, map_score_to_grade  # noqa: E402
+
+CATEGORIES = {
+    "clothing_textiles": ["t-shirt", "shirt", "hoodie", "jeans", "dress", "trousers", "jacket", "top"],
+    "footwear": ["sneakers", "sandals", "boots", "running shoes", "slippers"],
+    "home_kitchen": ["water bottle", "towel", "bedsheet", "pillow", "cookware set", "lunch box"],
+    "beauty_personal_care": ["shampoo", "soap", "lotion", "toothbrush", "face wash"],
+}
+MATERIALS = ["organic cotton", "cotton", "polyester", "hemp", "bamboo", "linen", "nylon", "recycled polyester",
+             "plastic", "leather", "steel", "glass", "wool", "jute"]
+SYLLABLES = ["ka", "ri", "no", "ve", "ta", "lu", "mo", "sa", "de", "zi", "pe", "ro"]
+STYLES = ["classic", "slim", "relaxed", "everyday", "premium", "sport", "travel", "vintage", "kids", "mini"]
+
+
+def fill(products, rng):
+    conn = database.get_db_connection()
+    now = int(time.time())
+    brands = sorted({"".join(rng.sample(SYLLABLES, 3)) for _ in range(2000)})
+    batch = []
+    for i in range(products):
+        category = rng.choice(list(CATEGORIES))
+        kind = rng.choice(CATEGORIES[category])
+        materials = rng.sample(MATERIALS, rng.randint(1, 3))
+        name = f"{rng.choice(brands).title()} {rng.choice(STYLES).title()} {' '.join(materials).title()} {kind.title()} {i}"
+        score = compute_heuristic_score(" ".join(materials))
+        batch.append((f"https://shop.example/p/{i}", name, materials, category, map_score_to_grade(score), score, "AI"))
+        if len(batch) == 10000:
+            database.index_products(conn, batch)
+            batch = []
+    database.index_products(conn, batch)
+    conn.executemany(
+        "INSERT INTO prices (product_id, ts, price_minor) VALUES (?, ?, ?)",
+        ((pid, now - day * 86400, rng.randint(200, 5000) * 100)
+         for pid in range(1, products + 1) for day in range(3)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(label, client, urls, extra=""):
+    lat, found = [], 0
+    for url in urls:
+        t0 = time.perf_counter()
+        resp = client.get(f"/suggest_alternatives?url={url}{extra}")
+        lat.append(time.perf_counter() - t0)
+        found += len(resp.get_json()["alternatives"])
+    print(f"{label:<22} p50 {percentile(lat, .5) * 1000:6.2f} ms   p95 {percentile(lat, .95) * 1000:6.2f} ms   "
+          f"avg results {found / len(urls):.1f}")
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    fill(products, rng)
+    print(f"{products} catalog products indexed in {time.perf_counter() - t0:.1f} s")
+
+    client = backend.app.test_client()
+    urls = [f"https://shop.example/p/{rng.randrange(products)}" for _ in range(queries)]
+    run("same category, better", client, urls)
+    run("+ max_price=1500", client, urls, "&max_price=1500")
+
+
+if __name__ == "__main__":
+    main()
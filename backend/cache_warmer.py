@@ -0,0 +1,294 @@
+import json
+import threading
+import time
+from collections import Counter, deque
+from itertools import combinations
+
+from structured_log import get_logger
+
+log = get_logger("cache_warmer")
+
+
+class CallBudget:
+    """At most `per_hour` LLM calls in any rolling hour."""
+
+    def __init__(self, per_hour):
+        self.per_hour = per_hour
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        with self._lock:
+            cutoff = time.monotonic() - 3600
+            while self._calls and self._calls[0] < cutoff:
+                self._calls.popleft()
+            return max(0, self.per_hour - len(self._calls))
+
+    def spend(self, n=1):
+        now = time.monotonic()
+        with self._lock:
+            self._calls.extend([now] * n)
+
+
+class FleetCounts:
+    """
+    Counts added up across worker processes in a SharedCache under `kind`.
+    Each worker buffers its own and adds them to the shared counters at most
+    every `flush_s` seconds, on the recording request, so the request path
+    pays for one small transaction per interval rather than per request.
+    """
+
+    def __init__(self, shared, kind, max_items, flush_s=10):
+        self.shared = shared
+        self.kind = kind
+        self.max_items = max_items
+        self.flush_s = flush_s
+        self._pending = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, names):
+        with self._lock:
+            self._pending.update(names)
+            if time.monotonic() - self._flushed_at < self.flush_s:
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        self.shared.add_counts(self.kind, pending, self.max_items)
+
+    def most_common(self, n):
+        self.flush()
+        return self.shared.top_counts(self.kind, n)
+
+    def discard(self, names):
+        with self._lock:
+            for name in names:
+                self._pending.pop(name, None)
+        self.shared.discard_counts(self.kind, names)
+
+
+class DemandCounter:
+    """
+    Bounded counter of requested product names (views, or cache misses).
+    With `shared` (a SharedCache), it counts the requests of every worker
+    under `kind` (see FleetCounts); otherwise those of this process only.
+    """
+
+    def __init__(self, max_items=5000, shared=None, kind=None):
+        self.max_items = max_items
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._fleet = FleetCounts(shared, kind, max_items) if shared is not None else None
+
+    def record(self, names):
+        if self._fleet is not None:
+            self._fleet.update(names)
+            return
+        with self._lock:
+            self._counts.update(names)
+            if len(self._counts) > self.max_items:
+                # Keep the most requested half; old one-off names fall out
+                self._counts = Counter(dict(self._counts.most_common(self.max_items // 2)))
+
+    def most_common(self, n):
+        if self._fleet is not None:
+            return [name for name, _ in self._fleet.most_common(n)]
+        with self._lock:
+            return [name for name, _ in self._counts.most_common(n)]
+
+    def discard(self, names):
+        if self._fleet is not None:
+            self._fleet.discard(names)
+            return
+        with self._lock:
+            for name in names:
+                self._counts.pop(name, None)
+
+
+class CoOccurrence:
+    """
+    Bounded counts of product names requested together (the candidates of
+    one /alternatives call). Only the first `max_names` distinct names of a
+    request are paired, so a request costs at most max_names^2 / 2 updates.
+    With `shared`, pairs are counted across workers like DemandCounter's.
+    """
+
+    def __init__(self, max_pairs=20000, max_names=20, shared=None, kind=None):
+        self.max_pairs = max_pairs
+        self.max_names = max_names
+        self._pairs = Counter()
+        self._lock = threading.Lock()
+        self._fleet = FleetCounts(shared, kind, max_pairs) if shared is not None else None
+
+    def record(self, names):
+        names = sorted(dict.fromkeys(names))[:self.max_names]
+        if self._fleet is not None:
+            # Shared counters are keyed by text
+            self._fleet.update(json.dumps(pair) for pair in combinations(names, 2))
+            return
+        with self._lock:
+            self._pairs.update(combinations(names, 2))
+            if len(self._pairs) > self.max_pairs:
+                self._pairs = Counter(dict(self._pairs.most_common(self.max_pairs // 2)))
+
+    def _pair_counts(self):
+        if self._fleet is not None:
+            return [(tuple(json.loads(pair)), count) for pair, count in self._fleet.most_common(self.max_pairs)]
+        with self._lock:
+            return list(self._pairs.items())
+
+    def neighbours(self, titles, n):
+        """Names most often requested together with any of `titles`, not in `titles`."""
+        titles = set(titles)
+        scores = Counter()
+        for (a, b), count in self._pair_counts():
+            if a in titles and b not in titles:
+                scores[b] += count
+            elif b in titles and a not in titles:
+                scores[a] += count
+        return [name for name, _ in scores.most_common(n)]
+
+
+class WarmStats:
+    """Cache lookups by request paths, and how many were answered by warmed entries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.warm_hits = 0
+
+    def record(self, payload):
+        with self._lock:
+            self.lookups += 1
+            if payload is not None:
+                self.hits += 1
+                if payload.get("warmed"):
+                    self.warm_hits += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "warmHits": self.warm_hits,
+                "hitRatio": round(self.hits / self.lookups, 4) if self.lookups else None,
+                "warmHitRatio": round(self.warm_hits / self.lookups, 4) if self.lookups else None,
+            }
+
+
+class CacheWarmer:
+    """
+    Pre-scores products users are likely to view, in idle time and within an
+    hourly LLM call budget.
+
+    Every `interval_s` seconds, if is_idle() says no user request is waiting
+    on the model:
+      - hot_products() gives product titles ranked by recent visits; the top
+        `full_top` that lack a full analysis get one (score_full, 1 call each)
+      - the remaining hot titles, the most requested uncached alternatives
+        and the names most often requested together with either
+        (co_occurrence) are scored in batches (score_batch, 1 call per batch
+        of `batch_size`)
+    is_cached(title, full) skips titles that are already stored.
+    """
+
+    def __init__(self, hot_products, is_cached, score_full, score_batch, is_idle,
+                 demand=None, co_occurrence=None, calls_per_hour=20, interval_s=300, full_top=5,
+                 batch_size=10, candidates=100):
+        self.hot_products = hot_products
+        self.is_cached = is_cached
+        self.score_full = score_full
+        self.score_batch = score_batch
+        self.is_idle = is_idle
+        self.demand = demand or DemandCounter()
+        self.co_occurrence = co_occurrence or CoOccurrence()
+        self.budget = CallBudget(calls_per_hour)
+        self.interval_s = interval_s
+        self.full_top = full_top
+        self.batch_size = batch_size
+        self.candidates = candidates
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.cycles = 0
+        self.skipped_busy = 0
+        self.warmed_full = 0
+        self.warmed_scores = 0
+        self.errors = 0
+        self.last_run = None
+
+    def run_once(self):
+        """One warming pass. Returns the number of LLM calls spent."""
+        with self._lock:
+            if not self.is_idle():
+                self.skipped_busy += 1
+                return 0
+            self.cycles += 1
+            self.last_run = time.time()
+            spent = 0
+
+            hot = self.hot_products(self.candidates)
+            for title in hot[:self.full_top]:
+                if self.budget.remaining() < 1 or not self.is_idle():
+                    return spent
+                if self.is_cached(title, True):
+                    continue
+                self.budget.spend()
+                spent += 1
+                try:
+                    self.score_full(title)
+                    self.warmed_full += 1
+                except Exception as e:
+                    self.errors += 1
+                    log.warning("Cache warmer: full analysis failed: %s", e)
+
+            demanded = self.demand.most_common(self.candidates)
+            related = self.co_occurrence.neighbours(hot + demanded, self.candidates)
+            wanted = list(dict.fromkeys(hot + demanded + related))
+            cold = [t for t in wanted if not self.is_cached(t, False)]
+            for i in range(0, len(cold), self.batch_size):
+                if self.budget.remaining() < 1 or not self.is_idle():
+                    break
+                batch = cold[i:i + self.batch_size]
+                self.budget.spend()
+                spent += 1
+                try:
+                    self.warmed_scores += self.score_batch(batch)
+                    self.demand.discard(batch)
+                except Exception as e:
+                    self.errors += 1
+                    log.warning("Cache warmer: batch scoring failed: %s", e)
+            return spent
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_once()
+            except Exception as e:
+                log.exception("Cache warmer cycle failed: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "cycles": self.cycles,
+            "skippedBusy": self.skipped_busy,
+            "warmedFull": self.warmed_full,
+            "warmedScores": self.warmed_scores,
+            "errors": self.errors,
+            "budgetRemaining": self.budget.remaining(),
+            "callsPerHour": self.budget.per_hour,
+            "lastRun": self.last_run,
+        }
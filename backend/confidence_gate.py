@@ -0,0 +1,64 @@
+import random
+import threading
+from collections import defaultdict
+
+from structured_log import get_logger
+
+log = get_logger("confidence_gate")
+
+
+class ConfidenceGate:
+    """
+    Serves the heuristic instead of calling the LLM when its confidence
+    (scoring.heuristic_confidence) is at least `threshold`. The threshold is
+    tuned on the golden corpus with bench/bench_confidence_gate.py. The gate
+    is off when `threshold` is None (the default) or above 1.
+
+    A share `audit_rate` of the confident items still goes to the LLM, and
+    the two grades are compared, so the agreement of the skipped answers is
+    measured in production and not only on the corpus.
+    """
+
+    def __init__(self, threshold=None, audit_rate=0.02, rng=None):
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._sites = defaultdict(lambda: {"checked": 0, "skipped": 0, "audited": 0, "agreed": 0})
+
+    @property
+    def enabled(self):
+        return self.threshold is not None and self.threshold <= 1
+
+    def decide(self, site, confidence):
+        """'llm' (not confident), 'skip' (serve the heuristic) or 'audit' (confident, call the LLM anyway)."""
+        with self._lock:
+            counts = self._sites[site]
+            counts["checked"] += 1
+            if not self.enabled or confidence < self.threshold:
+                return "llm"
+            if self._rng.random() < self.audit_rate:
+                return "audit"
+            counts["skipped"] += 1
+            return "skip"
+
+    def record_audit(self, site, heuristic_grade, llm_grade):
+        with self._lock:
+            counts = self._sites[site]
+            counts["audited"] += 1
+            counts["agreed"] += int(heuristic_grade == llm_grade)
+        if heuristic_grade != llm_grade:
+            log.info("Confident heuristic grade %s disagrees with the LLM (%s) for %s",
+                     heuristic_grade, llm_grade, site)
+
+    def stats(self):
+        with self._lock:
+            sites = {
+                site: dict(
+                    c,
+                    skippedShare=round(c["skipped"] / c["checked"], 4) if c["checked"] else None,
+                    auditAgreement=round(c["agreed"] / c["audited"], 4) if c["audited"] else None,
+                )
+                for site, c in self._sites.items()
+            }
+        return {"enabled": self.enabled, "threshold": self.threshold, "auditRate": self.audit_rate, "sites": sites}
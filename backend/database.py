@@ -1,17 +1,35 @@
 import sqlite3
 import datetime
+import json
 import os
 
+from scoring import classify_fallback
+from urls import RULES_VERSION as URL_RULES_VERSION, canonical_url
+from structured_log import get_logger
+
+log = get_logger("database")
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE_DIR, "greenchoice.db")
+PRICE_SCALE = 100  # prices are stored in minor units (paise/cents)
+
+# Trust in a catalog grade by where it came from (/analyze's `used`, or an
+# /alternatives title score): a grade only replaces one from an equal or
+# lower-ranked source
+GRADE_SOURCE_RANK = {"alternatives": 0, "fallback": 1, "heuristic-gated": 1, "AI": 2}
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+# Rough savings of a sustainable purchase vs. a conventional alternative,
+# per positive sustainability score point
+CARBON_SAVED_KG_PER_POINT = 0.5
+WATER_SAVED_LITERS_PER_POINT = 100
+
+def get_db_connection(path=None):
+    conn = sqlite3.connect(path or DB_FILE)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = get_db_connection()
+def init_db(path=None):
+    conn = get_db_connection(path)
     cursor = conn.cursor()
     
     # User table
@@ -47,57 +65,623 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users (user_id)
         )
     ''')
+    # A user's orders in purchase order (recompute_streaks.py, monthly stats rebuild)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_date ON orders (user_id, purchase_date)')
+
+    # Products dimension: one row per canonical product URL
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            product_id INTEGER PRIMARY KEY,
+            canonical_url TEXT NOT NULL UNIQUE,
+            name TEXT
+        )
+    ''')
 
-    # Price History table
+    # Prices table: integer minor units (paise/cents) and epoch seconds,
+    # clustered by product so one product's history is a single range read.
+    # Replaces the old price_history table (see migrate_price_history).
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS price_history (
+        CREATE TABLE IF NOT EXISTS prices (
+            product_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            price_minor INTEGER NOT NULL,
+            PRIMARY KEY (product_id, ts)
+        ) WITHOUT ROWID
+    ''')
+
+    # Price Forecast table: written by the offline job in price_forecast.py.
+    # Derived data, so an older per-URL layout is simply dropped and rebuilt.
+    columns = [r[1] for r in cursor.execute('PRAGMA table_info(price_forecast)')]
+    if columns and 'product_id' not in columns:
+        cursor.execute('DROP TABLE price_forecast')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_forecast (
+            product_id INTEGER PRIMARY KEY,
+            trend TEXT NOT NULL, -- 'up', 'down', 'stable' or 'insufficient_data'
+            slope REAL, -- price change per day (Theil-Sen)
+            forecast REAL, -- predicted price in 7 days
+            confidence REAL, -- 0..1
+            points INTEGER,
+            last_price REAL,
+            last_ts INTEGER, -- epoch seconds
+            computed_at TEXT NOT NULL
+        )
+    ''')
+
+    # Watches table: price-drop watchlist entries, one per user and product
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS watches (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
             product_url TEXT NOT NULL,
             product_name TEXT,
+            target_price REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            triggered_at TEXT, -- set when an alert fired, cleared when the price rises above target again
+            UNIQUE (user_id, product_url)
+        )
+    ''')
+    # Alert evaluation on ingest only looks at watches of one URL within a price range
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_watches_url_target ON watches (product_url, target_price)')
+
+    # Notifications table: triggered price alerts waiting for the extension
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            watch_id INTEGER,
+            product_url TEXT NOT NULL,
+            product_name TEXT,
+            target_price REAL,
             price REAL NOT NULL,
-            timestamp TEXT NOT NULL
+            created_at TEXT NOT NULL,
+            delivered INTEGER DEFAULT 0 -- 0 or 1
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notifications_pending
+        ON notifications (user_id, id) WHERE delivered = 0
+    ''')
+
+    # Per-user monthly impact, kept up to date by handle_streak_update()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_monthly_stats (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL, -- 'YYYY-MM' of the purchase date
+            sustainable_count INTEGER DEFAULT 0,
+            non_sustainable_count INTEGER DEFAULT 0,
+            credits REAL DEFAULT 0.0,
+            score_sum REAL DEFAULT 0.0,
+            score_count INTEGER DEFAULT 0,
+            carbon_saved_kg REAL DEFAULT 0.0,
+            water_saved_liters REAL DEFAULT 0.0,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID
+    ''')
+
+    # LLM usage per day, call site and user ('' when unknown), flushed by llm_usage.LLMUsage
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            day TEXT NOT NULL, -- 'YYYY-MM-DD'
+            call_site TEXT NOT NULL, -- 'ai_score', 'ai_score_alternatives', 'classify'
+            user_id TEXT NOT NULL,
+            calls INTEGER DEFAULT 0,
+            errors INTEGER DEFAULT 0,
+            estimated INTEGER DEFAULT 0, -- calls whose token counts were estimated
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            seconds REAL DEFAULT 0.0,
+            PRIMARY KEY (day, call_site, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Product Analysis table: last /analyze result per canonical product URL
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_analysis (
+            canonical_url TEXT PRIMARY KEY,
+            numeric_score NUMERIC,
+            grade TEXT,
+            materials TEXT, -- JSON array
+            carbon_footprint_kg NUMERIC,
+            water_usage_liters NUMERIC,
+            explanation TEXT,
+            source TEXT, -- 'AI' or 'fallback'
+            model_version TEXT,
+            content_hash TEXT NOT NULL, -- sha256 of the scraped title + description
+            updated_at TEXT NOT NULL
         )
     ''')
     
+    # Search catalog: name, materials, category and grade of every analyzed
+    # product, for /suggest_alternatives. The last price comes from prices.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_catalog (
+            product_id INTEGER PRIMARY KEY,
+            name TEXT,
+            materials TEXT, -- comma-separated
+            category TEXT, -- from /classify, else its keyword fallback
+            grade TEXT,
+            numeric_score NUMERIC,
+            grade_rank INTEGER NOT NULL DEFAULT 0, -- GRADE_SOURCE_RANK of the grade's source
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    try:
+        cursor.execute('ALTER TABLE product_catalog ADD COLUMN grade_rank INTEGER NOT NULL DEFAULT 0')
+    except sqlite3.OperationalError:
+        pass # Column already exists
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_product_catalog_category ON product_catalog (category, grade, numeric_score DESC)'
+    )
+
     conn.commit()
+
+    # Full-text index over the catalog (needs SQLite built with FTS5)
+    try:
+        create_product_search(conn)
+    except sqlite3.OperationalError as e:
+        log.warning("Product search index unavailable: %s", e)
+
+    # Move rows of the old price_history table over (no-op once done)
+    try:
+        migrated = migrate_price_history(conn)
+        if migrated is not None:
+            conn.execute('VACUUM')  # give the space of the old table back
+            log.info("Migrated %d price_history rows to products/prices", migrated)
+    except sqlite3.OperationalError as e:
+        log.warning("Price history migration skipped: %s", e)
+
+    # Re-key stored URLs when the canonicalization rules changed (no-op once done)
+    if conn.execute('PRAGMA user_version').fetchone()[0] < URL_RULES_VERSION:
+        summary = merge_duplicate_products(conn)
+        if summary is not None:
+            log.info("Re-keyed product URLs", extra=summary)
+
     conn.close()
 
-def get_user(user_id):
+def create_product_search(conn):
+    """
+    FTS5 index over product_catalog (external content, kept in sync by
+    triggers). When it is first created, the catalog is filled from the
+    product_analysis rows stored before it existed.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+    ).fetchone()
+    if exists:
+        return
+    conn.executescript('''
+        CREATE VIRTUAL TABLE product_search USING fts5(
+            name, materials, category,
+            content='product_catalog', content_rowid='product_id',
+            tokenize='porter unicode61'
+        );
+        CREATE TRIGGER product_catalog_ai AFTER INSERT ON product_catalog BEGIN
+            INSERT INTO product_search (rowid, name, materials, category)
+            VALUES (new.product_id, new.name, new.materials, new.category);
+        END;
+        CREATE TRIGGER product_catalog_ad AFTER DELETE ON product_catalog BEGIN
+            INSERT INTO product_search (product_search, rowid, name, materials, category)
+            VALUES ('delete', old.product_id, old.name, old.materials, old.category);
+        END;
+        CREATE TRIGGER product_catalog_au AFTER UPDATE ON product_catalog BEGIN
+            INSERT INTO product_search (product_search, rowid, name, materials, category)
+            VALUES ('delete', old.product_id, old.name, old.materials, old.category);
+            INSERT INTO product_search (rowid, name, materials, category)
+            VALUES (new.product_id, new.name, new.materials, new.category);
+        END;
+    ''')
+    conn.execute('''
+        INSERT INTO product_search (rowid, name, materials, category)
+        SELECT product_id, name, materials, category FROM product_catalog
+    ''')
+    rows = conn.execute('''
+        SELECT pa.canonical_url, p.name, pa.materials, pa.grade, pa.numeric_score, pa.source
+        FROM product_analysis pa LEFT JOIN products p ON p.canonical_url = pa.canonical_url
+    ''').fetchall()
+    index_products(conn, [
+        (url, name, json.loads(materials or "[]"), None, grade, score, source)
+        for url, name, materials, grade, score, source in rows
+    ])
+    conn.commit()
+
+def index_products(conn, products):
+    """
+    Adds or updates analyzed products in the search catalog. Uses the caller's
+    connection. products: (canonical_url, name, materials, category, grade,
+    numeric_score, source); a missing name or materials keeps the stored one.
+    A stored category (e.g. from /classify) wins over the keyword fallback
+    used when `category` is None, and a stored grade from a better source
+    (GRADE_SOURCE_RANK) wins over the new one.
+    """
+    now = datetime.datetime.now().isoformat()
+    rows = []
+    for url, name, materials, category, grade, score, source in products:
+        if not url or grade is None:
+            continue
+        materials = ", ".join(materials) if materials else None
+        fallback = classify_fallback(" ".join(filter(None, [name, materials])).lower())["category"]
+        rows.append((get_or_create_product(conn, url, name), name or None, materials,
+                     category, fallback, grade, score, GRADE_SOURCE_RANK.get(source, 0), now))
+    conn.executemany('''
+        INSERT INTO product_catalog (product_id, name, materials, category, grade, numeric_score, grade_rank, updated_at)
+        VALUES (?1, ?2, ?3, COALESCE(?4, ?5), ?6, ?7, ?8, ?9)
+        ON CONFLICT (product_id) DO UPDATE SET
+            name = COALESCE(excluded.name, name),
+            materials = COALESCE(excluded.materials, materials),
+            category = COALESCE(?4, category, ?5),
+            grade = CASE WHEN ?8 >= grade_rank THEN excluded.grade ELSE grade END,
+            numeric_score = CASE WHEN ?8 >= grade_rank THEN excluded.numeric_score ELSE numeric_score END,
+            grade_rank = MAX(grade_rank, ?8),
+            updated_at = excluded.updated_at
+    ''', rows)
+    return len(rows)
+
+def add_to_catalog(products):
+    """index_products() on its own connection, e.g. for /alternatives results."""
     conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    count = index_products(conn, products)
+    conn.commit()
     conn.close()
-    return user
+    return count
 
-def create_user(user_id):
+def get_catalog_product(canonical_url):
+    """Search catalog row of a product URL with its last price in minor units, or None."""
     conn = get_db_connection()
-    try:
-        conn.execute('INSERT INTO users (user_id) VALUES (?)', (user_id,))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass # User likely already exists
+    row = conn.execute('''
+        SELECT c.*, p.canonical_url, (SELECT price_minor FROM prices WHERE product_id = c.product_id
+                     ORDER BY ts DESC LIMIT 1) AS last_price_minor
+        FROM products p JOIN product_catalog c ON c.product_id = p.product_id
+        WHERE p.canonical_url = ?
+    ''', (canonical_url,)).fetchone()
     conn.close()
+    return row
 
-def get_order(order_id):
+def set_product_category(canonical_url, category):
+    """Stores the /classify category of a product already in the search catalog."""
     conn = get_db_connection()
-    order = conn.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+    conn.execute('''
+        UPDATE product_catalog SET category = ?
+        WHERE product_id = (SELECT product_id FROM products WHERE canonical_url = ?)
+    ''', (category, canonical_url))
+    conn.commit()
     conn.close()
-    return order
+
+# Matching products BM25 ranks per query at most (the newest ones), which
+# bounds the cost of a query of common words on a large catalog. CROSS JOIN
+# keeps the FTS index as the outer loop, so the scan stops there.
+SEARCH_MAX_HITS = 500
+LAST_PRICE_SQL = '(SELECT price_minor FROM prices WHERE product_id = {} ORDER BY ts DESC LIMIT 1)'
+
+def _fts_phrase(text):
+    return '"' + str(text).replace('"', '""') + '"'
+
+def search_products(query_terms, category, better_than=None, max_price=None, exclude_id=None, limit=10):
+    """
+    Catalog products of `category` graded better than `better_than`, most
+    relevant to `query_terms` first (BM25 over name, materials and category),
+    then the best graded others. Each row carries the product's last price;
+    max_price drops products priced above it and those without a price.
+
+    Products matching all terms come first; the terms are only OR-ed when
+    that leaves fewer than `limit` rows. Each query ranks at most the newest
+    SEARCH_MAX_HITS eligible matches.
+    """
+    if better_than == "A":
+        return []
+    # 'A' < 'B' < 'C' < 'D' < 'F', so "better" is a range on the (category, grade, score) index
+    filters = 'c.category = :category AND c.grade < :below AND c.product_id != :exclude'
+    if max_price is not None:
+        filters += f' AND {LAST_PRICE_SQL.format("c.product_id")} <= :max_price'
+    params = {
+        "category": category, "below": better_than or "G",
+        "exclude": exclude_id if exclude_id is not None else -1,
+        "max_price": to_minor_units(max_price) if max_price is not None else None,
+    }
+    details = f'''
+        SELECT c.product_id, p.canonical_url, c.name, c.materials, c.category, c.grade, c.numeric_score,
+               {LAST_PRICE_SQL.format("c.product_id")} AS last_price_minor, hits.rank
+        FROM hits JOIN product_catalog c ON c.product_id = hits.product_id
+        JOIN products p ON p.product_id = c.product_id
+        ORDER BY hits.rank, c.grade, c.numeric_score DESC
+    '''
+
+    conn = get_db_connection()
+    rows, seen = [], {exclude_id}
+    operators = ("AND", "OR") if len(query_terms) > 1 else ("OR",)
+    for op in operators if query_terms else ():
+        try:
+            found = conn.execute(f'''
+                WITH matches AS (
+                    SELECT s.rowid AS product_id, bm25(product_search, 10.0, 4.0, 1.0) AS rank
+                    FROM product_search s CROSS JOIN product_catalog c ON c.product_id = s.rowid
+                    WHERE product_search MATCH :match AND {filters}
+                    ORDER BY s.rowid DESC LIMIT :max_hits
+                ), hits AS (
+                    SELECT * FROM matches ORDER BY rank LIMIT :limit
+                ) {details}
+            ''', dict(params, match=f" {op} ".join(map(_fts_phrase, query_terms)),
+                       max_hits=SEARCH_MAX_HITS, limit=limit + len(rows))).fetchall()
+        except sqlite3.OperationalError as e:
+            log.warning("Product search index query failed: %s", e)  # e.g. SQLite without FTS5
+            break
+        rows += [r for r in found if r['product_id'] not in seen][:limit - len(rows)]
+        seen.update(r['product_id'] for r in found)
+        if len(rows) >= limit:
+            break
+
+    if len(rows) < limit:
+        # Fill up with the best graded products of the category
+        found = conn.execute(f'''
+            WITH hits AS (
+                SELECT c.product_id, NULL AS rank FROM product_catalog c
+                WHERE {filters}
+                ORDER BY c.grade, c.numeric_score DESC LIMIT :limit
+            ) {details}
+        ''', dict(params, limit=limit + len(rows))).fetchall()
+        rows += [r for r in found if r['product_id'] not in seen][:limit - len(rows)]
+    conn.close()
+    return rows
+
+def get_product_analysis(canonical_url):
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM product_analysis WHERE canonical_url = ?', (canonical_url,)).fetchone()
+    conn.close()
+    return row
+
+def to_minor_units(price):
+    return int(round(price * PRICE_SCALE))
+
+def get_or_create_product(conn, canonical_url, name=None):
+    """product_id for a canonical URL, inserting the product if needed. Uses the caller's connection."""
+    row = conn.execute('SELECT product_id, name FROM products WHERE canonical_url = ?', (canonical_url,)).fetchone()
+    if row is None:
+        cursor = conn.execute('INSERT INTO products (canonical_url, name) VALUES (?, ?)', (canonical_url, name or None))
+        return cursor.lastrowid
+    if name and name != row[1]:
+        conn.execute('UPDATE products SET name = ? WHERE product_id = ?', (name, row[0]))
+    return row[0]
+
+def get_last_price(conn, product_id):
+    """(ts, price) of the latest stored price of a product, or None."""
+    row = conn.execute('''
+        SELECT ts, price_minor FROM prices WHERE product_id = ?
+        ORDER BY ts DESC LIMIT 1
+    ''', (product_id,)).fetchone()
+    return (row[0], row[1] / PRICE_SCALE) if row else None
+
+def insert_price(conn, product_id, price, ts):
+    # Two prices for one product in the same second: the last one wins
+    conn.execute(
+        'INSERT OR REPLACE INTO prices (product_id, ts, price_minor) VALUES (?, ?, ?)',
+        (product_id, ts, to_minor_units(price)),
+    )
+
+def migrate_price_history(conn, chunk_rows=100_000):
+    """
+    One-time migration of the old price_history table (full URL, name and ISO
+    timestamp on every row) into products + prices. The old table is dropped
+    in the same transaction. Returns the number of rows migrated, or None if
+    there was nothing to migrate.
+    """
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')  # one worker migrates, the others wait for it
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_history'"
+    ).fetchone()
+    if not legacy:
+        conn.rollback()
+        return None
+
+    product_ids = {}
+    migrated = 0
+    read = conn.cursor()
+    read.execute('SELECT product_url, product_name, price, timestamp FROM price_history ORDER BY id')
+    while True:
+        rows = read.fetchmany(chunk_rows)
+        if not rows:
+            break
+        batch = []
+        for url, name, price, timestamp in rows:
+            product_id = product_ids.get(url)
+            if product_id is None:
+                product_id = product_ids[url] = get_or_create_product(conn, canonical_url(url) or url, name)
+            # Old timestamps are naive local time, as is datetime.fromtimestamp()
+            ts = int(datetime.datetime.fromisoformat(timestamp).timestamp())
+            batch.append((product_id, ts, to_minor_units(price)))
+        conn.executemany(
+            'INSERT OR REPLACE INTO prices (product_id, ts, price_minor) VALUES (?, ?, ?)', batch
+        )
+        migrated += len(rows)
+
+    conn.execute('DROP TABLE price_history')
+    conn.commit()
+    return migrated
+
+def merge_duplicate_products(conn, dry_run=False, force=False):
+    """
+    Re-keys every stored product URL with the current canonical_url() rules and
+    merges the products that now share a key: their prices move to one product
+    (the one already holding the key, else the oldest; on a timestamp collision
+    its own price wins), the others are deleted, and the forecasts of merged
+    products are dropped for the offline job to rebuild. Watches, notifications
+    and product analyses are re-keyed too; a user's duplicate watch and the
+    older of two analyses are dropped.
+
+    Runs in one transaction and records URL_RULES_VERSION in PRAGMA
+    user_version; it is skipped (returns None) when that is already current,
+    unless force. With dry_run everything is rolled back. Returns counts.
+    """
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')  # one worker migrates, the others wait for it
+    if not force and conn.execute('PRAGMA user_version').fetchone()[0] >= URL_RULES_VERSION:
+        conn.rollback()
+        return None
+
+    summary = {"products": 0, "rekeyed": 0, "merged": 0, "pricesMoved": 0,
+               "watches": 0, "watchesDropped": 0, "notifications": 0, "analyses": 0}
+
+    # Databases from before the search catalog was added don't have it yet
+    has_catalog = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_catalog'"
+    ).fetchone() is not None
+    groups = {}
+    for product_id, url, name in conn.execute('SELECT product_id, canonical_url, name FROM products ORDER BY product_id'):
+        summary["products"] += 1
+        groups.setdefault(canonical_url(url) or url, []).append((product_id, url, name))
+
+    for key, members in groups.items():
+        if len(members) == 1 and members[0][1] == key:
+            continue
+        survivor = next((m for m in members if m[1] == key), members[0])
+        name = survivor[2] or next((m[2] for m in members if m[2]), None)
+        for product_id, url, _ in members:
+            if product_id == survivor[0]:
+                continue
+            summary["pricesMoved"] += conn.execute('''
+                INSERT OR IGNORE INTO prices (product_id, ts, price_minor)
+                SELECT ?, ts, price_minor FROM prices WHERE product_id = ?
+            ''', (survivor[0], product_id)).rowcount
+            conn.execute('DELETE FROM prices WHERE product_id = ?', (product_id,))
+            conn.execute('DELETE FROM price_forecast WHERE product_id = ?', (product_id,))
+            if has_catalog:
+                conn.execute(
+                    'UPDATE OR IGNORE product_catalog SET product_id = ? WHERE product_id = ?', (survivor[0], product_id)
+                )
+                conn.execute('DELETE FROM product_catalog WHERE product_id = ?', (product_id,))
+            conn.execute('DELETE FROM products WHERE product_id = ?', (product_id,))
+            summary["merged"] += 1
+        if len(members) > 1:
+            conn.execute('DELETE FROM price_forecast WHERE product_id = ?', (survivor[0],))
+        conn.execute('UPDATE products SET canonical_url = ?, name = ? WHERE product_id = ?', (key, name, survivor[0]))
+        summary["rekeyed"] += 1
+
+    for (url,) in conn.execute('SELECT DISTINCT product_url FROM watches').fetchall():
+        key = canonical_url(url) or url
+        if key != url:
+            # A user already watching the new key keeps that watch
+            summary["watches"] += conn.execute(
+                'UPDATE OR IGNORE watches SET product_url = ? WHERE product_url = ?', (key, url)
+            ).rowcount
+            summary["watchesDropped"] += conn.execute('DELETE FROM watches WHERE product_url = ?', (url,)).rowcount
+
+    for (url,) in conn.execute('SELECT DISTINCT product_url FROM notifications').fetchall():
+        key = canonical_url(url) or url
+        if key != url:
+            summary["notifications"] += conn.execute(
+                'UPDATE notifications SET product_url = ? WHERE product_url = ?', (key, url)
+            ).rowcount
+
+    # Oldest first, so the most recent analysis of a product ends up under its key
+    for url, updated_at in conn.execute(
+        'SELECT canonical_url, updated_at FROM product_analysis ORDER BY updated_at'
+    ).fetchall():
+        key = canonical_url(url) or url
+        if key != url:
+            conn.execute('DELETE FROM product_analysis WHERE canonical_url = ? AND updated_at <= ?', (key, updated_at))
+            summary["analyses"] += conn.execute(
+                'UPDATE OR IGNORE product_analysis SET canonical_url = ? WHERE canonical_url = ?', (key, url)
+            ).rowcount
+            conn.execute('DELETE FROM product_analysis WHERE canonical_url = ?', (url,))
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.execute(f'PRAGMA user_version = {int(URL_RULES_VERSION)}')
+        conn.commit()
+    return summary
+
+def save_product_analysis(canonical_url, analysis, model_version, content_hash, name=None):
+    """
+    Insert or replace the stored analysis for a product URL, and add the
+    product (`name` is its title) to the search catalog.
+    `analysis` is the /analyze response dict (numericScore, grade, materials, ...).
+    """
+    conn = get_db_connection()
+    index_products(conn, [(canonical_url, name, analysis.get("materials"), None,
+                           analysis.get("grade"), analysis.get("numericScore"), analysis.get("used"))])
+    conn.execute('''
+        INSERT OR REPLACE INTO product_analysis
+            (canonical_url, numeric_score, grade, materials, carbon_footprint_kg, water_usage_liters,
+             explanation, source, model_version, content_hash, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        canonical_url,
+        analysis.get("numericScore"),
+        analysis.get("grade"),
+        json.dumps(analysis.get("materials") or []),
+        analysis.get("carbonFootprintKg"),
+        analysis.get("waterUsageLiters"),
+        analysis.get("explanation"),
+        analysis.get("used"),
+        model_version,
+        content_hash,
+        datetime.datetime.now().isoformat(),
+    ))
+    conn.commit()
+    conn.close()
+
+def product_analysis_to_dict(row):
+    """Turns a product_analysis row back into the /analyze response shape."""
+    return {
+        "numericScore": row['numeric_score'],
+        "grade": row['grade'],
+        "materials": json.loads(row['materials'] or "[]"),
+        "carbonFootprintKg": row['carbon_footprint_kg'],
+        "waterUsageLiters": row['water_usage_liters'],
+        "explanation": row['explanation'],
+        "used": row['source'],
+    }
+
+def evaluate_price_watches(conn, product_url, price):
+    """
+    Fires the watches on product_url whose target the new price has reached,
+    writing one pending notification per watch, and re-arms triggered watches
+    the price has risen above again. Uses the caller's connection and leaves
+    the commit to the caller. Returns the number of alerts written.
+    """
+    now = datetime.datetime.now().isoformat()
+    fired = conn.execute('''
+        SELECT id, user_id, product_name, target_price FROM watches
+        WHERE product_url = ? AND target_price >= ? AND triggered_at IS NULL
+    ''', (product_url, price)).fetchall()
+
+    if fired:
+        conn.executemany('''
+            INSERT INTO notifications (user_id, watch_id, product_url, product_name, target_price, price, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(w['user_id'], w['id'], product_url, w['product_name'], w['target_price'], price, now) for w in fired])
+        conn.executemany('UPDATE watches SET triggered_at = ? WHERE id = ?', [(now, w['id']) for w in fired])
+
+    conn.execute('''
+        UPDATE watches SET triggered_at = NULL
+        WHERE product_url = ? AND target_price < ? AND triggered_at IS NOT NULL
+    ''', (product_url, price))
+    return len(fired)
+
+def order_is_sustainable(sustainability_score, existing_order=None):
+    # Determine if sustainable (simple logic: score >= 5 or whatever threshold)
+    # The user requirement: "Purchase classified as sustainable". Let's say score >= 5 (Grade B or better).
+    if sustainability_score is not None:
+        return 1 if sustainability_score >= 5 else 0
+    if existing_order:
+        return existing_order['is_sustainable']
+    return 0
 
 def update_order_status(user_id, order_id, status, product_name=None, sustainability_score=None, carbon_credits=None):
     conn = get_db_connection()
+    updated_order = write_order_status(conn, user_id, order_id, status, product_name, sustainability_score, carbon_credits)
+    conn.close()
+    return updated_order
+
+def write_order_status(conn, user_id, order_id, status, product_name=None, sustainability_score=None, carbon_credits=None):
+    """update_order_status() on the caller's connection."""
     cursor = conn.cursor()
     
     # check if order exists
     existing_order = cursor.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,)).fetchone()
     
-    # Determine if sustainable (simple logic: score >= 5 or whatever threshold)
-    # The user requirement: "Purchase classified as sustainable". Let's say score >= 5 (Grade B or better).
-    is_sustainable = 0
-    if sustainability_score is not None:
-        if sustainability_score >= 5:
-            is_sustainable = 1
-    elif existing_order:
-         is_sustainable = existing_order['is_sustainable']
+    is_sustainable = order_is_sustainable(sustainability_score, existing_order)
 
     current_date = datetime.date.today().isoformat()
 
@@ -120,16 +704,32 @@ def update_order_status(user_id, order_id, status, product_name=None, sustainabi
     # Handle streak logic immediately after status update
     updated_order = cursor.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,)).fetchone()
     handle_streak_update(user_id, updated_order, conn)
-    
-    conn.close()
     return updated_order
 
 def handle_streak_update(user_id, order, conn):
     user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
     if not user:
         conn.execute('INSERT INTO users (user_id) VALUES (?)', (user_id,))
+        conn.commit()
         user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
 
+    change = streak_update(user, order)
+    if change is None:
+        return
+    user_changes, awarded, stats_sign = change
+    assignments = ", ".join(f"{column} = ?" for column in user_changes)
+    conn.execute(f'UPDATE users SET {assignments} WHERE user_id = ?', list(user_changes.values()) + [user_id])
+    conn.execute('UPDATE orders SET streak_awarded = ? WHERE order_id = ?', (awarded, order['order_id']))
+    apply_monthly_stats(conn, user_id, order, stats_sign)
+    conn.commit()
+
+def streak_update(user, order):
+    """
+    Streak/credit changes caused by an order's current status, shared by every
+    storage backend. user and order are rows or dicts. Returns None when nothing
+    changes, else (user column -> new value, new streak_awarded, +1/-1 for
+    apply_monthly_stats).
+    """
     status = order['order_status'].lower()
     is_sustainable = order['is_sustainable']
     streak_awarded = order['streak_awarded']
@@ -170,18 +770,16 @@ def handle_streak_update(user_id, order, conn):
         if potential_rewards > carbon_rewards:
              carbon_rewards = potential_rewards
 
-        # Update user
+        # Update user and mark order as awarded
         today_str = datetime.date.today().isoformat()
         
-        conn.execute('''
-            UPDATE users 
-            SET current_streak = ?, longest_streak = ?, last_sustainable_purchase_date = ?, total_carbon_credits = ?, carbon_rewards = ?
-            WHERE user_id = ?
-        ''', (current_streak, longest_streak, today_str, total_credits, carbon_rewards, user_id))
-        
-        # Mark order as awarded
-        conn.execute('UPDATE orders SET streak_awarded = 1 WHERE order_id = ?', (order['order_id'],))
-        conn.commit()
+        return {
+            "current_streak": current_streak,
+            "longest_streak": longest_streak,
+            "last_sustainable_purchase_date": today_str,
+            "total_carbon_credits": total_credits,
+            "carbon_rewards": carbon_rewards,
+        }, 1, 1
 
     # Logic: Delivered + Non-Sustainable -> Reset Streak
     elif status == 'delivered' and not is_sustainable and not streak_awarded:
@@ -215,14 +813,7 @@ def handle_streak_update(user_id, order, conn):
         # But `app.py` sets `carbon_credits` to 0.0 if score < 0.
         # I will assume for now that I just reset the streak.
         
-        conn.execute('''
-            UPDATE users 
-            SET current_streak = ?
-            WHERE user_id = ?
-        ''', (current_streak, user_id))
-        
-        conn.execute('UPDATE orders SET streak_awarded = 1 WHERE order_id = ?', (order['order_id'],))
-        conn.commit()
+        return {"current_streak": current_streak}, 1, 1
 
     # Logic: Refund/Return -> Revert Streak/Credits
     elif (status in ['cancelled', 'returned', 'refunded']) and streak_awarded:
@@ -232,15 +823,12 @@ def handle_streak_update(user_id, order, conn):
         # Revert streak (count)
         current_streak = max(0, current_streak - 1)
         
-        conn.execute('''
-            UPDATE users 
-            SET current_streak = ?, total_carbon_credits = ?, carbon_rewards = ?
-            WHERE user_id = ?
-        ''', (current_streak, total_credits, carbon_rewards, user_id))
-        
         # Mark order as NOT awarded
-        conn.execute('UPDATE orders SET streak_awarded = 0 WHERE order_id = ?', (order['order_id'],))
-        conn.commit()
+        return {
+            "current_streak": current_streak,
+            "total_carbon_credits": total_credits,
+            "carbon_rewards": carbon_rewards,
+        }, 0, -1
 
     elif status == 'replaced':
         # "If replacement is sustainable -> streak remains."
@@ -252,3 +840,121 @@ def handle_streak_update(user_id, order, conn):
         # If product changes, the caller should update product info.
         pass
 
+    return None
+
+def order_impact(order):
+    """
+    Contribution of one counted (delivered) order to user_monthly_stats:
+    (sustainable, non_sustainable, credits, score_sum, score_count, carbon_saved_kg, water_saved_liters).
+    Only sustainable orders earn credits and savings, as in handle_streak_update().
+    """
+    sustainable = 1 if order['is_sustainable'] else 0
+    score = order['sustainability_score']
+    positive = max(score or 0, 0) if sustainable else 0
+    return (
+        sustainable,
+        1 - sustainable,
+        (order['carbon_credits'] or 0) if sustainable else 0,
+        score if score is not None else 0,
+        1 if score is not None else 0,
+        positive * CARBON_SAVED_KG_PER_POINT,
+        positive * WATER_SAVED_LITERS_PER_POINT,
+    )
+
+def apply_monthly_stats(conn, user_id, order, sign):
+    """
+    Adds (sign=1) or reverses (sign=-1) an order's contribution to its month.
+    Uses the caller's connection and leaves the commit to the caller.
+    """
+    month = (order['purchase_date'] or datetime.date.today().isoformat())[:7]
+    values = [v * sign for v in order_impact(order)]
+    conn.execute('''
+        INSERT INTO user_monthly_stats
+            (user_id, month, sustainable_count, non_sustainable_count, credits,
+             score_sum, score_count, carbon_saved_kg, water_saved_liters)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, month) DO UPDATE SET
+            sustainable_count = sustainable_count + excluded.sustainable_count,
+            non_sustainable_count = non_sustainable_count + excluded.non_sustainable_count,
+            credits = credits + excluded.credits,
+            score_sum = score_sum + excluded.score_sum,
+            score_count = score_count + excluded.score_count,
+            carbon_saved_kg = carbon_saved_kg + excluded.carbon_saved_kg,
+            water_saved_liters = water_saved_liters + excluded.water_saved_liters
+    ''', [user_id, month] + values)
+
+def rebuild_user_monthly_stats(user_id=None):
+    """
+    Recomputes user_monthly_stats from the counted orders (streak_awarded = 1)
+    with one grouped query, for one user or everyone. Returns the rows written.
+    """
+    where, params = 'WHERE streak_awarded = 1', ()
+    if user_id:
+        where, params = where + ' AND user_id = ?', (user_id,)
+    conn = get_db_connection()
+    conn.execute('DELETE FROM user_monthly_stats' + (' WHERE user_id = ?' if user_id else ''), params)
+    cursor = conn.execute(f'''
+        INSERT INTO user_monthly_stats
+            (user_id, month, sustainable_count, non_sustainable_count, credits,
+             score_sum, score_count, carbon_saved_kg, water_saved_liters)
+        SELECT
+            user_id,
+            substr(COALESCE(purchase_date, date('now', 'localtime')), 1, 7) AS month,
+            SUM(is_sustainable = 1),
+            SUM(COALESCE(is_sustainable, 0) != 1),
+            SUM(CASE WHEN is_sustainable = 1 THEN COALESCE(carbon_credits, 0) ELSE 0 END),
+            SUM(COALESCE(sustainability_score, 0)),
+            COUNT(sustainability_score),
+            SUM(CASE WHEN is_sustainable = 1 THEN MAX(COALESCE(sustainability_score, 0), 0) ELSE 0 END) * ?,
+            SUM(CASE WHEN is_sustainable = 1 THEN MAX(COALESCE(sustainability_score, 0), 0) ELSE 0 END) * ?
+        FROM orders
+        {where}
+        GROUP BY user_id, month
+    ''', (CARBON_SAVED_KG_PER_POINT, WATER_SAVED_LITERS_PER_POINT) + params)
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
+
+def add_llm_usage(rows):
+    """
+    Adds (day, call_site, user_id, counter) rows from LLMUsage.flush() to the
+    llm_usage table. Returns today's total tokens per call site across all
+    workers.
+    """
+    conn = get_db_connection()
+    conn.executemany('''
+        INSERT INTO llm_usage
+            (day, call_site, user_id, calls, errors, estimated, prompt_tokens, completion_tokens, seconds)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day, call_site, user_id) DO UPDATE SET
+            calls = calls + excluded.calls,
+            errors = errors + excluded.errors,
+            estimated = estimated + excluded.estimated,
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = completion_tokens + excluded.completion_tokens,
+            seconds = seconds + excluded.seconds
+    ''', [
+        (day, site, user, c["calls"], c["errors"], c["estimated"], c["promptTokens"], c["completionTokens"], c["seconds"])
+        for day, site, user, c in rows
+    ])
+    conn.commit()
+    totals = conn.execute('''
+        SELECT call_site, SUM(prompt_tokens + completion_tokens) FROM llm_usage
+        WHERE day = ? GROUP BY call_site
+    ''', (datetime.date.today().isoformat(),)).fetchall()
+    conn.close()
+    return {site: tokens for site, tokens in totals}
+
+def get_llm_usage(days=7):
+    """Stored LLM usage per day and call site for the last `days` days, newest first."""
+    since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT day, call_site, SUM(calls) AS calls, SUM(errors) AS errors, SUM(estimated) AS estimated,
+               SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens,
+               SUM(seconds) AS seconds, COUNT(DISTINCT NULLIF(user_id, '')) AS users
+        FROM llm_usage WHERE day >= ?
+        GROUP BY day, call_site ORDER BY day DESC, call_site
+    ''', (since,)).fetchall()
+    conn.close()
+    return rows
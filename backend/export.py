@@ -0,0 +1,225 @@
+"""
+Streaming bulk export of tracked prices and orders as CSV or NDJSON.
+
+Rows are read in keyset-paginated pages (WHERE key > last key ORDER BY key
+LIMIT page), so memory stays constant, no read transaction is held between
+pages and writers are never blocked for long. Every exported row carries a
+`cursor` value; passing the last one received as `after` resumes the export
+right behind it.
+
+Usage:
+  python export.py prices prices.ndjson.gz [--format ndjson|csv] [--since T] [--until T]
+                   [--url-prefix P] [--after CURSOR]
+  python export.py orders orders.csv.gz --format csv [--since T] [--until T] [--after CURSOR]
+
+T is epoch seconds or an ISO date/datetime. Output ending in .gz is gzip-compressed;
+"-" writes to stdout.
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import sys
+from json.encoder import encode_basestring
+
+from database import PRICE_SCALE, get_db_connection
+
+PAGE_ROWS = 5000
+
+PRICE_FIELDS = ["cursor", "product_id", "url", "name", "ts", "price"]
+ORDER_FIELDS = [
+    "cursor", "order_id", "user_id", "product_name", "order_status", "sustainability_score",
+    "carbon_credits", "is_sustainable", "purchase_date", "streak_awarded",
+]
+FIELDS = {"prices": PRICE_FIELDS, "orders": ORDER_FIELDS}
+
+
+def _json_value(value):
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def price_ndjson_line(row):
+    # Hand-built line: ~5x faster than json.dumps on a dict, and prices are most of the data
+    cursor, product_id, url, name, ts, price = row
+    return (
+        f'{{"cursor":"{cursor}","product_id":{product_id},"url":{_json_value(url)},'
+        f'"name":{_json_value(name)},"ts":{ts},"price":{price!r}}}'
+    )
+
+
+def generic_ndjson_line(fields):
+    prefixes = ['{"%s":' % fields[0]] + [',"%s":' % f for f in fields[1:]]
+
+    def line(row):
+        return "".join([p + _json_value(v) for p, v in zip(prefixes, row)]) + "}"
+    return line
+
+
+def parse_time(value):
+    """Epoch seconds from epoch seconds or an ISO date/datetime string; None passes through."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+
+
+def iter_prices(since=None, until=None, url_prefix=None, after=None, page_rows=PAGE_ROWS):
+    """
+    Price rows (tuples in PRICE_FIELDS order) ordered by (product_id, ts).
+    `after` is a "product_id:ts" cursor. since/until are epoch seconds
+    (inclusive / exclusive).
+    """
+    last_id, last_ts = (int(x) for x in after.split(":")) if after else (-1, -1)
+    where = ["(pr.product_id, pr.ts) > (?, ?)"]
+    params = []
+    if since is not None:
+        where.append("pr.ts >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("pr.ts < ?")
+        params.append(until)
+    if url_prefix:
+        # Range scan instead of LIKE so the canonical_url index applies
+        where.append("p.canonical_url >= ? AND p.canonical_url < ?")
+        params.extend([url_prefix, url_prefix + "\U0010ffff"])
+    sql = f'''
+        SELECT pr.product_id, pr.ts, pr.price_minor, p.canonical_url, p.name
+        FROM prices pr JOIN products p ON p.product_id = pr.product_id
+        WHERE {" AND ".join(where)}
+        ORDER BY pr.product_id, pr.ts
+        LIMIT ?
+    '''
+
+    conn = get_db_connection()
+    conn.row_factory = None
+    try:
+        while True:
+            rows = conn.execute(sql, [last_id, last_ts] + params + [page_rows]).fetchall()
+            for product_id, ts, minor, url, name in rows:
+                yield (f"{product_id}:{ts}", product_id, url, name, ts, minor / PRICE_SCALE)
+            if len(rows) < page_rows:
+                return
+            last_id, last_ts = rows[-1][0], rows[-1][1]
+    finally:
+        conn.close()
+
+
+def iter_orders(since=None, until=None, after=None, page_rows=PAGE_ROWS):
+    """
+    Order rows (tuples in ORDER_FIELDS order) ordered by rowid. `after` is a
+    rowid cursor. since/until are epoch seconds, compared against purchase_date.
+    """
+    last = int(after) if after else 0
+    where = ["rowid > ?"]
+    params = []
+    if since is not None:
+        where.append("purchase_date >= ?")
+        params.append(datetime.date.fromtimestamp(since).isoformat())
+    if until is not None:
+        where.append("purchase_date < ?")
+        params.append(datetime.date.fromtimestamp(until).isoformat())
+    sql = f'''
+        SELECT rowid, {", ".join(ORDER_FIELDS[1:])} FROM orders
+        WHERE {" AND ".join(where)}
+        ORDER BY rowid
+        LIMIT ?
+    '''
+
+    conn = get_db_connection()
+    conn.row_factory = None
+    try:
+        while True:
+            rows = conn.execute(sql, [last] + params + [page_rows]).fetchall()
+            for row in rows:
+                yield (str(row[0]),) + row[1:]
+            if len(rows) < page_rows:
+                return
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def iter_table(table, since=None, until=None, url_prefix=None, after=None):
+    if table == "prices":
+        return iter_prices(since, until, url_prefix, after)
+    if table == "orders":
+        return iter_orders(since, until, after)
+    raise ValueError(f"unknown table {table!r}")
+
+
+def iter_ndjson(rows, to_line, batch=500):
+    """NDJSON text, a few hundred lines per yielded string."""
+    lines = []
+    for row in rows:
+        lines.append(to_line(row))
+        if len(lines) >= batch:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_csv(rows, fields, batch=500):
+    """CSV text with a header line, a few hundred rows per yielded string."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_export(table, fmt="ndjson", **filters):
+    rows = iter_table(table, **filters)
+    if fmt == "csv":
+        return iter_csv(rows, FIELDS[table])
+    if fmt == "ndjson":
+        to_line = price_ndjson_line if table == "prices" else generic_ndjson_line(FIELDS[table])
+        return iter_ndjson(rows, to_line)
+    raise ValueError(f"unknown format {fmt!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export prices or orders as CSV/NDJSON.")
+    parser.add_argument("table", choices=sorted(FIELDS))
+    parser.add_argument("output", help='file path (".gz" to compress) or "-" for stdout')
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--since")
+    parser.add_argument("--until")
+    parser.add_argument("--url-prefix")
+    parser.add_argument("--after", help="resume after this cursor value")
+    args = parser.parse_args()
+
+    chunks = iter_export(
+        args.table, args.format,
+        since=parse_time(args.since), until=parse_time(args.until),
+        url_prefix=args.url_prefix, after=args.after,
+    )
+    if args.output == "-":
+        out = sys.stdout
+    elif args.output.endswith(".gz"):
+        out = gzip.open(args.output, "wt", encoding="utf-8", newline="", compresslevel=6)
+    else:
+        out = open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
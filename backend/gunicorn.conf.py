@@ -0,0 +1,22 @@
+# gunicorn -c gunicorn.conf.py app:app
+#
+# Every worker is a separate process with its own near-duplicate index and
+# LLM scheduler (its share of the configured limits); scores, classifications and the last price per product are
+# shared between workers through the SQLite cache in SHARED_CACHE_PATH.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Workers inherit the master's environment; app.py splits the LLM limits by it
+os.environ["WEB_CONCURRENCY"] = str(workers)
+# Most request time is spent waiting on Groq, so each worker also runs threads
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# No preload_app: app.py starts thread pools and loads the near-duplicate
+# snapshot at import time, which must happen in each worker, not the master.
+preload_app = False
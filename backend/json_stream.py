@@ -0,0 +1,226 @@
+import json
+import re
+
+_OPEN_RE = re.compile(r"[{\[]")
+_STRING_RE = re.compile(r'["\\]')
+_STRUCT_RE = re.compile(r'[{}\[\]",]')
+_NON_SPACE_RE = re.compile(r"\S")
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for JSON embedded in a streamed LLM completion.
+
+    Feed text chunks as they arrive with feed(). Any prose before the JSON
+    is skipped, and parsing stops as soon as the target value closes, so
+    whatever the model writes afterwards never has to be downloaded.
+
+    target="object": finds the first top-level {...} accepted by `accept`.
+    target="array":  finds the first top-level [...] accepted by `accept`
+                     and hands out each element that passes `accept_element`
+                     as soon as it is complete (so elements of a prose array
+                     like "[1, 2]" are not, and a stray "note" in the answer
+                     doesn't hide the objects after it).
+
+    A candidate that never closes (an unbalanced "{" in prose, e.g. ":-{")
+    is given up at finish(), and the scan restarts at the next bracket.
+    """
+
+    def __init__(self, target="object", accept=None, accept_element=None):
+        if target not in ("object", "array"):
+            raise ValueError("target must be 'object' or 'array'")
+        self.target = target
+        self.accept = accept
+        self.accept_element = accept_element
+        self.done = False
+        self.result = None
+        self.elements = []
+        self._last_object = None
+
+        self._buf = ""
+        self._pos = 0
+        self._start = None      # index of the opening bracket of the current value
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._elem_start = None  # array mode: start of the current element
+
+    def feed(self, chunk: str) -> list:
+        """
+        Add more completion text.
+        Returns the list of array elements completed by this chunk
+        (always empty in object mode).
+        """
+        if self.done or not chunk:
+            return []
+
+        self._buf += chunk
+        emitted = []
+        self._scan(emitted)
+        return emitted
+
+    def _scan(self, emitted):
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+
+        while i < n and not self.done:
+            if self._start is None:
+                # Still in the prose before the JSON
+                m = _OPEN_RE.search(buf, i)
+                if m is None:
+                    i = n
+                    break
+                self._begin(m.start())
+                i = m.end()
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                m = _STRING_RE.search(buf, i)
+                if m is None:
+                    i = n
+                    break
+                i = m.end()
+                if m.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            array_mode = self._array_mode()
+            if array_mode and self._depth == 1 and self._elem_start is None:
+                m = _NON_SPACE_RE.search(buf, i)
+                if m is None:
+                    i = n
+                    break
+                if m.group() not in ",]":
+                    self._elem_start = m.start()
+
+            m = _STRUCT_RE.search(buf, i)
+            if m is None:
+                i = n
+                break
+            ch = m.group()
+            i = m.start()
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                self._depth += 1
+            elif ch == "}" or ch == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if array_mode:
+                        self._close_element(i, emitted)
+                    restart = self._close_value(i)
+                    if restart is not None:
+                        i = restart
+                        continue
+            elif ch == "," and array_mode and self._depth == 1:
+                self._close_element(i, emitted)
+            i += 1
+
+        self._pos = i
+        self._compact()
+
+    def finish(self):
+        """
+        Call once the stream has ended. Returns the parsed result,
+        or raises ValueError if no usable JSON was found.
+        """
+        while not self.done and self._start is not None:
+            # The candidate never closed: rescan from just after its bracket
+            self._pos = self._start + 1
+            self._start = None
+            self._scan([])
+        if self.done:
+            return self.result
+        if self.target == "array" and self._last_object is not None:
+            # The model answered with a single object instead of an array
+            return [self._last_object]
+        raise ValueError("no complete JSON %s in completion" % self.target)
+
+    def _array_mode(self):
+        return self.target == "array" and self._buf[self._start] == "["
+
+    def _begin(self, i):
+        self._start = i
+        self._depth = 1
+        self._in_string = False
+        self._escape = False
+        self._elem_start = None
+        self.elements = []
+
+    def _close_element(self, i, emitted):
+        if self._elem_start is None:
+            return
+        raw = self._buf[self._elem_start:i].strip()
+        self._elem_start = None
+        if not raw:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return  # malformed element, skip it and keep the rest of the array
+        if self.accept_element is not None and not self.accept_element(value):
+            return  # not an element we are looking for: skip it, keep the rest
+        self.elements.append(value)
+        emitted.append(value)
+
+    def _close_value(self, i):
+        raw = self._buf[self._start:i + 1]
+        start = self._start
+        self._start = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            if self._array_mode_for(raw):
+                # Elements already handed out are still valid
+                self._finish_with(list(self.elements))
+                return None
+            # Not JSON after all (e.g. "{braces}" in prose): rescan after it
+            return start + 1
+
+        if self.target == "array":
+            if isinstance(value, list) and (self.accept is None or self.accept(value)):
+                self._finish_with(value)
+            elif isinstance(value, dict):
+                self._last_object = value
+            return None
+
+        if isinstance(value, dict) and (self.accept is None or self.accept(value)):
+            self._finish_with(value)
+        return None
+
+    def _array_mode_for(self, raw):
+        return self.target == "array" and raw.startswith("[") and bool(self.elements)
+
+    def _finish_with(self, value):
+        self.result = value
+        self.done = True
+
+    def _compact(self):
+        # Drop prose we have already scanned past to keep memory flat
+        if self._start is None and self._pos > 0:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+
+def parse_stream(chunks, target="object", accept=None, on_element=None, accept_element=None):
+    """
+    Consume an iterable of text chunks until the target JSON value closes.
+    Stops pulling from `chunks` at that point (early return).
+    on_element, if given, is called with each array element as it is parsed.
+    """
+    parser = IncrementalJSONParser(target=target, accept=accept, accept_element=accept_element)
+    for chunk in chunks:
+        for element in parser.feed(chunk):
+            if on_element is not None:
+                on_element(element)
+        if parser.done:
+            break
+    return parser.finish()
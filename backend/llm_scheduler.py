@@ -0,0 +1,181 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = 0  # popup is waiting: /analyze, /alternatives, /compare_products
+BACKGROUND = 1   # nobody is waiting: /update_order auto-scoring, /classify
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class LLMShed(Exception):
+    """Raised when a call is shed instead of queued; callers fall back to the heuristic."""
+
+    def __init__(self, reason, waited_s=0.0):
+        super().__init__(f"LLM call shed ({reason}) after {waited_s:.2f}s")
+        self.reason = reason
+        self.waited_s = waited_s
+
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """Takes one token (may go negative) and returns how long to wait for it."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class LLMScheduler:
+    """
+    Central admission control for Groq calls.
+
+    - a global semaphore caps concurrent calls (max_concurrency)
+    - per-user token buckets cap the call rate (user_rate calls/s, user_burst)
+    - waiting calls are served strictly by priority, FIFO within a priority
+    - a call that would wait longer than its max_wait is shed (LLMShed),
+      either up front (rate limit / estimated queue time) or on timeout
+
+    Queue wait times and shed counts are kept per priority for stats().
+    """
+
+    def __init__(self, max_concurrency=4, user_rate=2.0, user_burst=10.0, max_wait=None):
+        self.max_concurrency = max_concurrency
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_wait = max_wait or {INTERACTIVE: 2.0, BACKGROUND: 15.0}
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._hold_ewma = 1.0  # seconds a call keeps its slot, smoothed
+
+        self._buckets_lock = threading.Lock()
+        self._buckets = {}
+
+        self._stats = {
+            p: {"admitted": 0, "shed": {}, "wait_total": 0.0, "wait_max": 0.0, "recent": deque(maxlen=500)}
+            for p in PRIORITY_NAMES
+        }
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, user_id=None, max_wait=None):
+        """Holds one LLM slot for the duration of the block. Yields the queue wait in seconds."""
+        waited = self.acquire(priority, user_id, max_wait)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - started)
+
+    def acquire(self, priority=INTERACTIVE, user_id=None, max_wait=None):
+        t0 = time.monotonic()
+        if max_wait is None:
+            max_wait = self.max_wait.get(priority, 2.0)
+        deadline = t0 + max_wait
+
+        if user_id is not None and self.user_rate:
+            self._take_token(user_id, priority, t0, deadline)
+
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    if self._queue[0] == entry and self._active < self.max_concurrency:
+                        heapq.heappop(self._queue)
+                        self._active += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMShed("queue_timeout", time.monotonic() - t0)
+                    if self._expected_wait(entry) > remaining:
+                        raise LLMShed("queue_full", time.monotonic() - t0)
+                    self._cond.wait(remaining)
+            except LLMShed as shed:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                self._record_shed(priority, shed.reason)
+                raise
+            # The next waiter may be able to go too
+            self._cond.notify_all()
+
+        waited = time.monotonic() - t0
+        self._record_wait(priority, waited)
+        return waited
+
+    def release(self, held_s=None):
+        with self._cond:
+            self._active -= 1
+            if held_s is not None:
+                self._hold_ewma = 0.8 * self._hold_ewma + 0.2 * held_s
+            self._cond.notify_all()
+
+    def _expected_wait(self, entry):
+        # Slots that must free up before this entry runs, times the average hold time
+        ahead = sum(1 for e in self._queue if e < entry)
+        needed = ahead + 1 - (self.max_concurrency - self._active)
+        if needed <= 0:
+            return 0.0
+        return needed / self.max_concurrency * self._hold_ewma
+
+    def _take_token(self, user_id, priority, t0, deadline):
+        with self._buckets_lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                if len(self._buckets) > 10_000:
+                    self._buckets.clear()  # bounded memory; buckets refill anyway
+                bucket = self._buckets[user_id] = _TokenBucket(self.user_rate, self.user_burst)
+            wait = bucket.reserve(t0)
+            if t0 + wait > deadline:
+                bucket.refund()
+                self._record_shed(priority, "rate_limited")
+                raise LLMShed("rate_limited")
+        if wait:
+            time.sleep(wait)
+
+    def _record_wait(self, priority, waited):
+        with self._cond:
+            s = self._stats[priority]
+            s["admitted"] += 1
+            s["wait_total"] += waited
+            s["wait_max"] = max(s["wait_max"], waited)
+            s["recent"].append(waited)
+
+    def _record_shed(self, priority, reason):
+        with self._cond:
+            shed = self._stats[priority]["shed"]
+            shed[reason] = shed.get(reason, 0) + 1
+
+    def stats(self):
+        with self._cond:
+            out = {
+                "maxConcurrency": self.max_concurrency,
+                "active": self._active,
+                "queued": len(self._queue),
+                "avgCallSeconds": round(self._hold_ewma, 3),
+            }
+            for p, s in self._stats.items():
+                recent = sorted(s["recent"])
+                out[PRIORITY_NAMES[p]] = {
+                    "admitted": s["admitted"],
+                    "shed": dict(s["shed"]),
+                    "avgWaitMs": round(1000 * s["wait_total"] / s["admitted"], 1) if s["admitted"] else None,
+                    "p95WaitMs": round(1000 * recent[int(0.95 * (len(recent) - 1))], 1) if recent else None,
+                    "maxWaitMs": round(1000 * s["wait_max"], 1),
+                }
+            return out
@@ -0,0 +1,218 @@
+import datetime
+import threading
+from collections import defaultdict, deque
+
+from llm_scheduler import LLMShed
+from structured_log import get_logger
+
+log = get_logger("llm_usage")
+
+PROMPT_SIZE_BUCKETS = (500, 1000, 2000)  # prompt tokens; latency is reported per bucket
+
+
+def parse_budgets(spec):
+    """"ai_score=2000000,classify=200000" -> {"ai_score": 2000000, "classify": 200000}."""
+    budgets = {}
+    for part in (spec or "").split(","):
+        site, _, tokens = part.partition("=")
+        if site.strip() and tokens.strip():
+            budgets[site.strip()] = int(tokens)
+    return budgets
+
+
+def _today():
+    return datetime.date.today().isoformat()
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+class LLMUsage:
+    """
+    Token, latency and cost accounting of LLM calls, per call site and user.
+
+    record() adds one call to per-day counters kept in memory for the last
+    `keep_days` days. Every `flush_s` seconds a background thread hands the
+    counts added since the last flush to persist(rows), which adds them to
+    storage and returns today's stored tokens per call site. Those totals
+    include what other worker processes used, so the daily budgets (total
+    tokens per call site and day) hold across workers.
+
+    check_budget(site) raises LLMShed("budget") once a call site's budget for
+    the day is used up; callers already fall back to the heuristic on it.
+    """
+
+    def __init__(self, budgets=None, price_per_m=None, persist=None, flush_s=60, keep_days=7, keep_calls=200):
+        self.budgets = dict(budgets or {})
+        # USD per million (prompt, completion) tokens
+        self.price_per_m = price_per_m or (0.0, 0.0)
+        self.persist = persist
+        self.flush_s = flush_s
+        self.keep_days = keep_days
+
+        self._lock = threading.Lock()
+        self._sites = defaultdict(self._counter)    # (day, site) -> counter
+        self._users = defaultdict(self._counter)    # (day, site, user) -> counter
+        self._unflushed = defaultdict(self._counter)
+        self._stored_today = {}                     # site -> tokens stored by all workers
+        self._stored_day = _today()
+        self._day = _today()                        # day of the latest record, for expiry
+        self._recent = defaultdict(lambda: deque(maxlen=keep_calls))  # site -> (prompt, completion, seconds)
+        self.shed = defaultdict(int)
+        self.flushes = 0
+        self.flush_errors = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _counter():
+        return {"calls": 0, "errors": 0, "estimated": 0, "promptTokens": 0, "completionTokens": 0, "seconds": 0.0}
+
+    @staticmethod
+    def _add(counter, prompt, completion, seconds, error, estimated):
+        counter["calls"] += 1
+        counter["errors"] += int(error)
+        counter["estimated"] += int(estimated)
+        counter["promptTokens"] += prompt
+        counter["completionTokens"] += completion
+        counter["seconds"] += seconds
+
+    def record(self, site, user_id, prompt_tokens, completion_tokens, seconds, error=False, estimated=False):
+        """One finished (or failed) call. estimated: the token counts are guesses, the API reported none."""
+        day = _today()
+        with self._lock:
+            self._add(self._sites[(day, site)], prompt_tokens, completion_tokens, seconds, error, estimated)
+            self._add(self._users[(day, site, user_id or "")], prompt_tokens, completion_tokens, seconds, error, estimated)
+            self._add(self._unflushed[(day, site, user_id or "")], prompt_tokens, completion_tokens, seconds, error, estimated)
+            if not error:
+                self._recent[site].append((prompt_tokens, completion_tokens, seconds))
+            self._expire(day)
+
+    def _expire(self, today):
+        if today == self._day:
+            return
+        self._day = today
+        oldest = (datetime.date.fromisoformat(today) - datetime.timedelta(days=self.keep_days - 1)).isoformat()
+        for store in (self._sites, self._users):
+            for key in [k for k in store if k[0] < oldest]:
+                del store[key]
+
+    def tokens_today(self, site):
+        """Tokens used today by `site`: stored totals of all workers plus what this worker hasn't flushed."""
+        day = _today()
+        with self._lock:
+            stored = self._stored_today.get(site, 0) if self._stored_day == day else 0
+            unflushed = sum(
+                c["promptTokens"] + c["completionTokens"]
+                for (d, s, _), c in self._unflushed.items() if d == day and s == site
+            )
+            if self.persist is None:
+                c = self._sites.get((day, site))
+                return c["promptTokens"] + c["completionTokens"] if c else 0
+            return stored + unflushed
+
+    def check_budget(self, site):
+        budget = self.budgets.get(site)
+        if budget is not None and self.tokens_today(site) >= budget:
+            with self._lock:
+                self.shed[site] += 1
+            raise LLMShed("budget")
+
+    def flush(self):
+        """Persists the counts recorded since the last flush. Returns the number of rows written."""
+        if self.persist is None:
+            return 0
+        with self._lock:
+            rows, self._unflushed = self._unflushed, defaultdict(self._counter)
+        try:
+            stored = self.persist([(day, site, user, c) for (day, site, user), c in rows.items()])
+        except Exception as e:
+            # Put the counts back so the next flush retries them
+            with self._lock:
+                for key, c in rows.items():
+                    target = self._unflushed[key]
+                    for field, value in c.items():
+                        target[field] += value
+                self.flush_errors += 1
+            log.warning("LLM usage flush failed: %s", e)
+            return 0
+        with self._lock:
+            self._stored_today, self._stored_day = stored, _today()
+            self.flushes += 1
+        return len(rows)
+
+    def _loop(self):
+        while not self._stop.wait(self.flush_s):
+            self.flush()
+
+    def start(self):
+        if self._thread is None and self.persist is not None:
+            self._thread = threading.Thread(target=self._loop, name="llm-usage-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def cost(self, prompt_tokens, completion_tokens):
+        return (prompt_tokens * self.price_per_m[0] + completion_tokens * self.price_per_m[1]) / 1e6
+
+    def _summary(self, c):
+        tokens = c["promptTokens"] + c["completionTokens"]
+        return dict(
+            c,
+            seconds=round(c["seconds"], 3),
+            totalTokens=tokens,
+            costUsd=round(self.cost(c["promptTokens"], c["completionTokens"]), 6),
+            avgLatencyMs=round(c["seconds"] / c["calls"] * 1000, 1) if c["calls"] else None,
+        )
+
+    def _latency_by_prompt_size(self, site):
+        buckets = defaultdict(list)
+        for prompt, _, seconds in self._recent[site]:
+            bucket = next((f"<{b}" for b in PROMPT_SIZE_BUCKETS if prompt < b), f">={PROMPT_SIZE_BUCKETS[-1]}")
+            buckets[bucket].append(seconds)
+        return {
+            bucket: {"calls": len(s), "p50Ms": round(_percentile(s, .5) * 1000, 1),
+                     "p95Ms": round(_percentile(s, .95) * 1000, 1)}
+            for bucket, s in buckets.items()
+        }
+
+    def stats(self, top_users=20):
+        """Today per call site (with budget left) and top users, plus the days kept in memory."""
+        day = _today()
+        with self._lock:
+            sites = sorted({s for _, s in self._sites} | set(self.budgets))
+        today = {}
+        for site in sites:
+            used = self.tokens_today(site)
+            with self._lock:
+                summary = self._summary(self._sites.get((day, site)) or self._counter())
+                summary["latencyByPromptTokens"] = self._latency_by_prompt_size(site)
+                summary["shedByBudget"] = self.shed.get(site, 0)
+            budget = self.budgets.get(site)
+            summary["budget"] = budget
+            summary["budgetUsedTokens"] = used
+            summary["budgetLeft"] = max(0, budget - used) if budget is not None else None
+            today[site] = summary
+        with self._lock:
+            users = sorted(
+                ((u, s, c) for (d, s, u), c in self._users.items() if d == day and u),
+                key=lambda x: -(x[2]["promptTokens"] + x[2]["completionTokens"]),
+            )[:top_users]
+            by_day = defaultdict(dict)
+            for (d, s), c in sorted(self._sites.items()):
+                by_day[d][s] = self._summary(c)
+            return {
+                "day": day,
+                "today": today,
+                "topUsers": [dict(self._summary(c), user=u, site=s) for u, s, c in users],
+                "days": dict(by_day),
+                "pricePerMTokensUsd": {"prompt": self.price_per_m[0], "completion": self.price_per_m[1]},
+                "flushes": self.flushes,
+                "flushErrors": self.flush_errors,
+            }
+
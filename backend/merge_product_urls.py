@@ -0,0 +1,26 @@
+"""
+Re-keys stored product URLs with the current rules in urls.py and merges the
+price series of products that now share a canonical URL.
+
+init_db() does this by itself once per URL_RULES_VERSION; run this to see
+what it would change first, or to force a pass (e.g. after editing a rule's
+pattern without bumping the version).
+
+Usage:
+  python merge_product_urls.py            # dry run: counts only, nothing written
+  python merge_product_urls.py --apply
+"""
+import sys
+import time
+
+from database import get_db_connection, merge_duplicate_products
+
+if __name__ == "__main__":
+    apply = "--apply" in sys.argv[1:]
+    conn = get_db_connection()
+    t0 = time.perf_counter()
+    summary = merge_duplicate_products(conn, dry_run=not apply, force=True)
+    conn.close()
+    print(("applied" if apply else "dry run") + ": "
+          + ", ".join(f"{k} {v}" for k, v in summary.items())
+          + f" in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
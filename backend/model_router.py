@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from collections import deque
+
+from structured_log import get_logger
+
+log = get_logger("model_router")
+
+
+def load_routes(spec=None, path=None, default_model=None, default_timeout_s=10.0):
+    """
+    Routes from JSON: {"<call site>": [{"model": ..., "timeout_s": ...}, ...], "default": [...]}.
+    `path` (a JSON file) wins over `spec` (a JSON string). Without either, every
+    call site uses default_model. Call sites without a route use "default".
+    """
+    routes = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            routes = json.load(f)
+    elif spec:
+        routes = json.loads(spec)
+    if "default" not in routes:
+        routes["default"] = [{"model": default_model, "timeout_s": default_timeout_s}]
+    for site, models in routes.items():
+        if not models or not all(m.get("model") for m in models):
+            raise ValueError(f"route {site!r} needs at least one model")
+        for m in models:
+            m["timeout_s"] = float(m.get("timeout_s", default_timeout_s))
+    return routes
+
+
+class _Health:
+    def __init__(self, window):
+        self.calls = deque(maxlen=window)  # (seconds, ok)
+        self.last_try = 0.0
+        self.probing = False
+
+    def error_rate(self):
+        return sum(not ok for _, ok in self.calls) / len(self.calls) if self.calls else 0.0
+
+    def p95(self):
+        if not self.calls:
+            return None
+        values = sorted(s for s, _ in self.calls)
+        return values[min(len(values) - 1, int(0.95 * len(values)))]
+
+
+class ModelRouter:
+    """
+    Picks the model for an LLM call from the call site's ordered route.
+
+    Each model keeps its last `window` calls (latency, success); an attempt
+    that times out or fails before producing text is recorded as a failure
+    with the model's timeout as its latency. A model is degraded when, over at
+    least `min_calls` recent calls, its error rate is above `max_error_rate`
+    or its p95 latency is above `slow_ratio` times its timeout.
+
+    candidates() returns the healthy models in route order, then the degraded
+    ones, so callers fail over down the list and finally to the heuristic.
+    Once every `probe_interval_s` a degraded model is put back in front for
+    one call; if that call succeeds its history starts over.
+    """
+
+    def __init__(self, routes, window=50, min_calls=5, max_error_rate=0.5, slow_ratio=0.8, probe_interval_s=30.0):
+        self.routes = routes
+        self.window = window
+        self.min_calls = min_calls
+        self.max_error_rate = max_error_rate
+        self.slow_ratio = slow_ratio
+        self.probe_interval_s = probe_interval_s
+        self._health = {}
+        self._lock = threading.Lock()
+        self.failovers = 0
+
+    def route(self, site):
+        return self.routes.get(site) or self.routes["default"]
+
+    def _get(self, model):
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = _Health(self.window)
+        return health
+
+    def _degraded(self, health, timeout_s):
+        if len(health.calls) < self.min_calls:
+            return False
+        return health.error_rate() > self.max_error_rate or health.p95() > self.slow_ratio * timeout_s
+
+    def candidates(self, site):
+        """[(model, timeout_s)] to try in order for one call."""
+        now = time.monotonic()
+        healthy, degraded = [], []
+        with self._lock:
+            for m in self.route(site):
+                health = self._get(m["model"])
+                (degraded if self._degraded(health, m["timeout_s"]) else healthy).append((m, health))
+            # Half-open: let one call through to the stalest degraded model
+            if degraded and healthy:
+                m, health = min(degraded, key=lambda d: d[1].last_try)
+                if now - health.last_try >= self.probe_interval_s:
+                    degraded.remove((m, health))
+                    healthy.insert(0, (m, health))
+                    health.probing = True
+            for m, health in healthy[:1]:
+                health.last_try = now
+        return [(m["model"], m["timeout_s"]) for m, _ in healthy + degraded]
+
+    def record(self, model, seconds, ok):
+        with self._lock:
+            health = self._get(model)
+            if health.probing:
+                health.probing = False
+                if ok:
+                    health.calls.clear()
+            health.calls.append((seconds, ok))
+
+    def failed_over(self, site, model, error):
+        with self._lock:
+            self.failovers += 1
+        log.warning("Model %s failed for %s, trying the next one: %s", model, site, error)
+
+    def stats(self):
+        with self._lock:
+            models = {
+                model: {
+                    "calls": len(h.calls),
+                    "errorRate": round(h.error_rate(), 3),
+                    "p95Ms": round(h.p95() * 1000, 1) if h.calls else None,
+                }
+                for model, h in self._health.items()
+            }
+            return {
+                "routes": {site: [dict(m) for m in models_] for site, models_ in self.routes.items()},
+                "models": models,
+                "failovers": self.failovers,
+            }
@@ -0,0 +1,351 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+
+from scoring import MATERIALS, detect_materials
+from structured_log import get_logger
+
+log = get_logger("near_duplicates")
+
+# -----------------------------
+# Title normalization
+# -----------------------------
+
+SIZE_TOKENS = {
+    "xxs", "xs", "s", "m", "l", "xl", "xxl", "xxxl", "2xl", "3xl", "4xl", "5xl",
+    "small", "medium", "large", "regular", "petite", "plus", "size", "sizes",
+}
+
+# Only words that name a colour and nothing else: "cream", "orange", "rose",
+# "gold", "coffee" etc. are also products or materials and stay in the title.
+COLOUR_TOKENS = {
+    "black", "white", "grey", "gray", "blue", "navy", "teal", "turquoise", "green",
+    "red", "maroon", "burgundy", "pink", "yellow", "beige", "khaki", "brown",
+    "purple", "violet", "magenta", "multicolor", "multicolour", "colour", "color",
+}
+
+STOP_TOKENS = {"a", "an", "and", "the", "for", "with", "of", "in", "by", "to", "pack", "set"}
+
+# Phrases that only exist on the listing, never on the product
+_NOISE_RE = re.compile(
+    r"amazon'?s choice|best ?seller|limited time deal|deal of the day|sponsored|"
+    r"new arrival|free (?:delivery|shipping)|flipkart assured|\(renewed\)|"
+    r"\b(?:sale|offer|combo offer|trending|hot deal)\b"
+)
+# "Size: M", "size-XL", "UK 8", "EU 42", "Free Size": only real size values
+# after the marker, so "UK Wool Scarf" or "Made in US" keep their words
+_SIZE_RE = re.compile(
+    r"\b(?:size|uk|us|eu|ind)\s*[:\-]?\s*(?:\d+(?:\.\d+)?|x{0,3}[sml]|[2-5]xl)\b|\bfree[\s\-]?size\b"
+)
+# "Pack of 3", "set of 2", "3 pcs", "2-pack"
+_COUNT_RE = re.compile(
+    r"\b(?:pack|set|combo|box) of \d+\b|\b\d+\s*-?\s*(?:pcs|pc|pieces|piece|pack|units?|count|ct|pairs?)\b"
+)
+# "500 ml", "1.5L", "30 cm", "250g"
+_MEASURE_RE = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:ml|l|ltr|litre|liter|g|gm|gms|kg|cm|mm|m|inch|inches|in|oz|w)\b"
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# Bumped when normalize_title() changes: signatures in older snapshots were
+# computed from differently normalized titles and are not loaded.
+NORMALIZE_VERSION = 2
+
+
+def normalize_title(title: str) -> str:
+    """
+    Strips variant tokens from a product title so that size/colour/pack
+    variants of one product normalize to the same string.
+    "Roadster Men Blue Cotton T-shirt, Size M (Pack of 2)" -> "roadster men cotton t-shirt"
+    """
+    if not title:
+        return ""
+    lower = title.lower()
+    lower = _NOISE_RE.sub(" ", lower)
+    lower = _SIZE_RE.sub(" ", lower)
+    lower = _COUNT_RE.sub(" ", lower)
+    lower = _MEASURE_RE.sub(" ", lower)
+
+    tokens = []
+    for tok in _TOKEN_RE.findall(lower):
+        if tok in SIZE_TOKENS or tok in COLOUR_TOKENS or tok in STOP_TOKENS:
+            continue
+        tokens.append(tok)  # numbers left after the size/count/measure rules are model numbers
+    return " ".join(tokens)
+
+
+def title_shingles(normalized: str) -> set:
+    """Word unigrams + bigrams of a normalized title."""
+    tokens = normalized.split()
+    shingles = set(tokens)
+    shingles.update(a + " " + b for a, b in zip(tokens, tokens[1:]))
+    return shingles
+
+
+_MATERIAL_BITS = {m: i for i, m in enumerate(sorted(set(MATERIALS)))}
+
+
+def material_mask(title: str) -> int:
+    """Bitmask of the detected materials; variants must agree on it exactly."""
+    mask = 0
+    for m in detect_materials(title):
+        mask |= 1 << _MATERIAL_BITS[m]
+    return mask
+
+
+# -----------------------------
+# MinHash / LSH index
+# -----------------------------
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+
+
+class NearDuplicateIndex:
+    """
+    In-memory MinHash/LSH index over previously scored product titles.
+
+    Each entry keeps a b-bit (1 byte per hash) MinHash signature, the material
+    bitmask and a JSON payload (the stored score). The LSH buckets of all bands
+    live in one sorted NumPy key array (band number mixed into the key) with a
+    small dict for recent inserts: about 130 bytes of index per title. The
+    stored payload (an /analyze result, ~500 bytes of JSON) comes on top, so a
+    million titles take roughly 630 MB.
+
+    lookup(title) returns the payload of the most similar stored title whose
+    estimated Jaccard similarity is >= threshold and whose materials match,
+    or None.
+    """
+
+    def __init__(self, num_perm=32, bands=8, threshold=0.8, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 31 - 1, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 2 ** 31 - 1, size=num_perm).astype(np.uint64)
+        self._band_mix = rng.randint(1, 2 ** 31 - 1, size=self.rows).astype(np.uint64) | np.uint64(1)
+        self._band_salt = rng.randint(0, 2 ** 62, size=bands, dtype=np.int64).astype(np.uint64)
+
+        self._lock = threading.RLock()
+        self._count = 0
+        self._sigs = np.zeros((1024, num_perm), dtype=np.uint8)
+        self._materials = np.zeros(1024, dtype=np.uint32)
+        self._payloads = []  # JSON-encoded bytes, one per entry
+
+        # LSH buckets: sorted keys + matching ids, plus pending {key: [ids]}
+        self._bucket_keys = np.zeros(0, dtype=np.uint64)
+        self._bucket_ids = np.zeros(0, dtype=np.int32)
+        self._pending = {}
+
+        self.adds_since_save = 0
+
+    def __len__(self):
+        return self._count
+
+    # ---- hashing ----
+
+    def _minhash(self, shingles):
+        x = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        # (a*x + b) mod p for every (permutation, shingle), min over shingles
+        h = (self._a[:, None] * x[None, :] + self._b[:, None]) % _PRIME
+        return h.min(axis=1)
+
+    def _band_keys_for(self, full_sig):
+        rows = full_sig.reshape(self.bands, self.rows)
+        return (rows * self._band_mix).sum(axis=1) + self._band_salt  # wraps mod 2**64
+
+    def _signature(self, title):
+        normalized = normalize_title(title)
+        if not normalized:
+            return None
+        full = self._minhash(title_shingles(normalized))
+        return (full & np.uint64(0xFF)).astype(np.uint8), self._band_keys_for(full)
+
+    # ---- public API ----
+
+    def lookup(self, title: str, accept=None):
+        """
+        Payload of the closest stored variant of `title`, or None.
+        accept(payload) can reject payloads that are not usable by the caller.
+        """
+        sig = self._signature(title)
+        if sig is None:
+            return None
+        sig8, keys = sig
+        mask = material_mask(title)
+
+        with self._lock:
+            candidates = self._candidates(keys)
+            if not candidates:
+                return None
+            ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            ids = ids[self._materials[ids] == mask]
+            if not ids.size:
+                return None
+
+            # b-bit MinHash: correct for the 1/256 chance of equal low bytes
+            agree = (self._sigs[ids] == sig8).mean(axis=1)
+            similarity = (agree - 1 / 256) / (1 - 1 / 256)
+
+            for k in np.argsort(-similarity):
+                if similarity[k] < self.threshold:
+                    break
+                payload = json.loads(self._payloads[ids[k]])
+                if accept is None or accept(payload):
+                    return payload
+        return None
+
+    def add(self, title: str, payload: dict):
+        """
+        Stores a scored product. An identical signature (same normalized
+        title and materials) overwrites the older payload.
+        """
+        sig = self._signature(title)
+        if sig is None:
+            return
+        sig8, keys = sig
+        mask = material_mask(title)
+        blob = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+        with self._lock:
+            for i in self._candidates(keys):
+                if self._materials[i] == mask and np.array_equal(self._sigs[i], sig8):
+                    self._payloads[i] = blob
+                    self.adds_since_save += 1
+                    return
+
+            i = self._count
+            if i == len(self._sigs):
+                self._sigs = np.concatenate([self._sigs, np.zeros_like(self._sigs)])
+                self._materials = np.concatenate([self._materials, np.zeros_like(self._materials)])
+            self._sigs[i] = sig8
+            self._materials[i] = mask
+            self._payloads.append(blob)
+            self._count += 1
+
+            for key in keys.tolist():
+                self._pending.setdefault(key, []).append(i)
+            self.adds_since_save += 1
+
+            if len(self._pending) > max(10_000, self._count // 10):
+                self._compact()
+
+    def _candidates(self, keys):
+        found = set()
+        lo = self._bucket_keys.searchsorted(keys, side="left")
+        hi = self._bucket_keys.searchsorted(keys, side="right")
+        for start, end in zip(lo.tolist(), hi.tolist()):
+            if end > start:
+                found.update(self._bucket_ids[start:end].tolist())
+        if self._pending:
+            for key in keys.tolist():
+                found.update(self._pending.get(key, ()))
+        return found
+
+    def _compact(self):
+        # Merge pending inserts into the sorted bucket arrays
+        if not self._pending:
+            return
+        pending = self._pending
+        new_keys = np.fromiter(
+            (k for k, ids in pending.items() for _ in ids), dtype=np.uint64
+        )
+        new_ids = np.fromiter(
+            (i for ids in pending.values() for i in ids), dtype=np.int32
+        )
+        keys = np.concatenate([self._bucket_keys, new_keys])
+        ids = np.concatenate([self._bucket_ids, new_ids])
+        order = np.argsort(keys, kind="stable")
+        self._bucket_keys = keys[order]
+        self._bucket_ids = ids[order]
+        self._pending = {}
+
+    # ---- persistence ----
+
+    def save(self, path: str):
+        """
+        Writes a snapshot atomically: a unique temp file in the same directory,
+        then a rename. With several processes only one should call this (see
+        worker_lock), or the last writer's entries replace the others'.
+        """
+        with self._lock:
+            self._compact()
+            n = self._count
+            payload_lengths = np.fromiter(map(len, self._payloads), dtype=np.int64, count=n)
+            arrays = {
+                "params": np.array([self.num_perm, self.bands], dtype=np.int64),
+                "normalize_version": np.array([NORMALIZE_VERSION], dtype=np.int64),
+                "threshold": np.array([self.threshold]),
+                "a": self._a,
+                "b": self._b,
+                "band_mix": self._band_mix,
+                "band_salt": self._band_salt,
+                "bucket_keys": self._bucket_keys,
+                "bucket_ids": self._bucket_ids,
+                "sigs": self._sigs[:n].copy(),
+                "materials": self._materials[:n].copy(),
+                "payload_lengths": payload_lengths,
+                "payload_blob": np.frombuffer(b"".join(self._payloads), dtype=np.uint8),
+            }
+            self.adds_since_save = 0
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str, threshold=None):
+        """Loads a snapshot written by save()."""
+        with np.load(path) as data:
+            version = int(data["normalize_version"][0]) if "normalize_version" in data else 1
+            if version != NORMALIZE_VERSION:
+                raise ValueError(f"snapshot normalize_version {version}, expected {NORMALIZE_VERSION}")
+            num_perm, bands = data["params"].tolist()
+            index = cls(num_perm=num_perm, bands=bands,
+                        threshold=threshold if threshold is not None else float(data["threshold"][0]))
+            index._a = data["a"]
+            index._b = data["b"]
+            index._band_mix = data["band_mix"]
+            index._band_salt = data["band_salt"]
+            index._bucket_keys = data["bucket_keys"]
+            index._bucket_ids = data["bucket_ids"]
+
+            sigs = data["sigs"]
+            n = len(sigs)
+            index._count = n
+            index._sigs = np.zeros((max(1024, n * 2), num_perm), dtype=np.uint8)
+            index._sigs[:n] = sigs
+            index._materials = np.zeros(len(index._sigs), dtype=np.uint32)
+            index._materials[:n] = data["materials"]
+
+            blob = data["payload_blob"].tobytes()
+            ends = np.cumsum(data["payload_lengths"]).tolist()
+            starts = [0] + ends[:-1]
+            index._payloads = [blob[s:e] for s, e in zip(starts, ends)]
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: str, **kwargs):
+        if path and os.path.exists(path):
+            try:
+                return cls.load(path, threshold=kwargs.get("threshold"))
+            except Exception as e:
+                log.warning("Could not load near-duplicate snapshot, starting empty: %s", e)
+        return cls(**kwargs)
@@ -0,0 +1,66 @@
+"""
+Offline heuristic pre-scoring for catalog dumps.
+
+Reads one product title per line and writes one JSON object per line:
+  {"name", "numericScore", "grade", "carbonFootprintKg", "waterUsageLiters"}
+
+Usage:
+  python prescore_catalog.py catalog.txt scores.jsonl
+  cat catalog.txt | python prescore_catalog.py - -
+"""
+import json
+import sys
+
+from scoring import BATCH_CHUNK, score_batch
+
+
+def iter_chunks(lines, size):
+    chunk = []
+    for line in lines:
+        chunk.append(line.rstrip("\r\n"))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def prescore(infile, outfile):
+    count = 0
+    for titles in iter_chunks(infile, BATCH_CHUNK):
+        batch = score_batch(titles)
+        rows = zip(
+            titles,
+            batch["numericScore"].tolist(),
+            batch["grade"].tolist(),
+            batch["carbonFootprintKg"].tolist(),
+            batch["waterUsageLiters"].tolist(),
+        )
+        for name, score, grade, carbon, water in rows:
+            outfile.write(json.dumps({
+                "name": name,
+                "numericScore": score,
+                "grade": grade,
+                "carbonFootprintKg": carbon,
+                "waterUsageLiters": water,
+            }, ensure_ascii=False) + "\n")
+        count += len(titles)
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    src, dst = sys.argv[1], sys.argv[2]
+    infile = sys.stdin if src == "-" else open(src, encoding="utf-8")
+    outfile = sys.stdout if dst == "-" else open(dst, "w", encoding="utf-8")
+    try:
+        n = prescore(infile, outfile)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    print(f"scored {n} titles", file=sys.stderr)
@@ -0,0 +1,223 @@
+"""
+Offline batch price forecasting over all tracked products.
+
+Reads the prices table in chunks (ordered by product, then time), fits a
+robust Theil–Sen trend per product over its most recent MAX_POINTS prices,
+vectorized with NumPy across many products at once, and writes one row per
+product to the price_forecast table. /price_trend serves these rows instead of fitting a
+regression per request.
+
+Theil–Sen takes the median of all pairwise slopes, so a single flash-sale
+price or scraping glitch can't flip the trend. The "up"/"down" threshold is
+relative to the product's median price rather than a fixed amount per day.
+
+The web app reruns the job every PRICE_FORECAST_INTERVAL_S in one worker
+(start_schedule); it can also run from cron. /price_trend ignores a
+forecast older than the product's last stored price.
+
+Usage:
+  python price_forecast.py [chunk_rows]
+"""
+import datetime
+import sys
+import threading
+import time
+
+import numpy as np
+
+from database import PRICE_SCALE, get_db_connection, init_db
+from structured_log import get_logger
+
+log = get_logger("price_forecast")
+
+MAX_POINTS = 60             # most recent prices per product used for the fit
+FORECAST_DAYS = 7
+TREND_THRESHOLD = 0.01      # weekly change, relative to the median price, that counts as up/down
+FULL_CONFIDENCE_PAIRS = 45  # pairwise slopes (10 prices) needed for full confidence
+CHUNK_ROWS = 200_000
+BATCH_CELLS = 4_000_000     # pairwise slopes computed per NumPy batch
+
+_SECONDS_PER_DAY = 86_400
+
+
+def nan_median_rows(a):
+    """Row-wise median ignoring NaN (NaN for all-NaN rows); a sort beats np.nanmedian here."""
+    counts = a.shape[1] - np.isnan(a).sum(axis=1)
+    s = np.sort(a, axis=1)  # NaNs sort last
+    rows = np.arange(len(a))
+    lo = s[rows, np.maximum((counts - 1) // 2, 0)]
+    hi = s[rows, np.minimum(counts // 2, a.shape[1] - 1)]
+    return np.where(counts > 0, (lo + hi) / 2, np.nan)
+
+
+def theil_sen_batch(x, y):
+    """
+    Theil–Sen fit of many short series at once.
+    x, y: (G, K) float arrays padded with NaN (x in days, relative to each
+    series' last point). Returns (slope, intercept, agreement, pairs) arrays
+    of shape (G,); intercept is the fitted price at x = 0. agreement is the
+    share of pairwise slopes on the same side of the trend threshold as the
+    median slope; pairs is the number of pairwise slopes used.
+    """
+    k = x.shape[1]
+    i, j = np.triu_indices(k, 1)
+    dx = x[:, j] - x[:, i]
+    dy = y[:, j] - y[:, i]
+    valid = dx > 0  # False for padding (NaN) and same-timestamp duplicates
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = np.where(valid, dy / dx, np.nan)
+    pairs = valid.sum(axis=1)
+
+    has_pairs = pairs > 0
+    slope = np.where(has_pairs, nan_median_rows(slopes), 0.0)
+    intercept = nan_median_rows(y - slope[:, None] * x)
+
+    # Direction of each pairwise slope: -1, 0 (within threshold) or +1
+    scale = nan_median_rows(y)[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weekly = slopes * FORECAST_DAYS / scale
+        median_weekly = slope * FORECAST_DAYS / scale[:, 0]
+    direction = np.sign(np.where(np.abs(weekly) < TREND_THRESHOLD, 0, weekly))
+    median_direction = np.sign(np.where(np.abs(median_weekly) < TREND_THRESHOLD, 0, median_weekly))
+    agree = ((direction == median_direction[:, None]) & valid).sum(axis=1)
+    agreement = np.where(has_pairs, agree / np.maximum(pairs, 1), 0.0)
+
+    return slope, intercept, agreement, pairs
+
+
+def forecast_groups(product_ids, ts, prices, starts, ends, computed_at):
+    """
+    Forecast rows for complete product groups: product_ids[g] owns
+    ts/prices[starts[g]:ends[g]] (ts in epoch seconds).
+    Only the last MAX_POINTS points of each group are used.
+    """
+    starts = np.maximum(starts, ends - MAX_POINTS)
+    lengths = ends - starts
+    rows = []
+
+    # Batches of similar length keep NaN padding small
+    order = np.argsort(lengths, kind="stable")
+    pos = 0
+    while pos < len(order):
+        # Grow the batch while (series x pairs of the widest series) fits the budget
+        end = pos + 1
+        while end < len(order):
+            k_next = int(lengths[order[end]])
+            if (end - pos + 1) * k_next * (k_next - 1) // 2 > BATCH_CELLS:
+                break
+            end += 1
+        batch = order[pos:end]
+        pos = end
+        k = max(int(lengths[batch].max()), 2)
+
+        b_starts, b_lengths = starts[batch], lengths[batch]
+        g = np.repeat(np.arange(len(batch)), b_lengths)
+        col = np.arange(b_lengths.sum()) - np.repeat(np.cumsum(b_lengths) - b_lengths, b_lengths)
+        src = np.repeat(b_starts, b_lengths) + col
+
+        last_t = ts[b_starts + b_lengths - 1]
+        x = np.full((len(batch), k), np.nan)
+        y = np.full((len(batch), k), np.nan)
+        x[g, col] = (ts[src] - last_t[g]) / _SECONDS_PER_DAY
+        y[g, col] = prices[src]
+
+        slope, intercept, agreement, pairs = theil_sen_batch(x, y)
+        forecast = np.maximum(0.0, intercept + slope * FORECAST_DAYS)
+        scale = nan_median_rows(y)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weekly = slope * FORECAST_DAYS / scale
+        confidence = agreement * np.minimum(1.0, pairs / FULL_CONFIDENCE_PAIRS)
+        last_price = prices[b_starts + b_lengths - 1]
+
+        for n, (gi, s, f, c, p, w, lp, lt) in enumerate(zip(
+            batch.tolist(), slope.tolist(), forecast.tolist(), confidence.tolist(),
+            pairs.tolist(), weekly.tolist(), last_price.tolist(), last_t.tolist(),
+        )):
+            if p == 0:
+                trend, s, f, c = "insufficient_data", 0.0, None, 0.0
+            elif w > TREND_THRESHOLD:
+                trend = "up"
+            elif w < -TREND_THRESHOLD:
+                trend = "down"
+            else:
+                trend = "stable"
+            rows.append((int(product_ids[gi]), trend, s, f, round(c, 3), int(b_lengths[n]), lp, lt, computed_at))
+    return rows
+
+
+def run_forecast_job(chunk_rows=CHUNK_ROWS):
+    """Recomputes price_forecast for every product in prices. Returns (rows read, products written)."""
+    init_db()
+    conn = get_db_connection()
+    conn.row_factory = None  # plain tuples: sqlite3.Row costs more than the fit itself
+    computed_at = datetime.datetime.now().isoformat()
+    cursor = conn.execute('SELECT product_id, ts, price_minor FROM prices ORDER BY product_id, ts')
+
+    total_rows = 0
+    out_rows = []
+    carry = None  # rows of the last (possibly incomplete) product of the previous chunk
+    while True:
+        chunk = cursor.fetchmany(chunk_rows)
+        finished = not chunk
+        total_rows += len(chunk)
+        data = np.array(chunk, dtype=np.int64).reshape(-1, 3)
+        if carry is not None:
+            data = np.concatenate([carry, data])
+        if not len(data):
+            break
+
+        # Group boundaries (rows are sorted by product_id)
+        ids = data[:, 0]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        if not finished:
+            # The last product may continue in the next chunk
+            carry = data[starts[-1]:]
+            data, starts = data[:starts[-1]], starts[:-1]
+            if not len(starts):
+                continue
+        else:
+            carry = None
+
+        ends = np.append(starts[1:], len(data))
+        out_rows.extend(forecast_groups(
+            data[starts, 0], data[:, 1], data[:, 2] / PRICE_SCALE, starts, ends, computed_at,
+        ))
+
+        if finished:
+            break
+
+    conn.execute('DELETE FROM price_forecast')
+    conn.executemany('''
+        INSERT INTO price_forecast
+            (product_id, trend, slope, forecast, confidence, points, last_price, last_ts, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', out_rows)
+    conn.commit()
+    conn.close()
+    return total_rows, len(out_rows)
+
+
+def start_schedule(interval_s):
+    """Runs run_forecast_job() every interval_s seconds in a daemon thread."""
+    def loop():
+        while True:
+            time.sleep(interval_s)
+            try:
+                t0 = time.perf_counter()
+                n_rows, n_products = run_forecast_job()
+                log.info("Forecast %d products from %d price rows in %.2fs",
+                         n_products, n_rows, time.perf_counter() - t0)
+            except Exception as e:
+                log.exception("Price forecast job failed: %s", e)
+
+    thread = threading.Thread(target=loop, name="price-forecast", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    chunk = int(sys.argv[1]) if len(sys.argv) > 1 else CHUNK_ROWS
+    t0 = time.perf_counter()
+    n_rows, n_products = run_forecast_job(chunk)
+    elapsed = time.perf_counter() - t0
+    print(f"forecast {n_products} products from {n_rows} price rows in {elapsed:.2f}s", file=sys.stderr)
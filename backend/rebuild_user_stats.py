@@ -0,0 +1,20 @@
+"""
+Recomputes the user_monthly_stats aggregates from the orders table.
+
+handle_streak_update() keeps them current; run this after importing orders,
+changing the savings constants in database.py, or to repair drift.
+
+Usage:
+  python rebuild_user_stats.py [user_id]
+"""
+import sys
+import time
+
+from database import init_db, rebuild_user_monthly_stats
+
+if __name__ == "__main__":
+    user_id = sys.argv[1] if len(sys.argv) > 1 else None
+    init_db()
+    t0 = time.perf_counter()
+    n = rebuild_user_monthly_stats(user_id)
+    print(f"rebuilt {n} user-month rows in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
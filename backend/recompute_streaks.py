@@ -0,0 +1,210 @@
+"""
+Rebuilds streaks and credits of every user from the orders table.
+
+handle_streak_update() applies one status event at a time, so a bug or an
+out-of-order event sequence (delivered after returned, replayed events, ...)
+leaves users' totals wrong for good. This recomputes them from the orders'
+current state, in SQL, a chunk of users at a time:
+
+- an order counts if its status is 'delivered' or 'replaced' (a replacement
+  keeps the award); cancelled/returned/refunded and not yet delivered orders
+  don't
+- counted orders are taken in purchase order (purchase_date, then insertion
+  order); a sustainable one extends the streak, a non-sustainable one resets
+  it. current_streak is the last run, longest_streak the longest one
+- total_carbon_credits is the sum of credits of counted sustainable orders
+- carbon_rewards = floor(total_carbon_credits / 5), never lowered: rewards
+  already granted are not revoked
+
+Streak runs come from a window function: the running count of
+non-sustainable orders numbers the runs, and a run's length is its number of
+sustainable orders. Changed users are written with one UPDATE ... FROM per
+chunk. orders.streak_awarded is realigned and user_monthly_stats rebuilt too.
+
+Usage:
+  python recompute_streaks.py             # dry run: print what would change
+  python recompute_streaks.py --apply     # write the changes
+  [--chunk USERS] [--show N]
+"""
+import argparse
+import sys
+import time
+
+from database import get_db_connection, init_db, rebuild_user_monthly_stats
+
+CHUNK_USERS = 20_000
+COUNTED_STATUSES = "('delivered', 'replaced')"
+COLUMNS = ("current_streak", "longest_streak", "total_carbon_credits", "carbon_rewards")
+
+RECOMPUTE_SQL = f'''
+    WITH counted AS (
+        SELECT o.user_id, o.rowid AS rid, o.purchase_date,
+               COALESCE(o.is_sustainable, 0) = 1 AS sustainable,
+               COALESCE(o.carbon_credits, 0) AS credits
+        FROM orders o
+        WHERE o.user_id > ? AND o.user_id <= ?
+          AND lower(o.order_status) IN {COUNTED_STATUSES}
+    ),
+    numbered AS (
+        SELECT user_id, sustainable, credits,
+               SUM(NOT sustainable) OVER (
+                   PARTITION BY user_id ORDER BY purchase_date, rid ROWS UNBOUNDED PRECEDING
+               ) AS run
+        FROM counted
+    ),
+    runs AS (
+        SELECT user_id, run, SUM(sustainable) AS length, SUM(CASE WHEN sustainable THEN credits ELSE 0 END) AS credits
+        FROM numbered GROUP BY user_id, run
+    ),
+    totals AS (
+        SELECT user_id, MAX(run) AS last_run, MAX(length) AS longest, SUM(credits) AS credits
+        FROM runs GROUP BY user_id
+    )
+    SELECT u.user_id,
+           COALESCE(r.length, 0) AS current_streak,
+           COALESCE(t.longest, 0) AS longest_streak,
+           COALESCE(t.credits, 0.0) AS total_carbon_credits,
+           MAX(COALESCE(u.carbon_rewards, 0), CAST(COALESCE(t.credits, 0) / 5 AS INTEGER)) AS carbon_rewards
+    FROM users u
+    LEFT JOIN totals t ON t.user_id = u.user_id
+    LEFT JOIN runs r ON r.user_id = t.user_id AND r.run = t.last_run
+    WHERE u.user_id > ? AND u.user_id <= ?
+'''
+
+# Only rows that differ, next to the stored values
+DIFF_SQL = '''
+    SELECT n.user_id,
+           u.current_streak, n.current_streak,
+           u.longest_streak, n.longest_streak,
+           u.total_carbon_credits, n.total_carbon_credits,
+           u.carbon_rewards, n.carbon_rewards
+    FROM recomputed n JOIN users u ON u.user_id = n.user_id
+    WHERE u.current_streak IS NOT n.current_streak
+       OR u.longest_streak IS NOT n.longest_streak
+       OR abs(COALESCE(u.total_carbon_credits, 0) - n.total_carbon_credits) > 1e-9
+       OR u.carbon_rewards IS NOT n.carbon_rewards
+'''
+
+APPLY_SQL = '''
+    UPDATE users SET
+        current_streak = n.current_streak,
+        longest_streak = n.longest_streak,
+        total_carbon_credits = n.total_carbon_credits,
+        carbon_rewards = n.carbon_rewards
+    FROM recomputed n
+    WHERE users.user_id = n.user_id AND (
+        users.current_streak IS NOT n.current_streak
+        OR users.longest_streak IS NOT n.longest_streak
+        OR abs(COALESCE(users.total_carbon_credits, 0) - n.total_carbon_credits) > 1e-9
+        OR users.carbon_rewards IS NOT n.carbon_rewards
+    )
+'''
+
+
+def user_chunks(conn, chunk_users):
+    """(low, high] user_id bounds of consecutive chunks of `chunk_users` users."""
+    low = ""
+    while True:
+        row = conn.execute(
+            'SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT 1 OFFSET ?',
+            (low, chunk_users - 1),
+        ).fetchone()
+        if row is None:
+            last = conn.execute('SELECT MAX(user_id) FROM users WHERE user_id > ?', (low,)).fetchone()[0]
+            if last is not None:
+                yield low, last
+            return
+        yield low, row[0]
+        low = row[0]
+
+
+def recompute_user_totals(apply=False, chunk_users=CHUNK_USERS, on_diff=None):
+    """
+    Recomputes every user's streaks and credits. With apply=False only
+    reports; on_diff(user_id, {column: (old, new)}) is called for each user
+    that differs. Returns a summary dict.
+    """
+    conn = get_db_connection()
+    conn.row_factory = None
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS recomputed (
+            user_id TEXT PRIMARY KEY, current_streak INTEGER, longest_streak INTEGER,
+            total_carbon_credits REAL, carbon_rewards INTEGER
+        )
+    ''')
+    summary = {"users": 0, "changed": 0, "ordersRealigned": 0, "usersCreated": 0}
+    changed_by_column = dict.fromkeys(COLUMNS, 0)
+
+    if apply:
+        # Orders whose user row was never created
+        summary["usersCreated"] = conn.execute(
+            'INSERT OR IGNORE INTO users (user_id) SELECT DISTINCT user_id FROM orders'
+        ).rowcount
+        conn.commit()
+    else:
+        summary["usersCreated"] = conn.execute(
+            'SELECT COUNT(DISTINCT user_id) FROM orders WHERE user_id NOT IN (SELECT user_id FROM users)'
+        ).fetchone()[0]
+
+    for low, high in user_chunks(conn, chunk_users):
+        conn.execute('DELETE FROM recomputed')
+        conn.execute('INSERT INTO recomputed ' + RECOMPUTE_SQL, (low, high, low, high))
+        summary["users"] += conn.execute('SELECT COUNT(*) FROM recomputed').fetchone()[0]
+
+        for row in conn.execute(DIFF_SQL):
+            user_id, diffs = row[0], {}
+            for i, column in enumerate(COLUMNS):
+                old, new = row[1 + 2 * i], row[2 + 2 * i]
+                if old != new and not (isinstance(new, float) and abs((old or 0) - new) <= 1e-9):
+                    diffs[column] = (old, new)
+                    changed_by_column[column] += 1
+            summary["changed"] += 1
+            if on_diff is not None:
+                on_diff(user_id, diffs)
+
+        if apply:
+            conn.execute(APPLY_SQL)
+            conn.commit()
+
+    # streak_awarded must say whether an order counts, for later events and the monthly stats
+    awarded = f"(lower(order_status) IN {COUNTED_STATUSES})"
+    if apply:
+        summary["ordersRealigned"] = conn.execute(
+            f'UPDATE orders SET streak_awarded = {awarded} WHERE streak_awarded IS NOT {awarded}'
+        ).rowcount
+        conn.commit()
+    else:
+        summary["ordersRealigned"] = conn.execute(
+            f'SELECT COUNT(*) FROM orders WHERE streak_awarded IS NOT {awarded}'
+        ).fetchone()[0]
+    conn.close()
+
+    if apply:
+        summary["monthlyRows"] = rebuild_user_monthly_stats()
+    summary["changedByColumn"] = changed_by_column
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute user streaks and credits from orders.")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: dry run)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_USERS, help="users per chunk")
+    parser.add_argument("--show", type=int, default=20, help="diffs to print")
+    args = parser.parse_args()
+
+    shown = [0]
+
+    def show(user_id, diffs):
+        if shown[0] < args.show:
+            shown[0] += 1
+            print(user_id, " ".join(f"{c}: {old} -> {new}" for c, (old, new) in diffs.items()))
+
+    init_db()
+    t0 = time.perf_counter()
+    summary = recompute_user_totals(apply=args.apply, chunk_users=args.chunk, on_diff=show)
+    elapsed = time.perf_counter() - t0
+    mode = "applied" if args.apply else "dry run"
+    print(f"{mode}: {summary['changed']} of {summary['users']} users differ "
+          f"({', '.join(f'{c} {n}' for c, n in summary['changedByColumn'].items())}); "
+          f"{summary['ordersRealigned']} orders with wrong streak_awarded; "
+          f"{summary['usersCreated']} users missing; {elapsed:.1f}s", file=sys.stderr)
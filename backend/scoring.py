@@ -0,0 +1,410 @@
+import re
+
+import numpy as np
+
+MATERIALS = [
+    # textiles & natural fibers
+    "cotton", "organic cotton", "egyptian cotton", "bamboo", "hemp", "linen",
+    "jute", "wool", "silk",
+    # synthetics
+    "polyester", "microfiber", "nylon", "acrylic", "viscose",
+    # materials & packaging
+    "plastic", "recycled plastic", "recycled polyester", "rubber", "latex",
+    "leather", "metal", "steel", "aluminum", "glass",
+    # eco labels
+    "recycled", "biodegradable", "compostable", "eco-friendly", "sustainable",
+]
+
+
+MATERIAL_WEIGHTS = {
+    
+    "organic cotton": +4,
+    "bamboo": +4,
+    "hemp": +4,
+    "linen": +3,
+    "jute": +3,
+    "recycled": +3,
+    "recycled plastic": +2,
+    "recycled polyester": +1,
+    "biodegradable": +3,
+    "compostable": +3,
+    "eco-friendly": +2,
+    "sustainable": +2,
+
+    "cotton": +2,
+    "egyptian cotton": +2,
+    "wool": +1,
+    "silk": +1,
+
+    "polyester": -3,
+    "microfiber": -3,
+    "nylon": -3,
+    "acrylic": -3,
+    "viscose": -2,
+    "plastic": -3,
+    "rubber": -1,
+    "latex": -1,
+    "leather": -2,
+}
+
+# Evidence for heuristic_confidence() that names no material; one point
+# each, and they don't change the score. Terms already in MATERIAL_WEIGHTS
+# (recycled, compostable, ...) are not repeated here. Each group has a
+# reason that holds for any catalog:
+POSITIVE_CUES = (
+    # third-party certifications: GOTS (organic textiles), FSC (wood and
+    # paper), Fairtrade, Energy Star (appliance efficiency)
+    "gots", "fsc", "fair trade", "fairtrade", "energy star",
+    # made to stay in use
+    "reusable", "refillable", "repairable", "refurbished",
+    # end of life
+    "zero waste",
+    # origin of the material
+    "organic", "plant-based",
+)
+NEGATIVE_CUES = (
+    # made to be thrown away after one use
+    "disposable", "single use", "single-use",
+    # plastics the table above doesn't name ("faux leather" is PU or PVC)
+    "pvc", "polyurethane", "faux leather", "synthetic",
+    # plastic particles banned in rinse-off cosmetics in several countries
+    "microbeads",
+)
+# The usual English ways of saying a product lacks something: "plastic-free
+# packaging" matches "plastic" (or "pvc") but is evidence the other way.
+# Anchored on word boundaries, so "piano plastic" or "Cotton Free Size"
+# are not negations
+NEGATION_PATTERNS = (
+    r"\b{}[\s-]?free\b(?![\s-]*size)",
+    r"\b(?:no|without)\s+{}",
+    r"\bfree\s+(?:from|of)\s+{}",
+)
+_NEGATION_RE = {
+    kw: re.compile("|".join(p.format(re.escape(kw)) for p in NEGATION_PATTERNS))
+    for kw in (*MATERIAL_WEIGHTS, *POSITIVE_CUES, *NEGATIVE_CUES)
+}
+
+
+def detect_materials(text: str):
+    if not text:
+        return []
+    lower = text.lower()
+    found = [mat for mat in MATERIALS if mat in lower]
+    return sorted(set(found))
+
+
+def compute_heuristic_score(text: str) -> int:
+    """
+    Simple keyword-based sustainability score:
+    positive materials add points, harmful synthetics subtract.
+    Result is clamped to [-10, 10].
+    """
+    if not text:
+        return 0
+
+    lower = text.lower()
+    score = 0
+
+    for kw, weight in MATERIAL_WEIGHTS.items():
+        if kw in lower:
+            score += weight
+
+    if "recycled" in lower and "recycled " not in lower:
+        score += 2
+
+    if score > 10:
+        score = 10
+    if score < -10:
+        score = -10
+    return score
+
+
+def map_score_to_grade(score: int) -> str:
+    if score >= 8:
+        return "A"
+    if score >= 5:
+        return "B"
+    if score >= 2:
+        return "C"
+    if score >= 0:
+        return "D"
+    return "F"
+
+
+def build_explanation(materials, score: int) -> str:
+    parts = []
+
+    if materials:
+        parts.append("Detected materials/keywords: " + ", ".join(materials) + ".")
+
+    if score >= 8:
+        parts.append("Overall this product appears highly eco-friendly based on the detected terms.")
+    elif score >= 5:
+        parts.append("Overall this product shows good sustainability characteristics.")
+    elif score >= 2:
+        parts.append("This product has a mix of positive and neutral sustainability traits.")
+    elif score >= 0:
+        parts.append("This product has mixed or unclear sustainability signals.")
+    else:
+        parts.append("This product likely has notable environmental drawbacks.")
+
+    lower_materials = " ".join(materials).lower() if materials else ""
+
+    if any(x in lower_materials for x in ["bamboo", "hemp", "organic", "recycled", "compostable", "biodegradable"]):
+        parts.append("The presence of natural or recycled materials is a positive sign.")
+    if any(x in lower_materials for x in ["plastic", "polyester", "nylon", "synthetic"]):
+        parts.append("However, plastic or synthetic components can increase carbon footprint and reduce recyclability.")
+
+    return " ".join(parts).strip()
+
+
+CONFIDENT_SUPPORT = 6     # keyword weight at which the evidence counts as strong
+CONFIDENT_WORDS = 30      # longer texts dilute the keywords the score rests on
+CONFIDENT_MARGIN = 2.5    # score points from the nearest grade boundary
+
+
+def _grade_margin(score: int) -> float:
+    """Distance of `score` from the nearest boundary of its grade in map_score_to_grade()."""
+    if score < 0:
+        return -score
+    if score >= 8:
+        return score - 7
+    return min(abs(score - cut) for cut in (-0.5, 1.5, 4.5, 7.5))
+
+
+def heuristic_confidence(text: str, score: int = None) -> float:
+    """
+    How far the heuristic grade of `text` can be trusted, from 0 to 1.
+    Product of four factors:
+      strength   keyword weight supporting the score's sign, POSITIVE_CUES /
+                 NEGATIVE_CUES included at 1 (negated keywords such as
+                 "plastic-free" count against it), up to CONFIDENT_SUPPORT
+      agreement  (supporting - opposing) / (supporting + opposing) evidence
+      length     1 up to CONFIDENT_WORDS words, lower for longer texts and
+                 0.7 for texts under four words
+      margin     distance from the nearest grade boundary, up to CONFIDENT_MARGIN
+    A score of 0 (no evidence either way) has confidence 0.
+    """
+    if not text:
+        return 0.0
+    if score is None:
+        score = compute_heuristic_score(text)
+    if score == 0:
+        return 0.0
+
+    lower = text.lower()
+    sign = 1 if score > 0 else -1
+    # Cues are looked up in the text left after the weighted keywords, so
+    # "organic" in "organic cotton" isn't counted a second time
+    rest = lower
+    found = []
+    for kw, weight in MATERIAL_WEIGHTS.items():
+        if kw in lower:
+            found.append((kw, weight))
+            rest = rest.replace(kw, " ")
+    found += [(cue, 1) for cue in POSITIVE_CUES if cue in rest]
+    found += [(cue, -1) for cue in NEGATIVE_CUES if cue in rest]
+
+    support = against = 0.0
+    for kw, weight in found:
+        if _NEGATION_RE[kw].search(lower):
+            weight = -weight
+        if weight * sign > 0:
+            support += abs(weight)
+        else:
+            against += abs(weight)
+
+    strength = min(1.0, support / CONFIDENT_SUPPORT)
+    agreement = max(0.0, (support - against) / (support + against))
+    words = len(lower.split())
+    length = min(1.0, CONFIDENT_WORDS / words) if words >= 4 else 0.7
+    margin = min(1.0, _grade_margin(score) / CONFIDENT_MARGIN)
+    return round(strength * agreement * length * margin, 4)
+
+
+def clamp(value, min_value, max_value):
+    return max(min_value, min(max_value, value))
+
+
+def fallback_analysis(text: str) -> dict:
+    materials = detect_materials(text)
+    numeric_score = compute_heuristic_score(text)
+    grade = map_score_to_grade(numeric_score)
+    explanation = build_explanation(materials, numeric_score)
+
+    carbon_kg = clamp(abs(numeric_score) * 0.8 + 1, 0.2, 12)
+    water_l = clamp(abs(numeric_score) * 150 + 200, 50, 3000)
+
+    return {
+        "numericScore": numeric_score,
+        "grade": grade,
+        "materials": materials,
+        "carbonFootprintKg": carbon_kg,
+        "waterUsageLiters": water_l,
+        "explanation": explanation,
+        "used": "fallback",
+    }
+
+
+def classify_fallback(text: str) -> dict:
+    """Keyword category + gender used by /classify when the model is unavailable. text is lowercased."""
+    if any(x in text for x in ["saree", "lehenga", "anarkali", "salwar", "kurti"]):
+        category = "women_ethnic"
+    elif any(x in text for x in ["shirt", "tshirt", "dress", "jeans", "trouser", "hoodie", "top"]):
+        category = "clothing_textiles"
+    elif any(x in text for x in ["shoe", "sandal", "sneaker", "boot"]):
+        category = "footwear"
+    elif any(x in text for x in ["phone", "laptop", "earphone", "headphone", "smartwatch", "camera"]):
+        category = "electronics"
+    elif any(x in text for x in ["cream", "shampoo", "lipstick", "lotion", "soap"]):
+        category = "beauty_personal_care"
+    elif any(x in text for x in ["towel", "bottle", "pan", "cookware", "bedsheet", "pillow", "mattress"]):
+        category = "home_kitchen"
+    else:
+        category = "generic_other"
+
+    if any(x in text for x in ["women", "ladies", "girl", "female"]):
+        gender = "female"
+    elif any(x in text for x in ["men", "male", "boy"]):
+        gender = "male"
+    else:
+        gender = "unisex"
+
+    return {"category": category, "gender": gender}
+
+
+# -----------------------------
+# Batch (vectorized) heuristic scoring
+# -----------------------------
+
+# Column order of the keyword-occurrence matrix: every material/weight keyword,
+# plus "recycled " for the standalone-"recycled" bonus in compute_heuristic_score().
+BATCH_KEYWORDS = sorted(set(MATERIALS) | set(MATERIAL_WEIGHTS) | {"recycled "})
+_KW_INDEX = {kw: j for j, kw in enumerate(BATCH_KEYWORDS)}
+
+_WEIGHT_VECTOR = np.array(
+    [MATERIAL_WEIGHTS.get(kw, 0) for kw in BATCH_KEYWORDS], dtype=np.int64
+)
+_MATERIAL_MASK = np.array([kw in set(MATERIALS) for kw in BATCH_KEYWORDS])
+
+# Keywords grouped by first byte, so each distinct first letter costs one scan
+_KW_BY_FIRST_BYTE = {}
+for _j, _kw in enumerate(BATCH_KEYWORDS):
+    _b = _kw.encode()
+    _KW_BY_FIRST_BYTE.setdefault(_b[0], []).append((_j, _b))
+_KW_PAD = max(len(kw) for kw in BATCH_KEYWORDS)
+
+_GRADE_LABELS = np.array(["F", "D", "C", "B", "A"])
+_GRADE_CUTS = np.array([0, 2, 5, 8])  # same thresholds as map_score_to_grade()
+
+BATCH_CHUNK = 65536  # texts per chunk, bounds memory on large catalog dumps
+
+
+def keyword_matrix(texts) -> np.ndarray:
+    """
+    Keyword-occurrence matrix for a list of texts.
+    Returns a bool array of shape (len(texts), len(BATCH_KEYWORDS)) where
+    [i, j] is True when text i contains BATCH_KEYWORDS[j] (the same substring
+    test as `kw in lower` in the scalar path). Dense on purpose, not sparse:
+    with only ~30 columns a bool row (30 bytes) is smaller than the index
+    lists of a sparse matrix, and the matrix @ weights product needs no
+    scipy. The search itself only touches candidate byte positions.
+    """
+    encoded = [(t.lower() if t else "").encode("utf-8") for t in texts]
+    n = len(encoded)
+    matrix = np.zeros((n, len(BATCH_KEYWORDS)), dtype=bool)
+    if n == 0:
+        return matrix
+
+    # All texts in one byte buffer, NUL-separated (keywords never contain NUL,
+    # and UTF-8 continuation bytes never equal an ASCII keyword byte).
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=n)
+    buf = np.frombuffer(b"\x00".join(encoded) + b"\x00" * _KW_PAD, dtype=np.uint8)
+    row_of = np.repeat(np.arange(n), lengths + 1)
+
+    for first, group in _KW_BY_FIRST_BYTE.items():
+        candidates = np.flatnonzero(buf == first)
+        for j, kw in group:
+            idx = candidates
+            for k in range(1, len(kw)):
+                idx = idx[buf[idx + k] == kw[k]]
+                if not idx.size:
+                    break
+            matrix[row_of[idx], j] = True
+    return matrix
+
+
+def _score_matrix(matrix) -> dict:
+    # Occurrence matrix x weight vector
+    score = matrix @ _WEIGHT_VECTOR
+
+    # "recycled" present but never followed by a space -> +2
+    bonus = matrix[:, _KW_INDEX["recycled"]] & ~matrix[:, _KW_INDEX["recycled "]]
+    score = np.clip(score + 2 * bonus, -10, 10)
+
+    grade = _GRADE_LABELS[np.searchsorted(_GRADE_CUTS, score, side="right")]
+
+    magnitude = np.abs(score)
+    carbon_kg = np.clip(magnitude * 0.8 + 1, 0.2, 12)
+    water_l = np.clip(magnitude * 150 + 200, 50, 3000)
+
+    return {
+        "numericScore": score,
+        "grade": grade,
+        "carbonFootprintKg": carbon_kg,
+        "waterUsageLiters": water_l,
+    }
+
+
+def score_batch(texts) -> dict:
+    """
+    Vectorized compute_heuristic_score() + fallback_analysis() numbers
+    for a whole list of texts.
+
+    Returns a dict of NumPy arrays (one entry per input text):
+      numericScore, grade, carbonFootprintKg, waterUsageLiters
+    Values are identical to the scalar path.
+    """
+    texts = list(texts)
+    parts = [
+        _score_matrix(keyword_matrix(texts[i:i + BATCH_CHUNK]))
+        for i in range(0, len(texts), BATCH_CHUNK)
+    ]
+    if not parts:
+        return _score_matrix(keyword_matrix([]))
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def fallback_analysis_batch(texts) -> list[dict]:
+    """
+    fallback_analysis() for many texts at once.
+    Output is identical to calling fallback_analysis() on each text.
+    """
+    texts = list(texts)
+    results = []
+    for i in range(0, len(texts), BATCH_CHUNK):
+        matrix = keyword_matrix(texts[i:i + BATCH_CHUNK])
+        batch = _score_matrix(matrix)
+
+        scores = batch["numericScore"].tolist()
+        grades = batch["grade"].tolist()
+        carbon = batch["carbonFootprintKg"].tolist()
+        water = batch["waterUsageLiters"].tolist()
+
+        # Keyword columns are sorted, so materials come out sorted like detect_materials()
+        materials = [[] for _ in scores]
+        rows, cols = np.nonzero(matrix & _MATERIAL_MASK)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            materials[r].append(BATCH_KEYWORDS[c])
+
+        for k in range(len(scores)):
+            results.append({
+                "numericScore": scores[k],
+                "grade": grades[k],
+                "materials": materials[k],
+                "carbonFootprintKg": carbon[k],
+                "waterUsageLiters": water[k],
+                "explanation": build_explanation(materials[k], scores[k]),
+                "used": "fallback",
+            })
+    return results
@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from structured_log import get_logger
+
+log = get_logger("shared_cache")
+
+
+class SharedCache:
+    """
+    Key/value cache shared by all worker processes on one host.
+
+    Backed by a small SQLite file in WAL mode, so any number of processes
+    (gunicorn workers) can read concurrently while one writes, with no
+    external service. Values are JSON. Every set() is a single atomic
+    INSERT OR REPLACE; entries expire after their TTL and the least recently
+    used ones are evicted once the cache grows past max_entries.
+
+    Counters (add_counts / top_counts) are kept next to the cache, so every
+    worker can add to them and any worker can rank the whole fleet's counts.
+    """
+
+    def __init__(self, path, max_entries=200_000, default_ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._sets = 0
+        self._evict_every = max(100, max_entries // 100)
+
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS counters (
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (kind, name)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_counters_top ON counters (kind, count)')
+        conn.commit()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads: one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        try:
+            row = self._conn().execute(
+                'SELECT value, expires_at, accessed_at FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return default
+        if row is None or row[1] <= now:
+            return default
+        if now - row[2] > 60:
+            # Coarse LRU: refresh the access time at most once a minute per key
+            try:
+                self._conn().execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+            except sqlite3.Error:
+                pass
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now + ttl, now),
+            )
+        except sqlite3.Error as e:
+            log.warning("Shared cache write failed: %s", e)
+            return
+        self._sets += 1
+        if self._sets % self._evict_every == 0:
+            self.evict()
+
+    def delete(self, key):
+        try:
+            self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones above max_entries."""
+        conn = self._conn()
+        try:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+            count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute('''
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?
+                    )
+                ''', (excess,))
+        except sqlite3.Error as e:
+            log.warning("Shared cache eviction failed: %s", e)
+
+    def add_counts(self, kind, counts, max_items=None):
+        """
+        Adds {name: n} to the counters of `kind` in one transaction. Past
+        max_items names, only the most counted half is kept.
+        """
+        if not counts:
+            return
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO counters (kind, name, count) VALUES (?, ?, ?)
+                ON CONFLICT (kind, name) DO UPDATE SET count = count + excluded.count
+            ''', [(kind, name, n) for name, n in counts.items()])
+            if max_items is not None:
+                total = conn.execute('SELECT COUNT(*) FROM counters WHERE kind = ?', (kind,)).fetchone()[0]
+                if total > max_items:
+                    conn.execute('''
+                        DELETE FROM counters WHERE kind = ? AND name NOT IN (
+                            SELECT name FROM counters WHERE kind = ? ORDER BY count DESC LIMIT ?
+                        )
+                    ''', (kind, kind, max_items // 2))
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            log.warning("Shared counter update failed: %s", e)
+
+    def top_counts(self, kind, n):
+        """[(name, count)] of the `n` most counted names of `kind`, highest first."""
+        try:
+            return self._conn().execute(
+                'SELECT name, count FROM counters WHERE kind = ? ORDER BY count DESC LIMIT ?', (kind, n)
+            ).fetchall()
+        except sqlite3.Error:
+            return []
+
+    def discard_counts(self, kind, names):
+        try:
+            self._conn().executemany(
+                'DELETE FROM counters WHERE kind = ? AND name = ?', [(kind, name) for name in names]
+            )
+        except sqlite3.Error:
+            pass
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
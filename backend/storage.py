@@ -0,0 +1,458 @@
+"""
+Storage backends for users, orders, price history and price watches.
+
+Both implementations expose the same methods with the same semantics:
+
+- SQLiteStore: the tables of database.py, on a per-thread connection tuned for
+  a web server (WAL, synchronous=NORMAL, busy timeout, bigger page cache).
+- MemoryStore: plain dicts behind a lock. Nothing touches the disk, so tests and
+  benchmarks measure the web and LLM layers alone.
+
+Streak, credit and monthly impact rules come from the shared helpers in
+database.py (order_is_sustainable, streak_update, order_impact), so both
+backends apply them identically. Every user/order method takes user_id
+first, which keeps sharding by user possible later.
+
+make_store() picks the backend from STORAGE_BACKEND (sqlite | memory).
+
+Product analyses, the search catalog and LLM usage are not part of the store:
+they always live in the SQLite database (database.py), so init_db() runs and
+greenchoice.db is used with either backend.
+"""
+import bisect
+import datetime
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from itertools import count
+
+import database
+from database import (
+    PRICE_SCALE, to_minor_units, order_is_sustainable, streak_update, order_impact,
+    get_or_create_product, get_last_price, insert_price, evaluate_price_watches,
+    write_order_status,
+)
+
+
+class Store(ABC):
+    """Interface shared by the storage backends. Rows support row['column']."""
+
+    # Users and orders
+    @abstractmethod
+    def get_user(self, user_id):
+        ...
+
+    @abstractmethod
+    def create_user(self, user_id):
+        ...
+
+    @abstractmethod
+    def get_order(self, order_id):
+        ...
+
+    @abstractmethod
+    def update_order_status(self, user_id, order_id, status, product_name=None,
+                            sustainability_score=None, carbon_credits=None):
+        """Creates or updates the order, then applies streak/credit changes. Returns the order row."""
+
+    @abstractmethod
+    def get_user_monthly_stats(self, user_id, months=12):
+        """The user's most recent `months` rows of monthly stats, newest first."""
+
+    # Price history
+    @abstractmethod
+    def get_product_id(self, canonical_url):
+        ...
+
+    @abstractmethod
+    def get_or_create_product(self, canonical_url, name=None):
+        """product_id for a canonical URL, adding the product if needed (and updating its name)."""
+
+    @abstractmethod
+    def get_last_price(self, product_id):
+        """(ts, price) of the latest price, or None."""
+
+    @abstractmethod
+    def insert_price(self, product_id, canonical_url, price, ts):
+        """Stores a price and evaluates the watches on the URL. Returns the number of alerts."""
+
+    @abstractmethod
+    def get_price_history(self, product_id):
+        """[(ts, price)], oldest first."""
+
+    @abstractmethod
+    def get_price_forecast(self, product_id):
+        ...
+
+    @abstractmethod
+    def get_hot_products(self, since_ts, limit=100):
+        """Products with the most stored prices (i.e. visits) since since_ts, most visited first."""
+
+    # Price watches
+    @abstractmethod
+    def add_watch(self, user_id, product_url, target_price, product_name=None):
+        """Adds a price-drop watch, or updates the target of an existing one (re-arming it)."""
+
+    @abstractmethod
+    def remove_watch(self, user_id, product_url):
+        """True if a watch was removed."""
+
+    @abstractmethod
+    def list_watches(self, user_id):
+        ...
+
+    @abstractmethod
+    def list_pending_notifications(self, user_id, limit=50):
+        """The user's undelivered notifications, oldest first. Doesn't change them."""
+
+    @abstractmethod
+    def ack_notifications(self, user_id, ids):
+        """Marks the user's notifications with these ids delivered. Returns how many were pending."""
+
+
+class SQLiteStore(Store):
+    """
+    The database.py schema on tuned per-thread connections. The tables must
+    exist: call database.init_db(path) first.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or database.DB_FILE
+        self._local = threading.local()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads: one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # fsync at checkpoints, not every commit
+            conn.execute('PRAGMA cache_size=-16000')   # 16 MB page cache
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA foreign_keys=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _one(self, sql, params):
+        return self._conn().execute(sql, params).fetchone()
+
+    def get_user(self, user_id):
+        return self._one('SELECT * FROM users WHERE user_id = ?', (user_id,))
+
+    def create_user(self, user_id):
+        conn = self._conn()
+        conn.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
+        conn.commit()
+
+    def get_order(self, order_id):
+        return self._one('SELECT * FROM orders WHERE order_id = ?', (order_id,))
+
+    def update_order_status(self, user_id, order_id, status, product_name=None,
+                            sustainability_score=None, carbon_credits=None):
+        return write_order_status(self._conn(), user_id, order_id, status, product_name,
+                                  sustainability_score, carbon_credits)
+
+    def get_user_monthly_stats(self, user_id, months=12):
+        return self._conn().execute('''
+            SELECT * FROM user_monthly_stats WHERE user_id = ?
+            ORDER BY month DESC LIMIT ?
+        ''', (user_id, months)).fetchall()
+
+    def get_product_id(self, canonical_url):
+        row = self._one('SELECT product_id FROM products WHERE canonical_url = ?', (canonical_url,))
+        return row[0] if row else None
+
+    def get_or_create_product(self, canonical_url, name=None):
+        conn = self._conn()
+        product_id = get_or_create_product(conn, canonical_url, name)
+        conn.commit()
+        return product_id
+
+    def get_last_price(self, product_id):
+        return get_last_price(self._conn(), product_id)
+
+    def insert_price(self, product_id, canonical_url, price, ts):
+        conn = self._conn()
+        insert_price(conn, product_id, price, ts)
+        alerts = evaluate_price_watches(conn, canonical_url, price)
+        conn.commit()
+        return alerts
+
+    def get_price_history(self, product_id):
+        rows = self._conn().execute(
+            'SELECT ts, price_minor FROM prices WHERE product_id = ? ORDER BY ts', (product_id,)
+        ).fetchall()
+        return [(ts, minor / PRICE_SCALE) for ts, minor in rows]
+
+    def get_price_forecast(self, product_id):
+        return self._one('SELECT * FROM price_forecast WHERE product_id = ?', (product_id,))
+
+    def get_hot_products(self, since_ts, limit=100):
+        return self._conn().execute('''
+            SELECT p.product_id, p.canonical_url, p.name, COUNT(*) AS visits
+            FROM prices pr JOIN products p ON p.product_id = pr.product_id
+            WHERE pr.ts >= ? AND p.name IS NOT NULL AND p.name != ''
+            GROUP BY pr.product_id
+            ORDER BY visits DESC
+            LIMIT ?
+        ''', (since_ts, limit)).fetchall()
+
+    def add_watch(self, user_id, product_url, target_price, product_name=None):
+        conn = self._conn()
+        conn.execute('''
+            INSERT INTO watches (user_id, product_url, product_name, target_price, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, product_url) DO UPDATE SET
+                target_price = excluded.target_price,
+                product_name = COALESCE(excluded.product_name, watches.product_name),
+                triggered_at = NULL
+        ''', (user_id, product_url, product_name, target_price, datetime.datetime.now().isoformat()))
+        conn.commit()
+        return self._one('SELECT * FROM watches WHERE user_id = ? AND product_url = ?', (user_id, product_url))
+
+    def remove_watch(self, user_id, product_url):
+        conn = self._conn()
+        cursor = conn.execute('DELETE FROM watches WHERE user_id = ? AND product_url = ?', (user_id, product_url))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def list_watches(self, user_id):
+        return self._conn().execute('SELECT * FROM watches WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+
+    def list_pending_notifications(self, user_id, limit=50):
+        return self._conn().execute('''
+            SELECT * FROM notifications
+            WHERE user_id = ? AND delivered = 0
+            ORDER BY id LIMIT ?
+        ''', (user_id, limit)).fetchall()
+
+    def ack_notifications(self, user_id, ids):
+        conn = self._conn()
+        cursor = conn.executemany(
+            'UPDATE notifications SET delivered = 1 WHERE id = ? AND user_id = ? AND delivered = 0',
+            [(i, user_id) for i in ids],
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+class MemoryStore(Store):
+    """
+    Everything in process memory, with SQLiteStore's semantics. For tests and
+    benchmarks; the data is lost on exit and not shared between workers.
+    Price forecasts come from the offline job over SQLite, so there are none here.
+    """
+
+    _STATS_COLUMNS = (
+        "sustainable_count", "non_sustainable_count", "credits", "score_sum",
+        "score_count", "carbon_saved_kg", "water_saved_liters",
+    )
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+        self._orders = {}
+        self._monthly = {}         # (user_id, month) -> stats dict
+        self._product_ids = {}     # canonical_url -> product_id
+        self._products = {}        # product_id -> product dict
+        self._price_ts = {}        # product_id -> sorted [ts]
+        self._prices = {}          # product_id -> {ts: price_minor}
+        self._watches = {}         # product_url -> {user_id: watch dict}, as idx_watches_url_target
+        self._user_watches = {}    # user_id -> {product_url}
+        self._notifications = {}   # user_id -> [pending notification dict], oldest first
+        self._ids = count(1)
+
+    def _new_user(self, user_id):
+        user = {
+            "user_id": user_id, "current_streak": 0, "longest_streak": 0,
+            "last_sustainable_purchase_date": None, "total_carbon_credits": 0.0, "carbon_rewards": 0,
+        }
+        self._users[user_id] = user
+        return user
+
+    def get_user(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user else None
+
+    def create_user(self, user_id):
+        with self._lock:
+            if user_id not in self._users:
+                self._new_user(user_id)
+
+    def get_order(self, order_id):
+        with self._lock:
+            order = self._orders.get(order_id)
+            return dict(order) if order else None
+
+    def update_order_status(self, user_id, order_id, status, product_name=None,
+                            sustainability_score=None, carbon_credits=None):
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is None:
+                order = {
+                    "order_id": order_id, "user_id": user_id, "product_name": product_name,
+                    "order_status": status, "sustainability_score": sustainability_score,
+                    "carbon_credits": carbon_credits,
+                    "is_sustainable": order_is_sustainable(sustainability_score),
+                    "purchase_date": datetime.date.today().isoformat(), "streak_awarded": 0,
+                }
+                self._orders[order_id] = order
+            else:
+                order["order_status"] = status
+            updated_order = dict(order)
+
+            user = self._users.get(user_id) or self._new_user(user_id)
+            change = streak_update(user, order)
+            if change is not None:
+                user_changes, awarded, stats_sign = change
+                user.update(user_changes)
+                order["streak_awarded"] = awarded
+                self._apply_monthly_stats(user_id, updated_order, stats_sign)
+            return updated_order
+
+    def _apply_monthly_stats(self, user_id, order, sign):
+        month = (order["purchase_date"] or datetime.date.today().isoformat())[:7]
+        stats = self._monthly.get((user_id, month))
+        if stats is None:
+            stats = dict.fromkeys(self._STATS_COLUMNS, 0)
+            stats.update(user_id=user_id, month=month)
+            self._monthly[(user_id, month)] = stats
+        for column, value in zip(self._STATS_COLUMNS, order_impact(order)):
+            stats[column] += value * sign
+
+    def get_user_monthly_stats(self, user_id, months=12):
+        with self._lock:
+            rows = [dict(s) for (uid, _), s in self._monthly.items() if uid == user_id]
+        rows.sort(key=lambda r: r["month"], reverse=True)
+        return rows[:months]
+
+    def get_product_id(self, canonical_url):
+        with self._lock:
+            return self._product_ids.get(canonical_url)
+
+    def get_or_create_product(self, canonical_url, name=None):
+        with self._lock:
+            product_id = self._product_ids.get(canonical_url)
+            if product_id is None:
+                product_id = len(self._products) + 1
+                self._product_ids[canonical_url] = product_id
+                self._products[product_id] = {
+                    "product_id": product_id, "canonical_url": canonical_url, "name": name or None,
+                }
+                self._price_ts[product_id] = []
+                self._prices[product_id] = {}
+            elif name:
+                self._products[product_id]["name"] = name
+            return product_id
+
+    def get_last_price(self, product_id):
+        with self._lock:
+            ts_list = self._price_ts.get(product_id)
+            if not ts_list:
+                return None
+            ts = ts_list[-1]
+            return (ts, self._prices[product_id][ts] / PRICE_SCALE)
+
+    def insert_price(self, product_id, canonical_url, price, ts):
+        with self._lock:
+            prices = self._prices[product_id]
+            # Two prices for one product in the same second: the last one wins
+            if ts not in prices:
+                bisect.insort(self._price_ts[product_id], ts)
+            prices[ts] = to_minor_units(price)
+            return self._evaluate_price_watches(canonical_url, price)
+
+    def _evaluate_price_watches(self, product_url, price):
+        now = datetime.datetime.now().isoformat()
+        fired = 0
+        for user_id, watch in self._watches.get(product_url, {}).items():
+            if watch["target_price"] >= price and watch["triggered_at"] is None:
+                self._notifications.setdefault(user_id, []).append({
+                    "id": next(self._ids), "user_id": user_id, "watch_id": watch["id"],
+                    "product_url": product_url, "product_name": watch["product_name"],
+                    "target_price": watch["target_price"], "price": price,
+                    "created_at": now, "delivered": 0,
+                })
+                watch["triggered_at"] = now
+                fired += 1
+            elif watch["target_price"] < price and watch["triggered_at"] is not None:
+                watch["triggered_at"] = None
+        return fired
+
+    def get_price_history(self, product_id):
+        with self._lock:
+            prices = self._prices.get(product_id, {})
+            return [(ts, prices[ts] / PRICE_SCALE) for ts in self._price_ts.get(product_id, [])]
+
+    def get_price_forecast(self, product_id):
+        return None
+
+    def get_hot_products(self, since_ts, limit=100):
+        with self._lock:
+            rows = []
+            for product_id, ts_list in self._price_ts.items():
+                product = self._products[product_id]
+                visits = len(ts_list) - bisect.bisect_left(ts_list, since_ts)
+                if visits and product["name"]:
+                    rows.append(dict(product, visits=visits))
+        rows.sort(key=lambda r: r["visits"], reverse=True)
+        return rows[:limit]
+
+    def add_watch(self, user_id, product_url, target_price, product_name=None):
+        with self._lock:
+            watch = self._watches.get(product_url, {}).get(user_id)
+            if watch is None:
+                watch = {
+                    "id": next(self._ids), "user_id": user_id, "product_url": product_url,
+                    "product_name": product_name, "target_price": target_price,
+                    "created_at": datetime.datetime.now().isoformat(), "triggered_at": None,
+                }
+                self._watches.setdefault(product_url, {})[user_id] = watch
+                self._user_watches.setdefault(user_id, set()).add(product_url)
+            else:
+                watch.update(target_price=target_price, triggered_at=None)
+                if product_name is not None:
+                    watch["product_name"] = product_name
+            return dict(watch)
+
+    def remove_watch(self, user_id, product_url):
+        with self._lock:
+            watches = self._watches.get(product_url, {})
+            if watches.pop(user_id, None) is None:
+                return False
+            if not watches:
+                del self._watches[product_url]
+            self._user_watches[user_id].discard(product_url)
+            return True
+
+    def list_watches(self, user_id):
+        with self._lock:
+            rows = [dict(self._watches[url][user_id]) for url in self._user_watches.get(user_id, ())]
+        rows.sort(key=lambda w: w["id"])
+        return rows
+
+    def list_pending_notifications(self, user_id, limit=50):
+        with self._lock:
+            return [dict(n) for n in self._notifications.get(user_id, [])[:limit]]
+
+    def ack_notifications(self, user_id, ids):
+        ids = set(ids)
+        with self._lock:
+            pending = self._notifications.get(user_id, [])
+            keep = [n for n in pending if n["id"] not in ids]
+            self._notifications[user_id] = keep
+            return len(pending) - len(keep)
+
+
+def make_store(backend=None, path=None):
+    """SQLiteStore (default) or MemoryStore, from the argument or STORAGE_BACKEND."""
+    backend = backend or os.getenv("STORAGE_BACKEND", "sqlite")
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sqlite":
+        return SQLiteStore(path)
+    raise ValueError(f"unknown storage backend {backend!r}")
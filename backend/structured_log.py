@@ -0,0 +1,199 @@
+"""
+Non-blocking structured (JSON lines) logging.
+
+Request threads only put records on a bounded in-memory queue; a background
+QueueListener thread formats them (including tracebacks) and writes them to
+stderr. When the queue is full, records are dropped and counted instead of
+blocking the request. Repeated messages (same logger and message template, e.g.
+"AI failed, using fallback: %s" during a provider outage) are rate-limited
+per time window; the next record that gets through carries how many were
+suppressed.
+
+Every record carries the request ID and the phase ("llm", "db", ...) it was
+logged in, taken from context variables, so the LLM and DB work of one request
+can be followed across the log, including in worker threads started with
+contextvars.copy_context().
+"""
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+ROOT = "greenchoice"
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+phase_var = contextvars.ContextVar("log_phase", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def get_logger(name):
+    """Logger under the "greenchoice" hierarchy configured by setup_logging()."""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def phase(name, logger=None, **fields):
+    """Tags records logged inside the block with phase=name; logs its duration at DEBUG."""
+    token = phase_var.set(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if logger is not None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s phase done", name, extra=dict(fields, duration_ms=round((time.perf_counter() - t0) * 1000, 2)))
+        phase_var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds request_id and phase from the caller's context. Runs on the logging thread, before the queue."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.phase = phase_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` WARNING+ records per (logger, message
+    template) every `window_s` seconds. Lower levels are off in production and
+    pass unchanged when enabled.
+    """
+
+    def __init__(self, burst=5, window_s=60.0):
+        super().__init__()
+        self.burst = burst
+        self.window_s = window_s
+        self._windows = {}  # key -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_s:
+                suppressed = window[2] if window else 0
+                if len(self._windows) > 10_000:
+                    self._windows.clear()  # runaway templates; start over rather than grow
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the bounded queue is full."""
+
+    def __init__(self, queue_size=10_000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only merge the message args here; formatting (and tracebacks) happens
+        # on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Blocking put: the queue may be full when shutting down
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, phase, extra fields, exc."""
+
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and value is not None:
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+_handler = None
+_rate_limit = None
+_listener = None
+
+
+def setup_logging(level="INFO", queue_size=10_000, burst=5, window_s=60.0, stream=None):
+    """
+    Routes the "greenchoice" loggers through the non-blocking queue. Safe to
+    call more than once; returns the QueueListener.
+    """
+    global _handler, _rate_limit, _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    _handler = DroppingQueueHandler(queue_size)
+    _rate_limit = RateLimitFilter(burst, window_s)
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(_rate_limit)
+
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(level)
+    for old in [h for h in logger.handlers if isinstance(h, DroppingQueueHandler)]:
+        logger.removeHandler(old)
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+    _listener = _Listener(_handler.queue, output)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flushes what is queued and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_stats():
+    return {
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+        "suppressed": _rate_limit.suppressed if _rate_limit else 0,
+    }
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from cache_warmer import CoOccurrence, DemandCounter, FleetCounts
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, "shared_cache.db")
+
+
+def test_local_counter_ranks_and_discards():
+    views = DemandCounter()
+    views.record(["a", "b", "a", "c", "a", "b"])
+    assert views.most_common(2) == ["a", "b"]
+    views.discard(["a"])
+    assert views.most_common(5) == ["b", "c"]
+
+
+def test_fleet_counts_add_up_across_workers(path):
+    # One SharedCache per worker process, all on the same file
+    workers = [FleetCounts(SharedCache(path), "product_views", max_items=100, flush_s=0) for _ in range(3)]
+    for i, counts in enumerate(workers):
+        counts.update(["kurta"] * (i + 1) + ["bottle"])
+    assert workers[0].most_common(2) == [("kurta", 6), ("bottle", 3)]
+
+
+def test_fleet_counts_buffer_until_flush(path):
+    recorder = FleetCounts(SharedCache(path), "product_views", max_items=100, flush_s=3600)
+    reader = FleetCounts(SharedCache(path), "product_views", max_items=100, flush_s=3600)
+    recorder.update(["kurta", "kurta"])
+    assert reader.most_common(5) == []
+    recorder.flush()
+    assert reader.most_common(5) == [("kurta", 2)]
+
+
+def test_fleet_counts_keep_most_counted_half(path):
+    counts = FleetCounts(SharedCache(path), "views", max_items=4, flush_s=0)
+    counts.update(["a"] * 5 + ["b"] * 4 + ["c"] * 3 + ["d"] * 2)
+    counts.update(["e"])
+    assert [name for name, _ in counts.most_common(10)] == ["a", "b"]
+
+
+def test_kinds_are_separate(path):
+    shared = SharedCache(path)
+    views = DemandCounter(shared=shared, kind="product_views")
+    demand = DemandCounter(shared=shared, kind="alternatives_demand")
+    views.record(["kurta"])
+    demand.record(["bottle"])
+    assert views.most_common(5) == ["kurta"]
+    assert demand.most_common(5) == ["bottle"]
+    views.discard(["kurta"])
+    assert views.most_common(5) == []
+    assert demand.most_common(5) == ["bottle"]
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_co_occurrence_neighbours(path, shared):
+    together = CoOccurrence(shared=SharedCache(path), kind="together") if shared else CoOccurrence()
+    together.record(["kurta", "tote", "bottle"])
+    together.record(["kurta", "tote"])
+    together.record(["lamp", "rug"])
+    assert together.neighbours(["kurta"], 5) == ["tote", "bottle"]
+    assert together.neighbours(["kurta", "tote"], 5) == ["bottle"]
+    assert together.neighbours(["chair"], 5) == []
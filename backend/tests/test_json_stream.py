@@ -0,0 +1,59 @@
+import pytest
+
+from json_stream import IncrementalJSONParser, parse_stream
+
+
+def is_dict(x):
+    return isinstance(x, dict)
+
+
+def feed_in_chunks(text, size=3, **kwargs):
+    """(elements handed out while streaming, parser) for `text` fed `size` characters at a time."""
+    parser = IncrementalJSONParser(**kwargs)
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted += parser.feed(text[i:i + size])
+        if parser.done:
+            break
+    return emitted, parser
+
+
+ALTERNATIVES = dict(target="array", accept=lambda arr: any(map(is_dict, arr)), accept_element=is_dict)
+
+
+def test_elements_stream_out_and_trailing_prose_is_ignored():
+    emitted, parser = feed_in_chunks('Sure! [{"id": 1}, {"id": 2}] Hope that helps :-{', **ALTERNATIVES)
+    assert emitted == [{"id": 1}, {"id": 2}]
+    assert parser.done and parser.result == emitted
+
+
+def test_mixed_array_keeps_objects_after_a_stray_element():
+    emitted, parser = feed_in_chunks('["note", {"id": 1}, 3, {"id": 2}]', **ALTERNATIVES)
+    assert emitted == [{"id": 1}, {"id": 2}]
+    assert parser.done
+
+
+def test_prose_array_is_skipped():
+    emitted, parser = feed_in_chunks('Rated [1, 2] of them: [{"id": 1}]', **ALTERNATIVES)
+    assert emitted == [{"id": 1}]
+    assert parser.result == [{"id": 1}]
+
+
+def test_unclosed_array_keeps_streamed_elements():
+    emitted, parser = feed_in_chunks('[{"id": 1}, {"id": 2}, {"id"', **ALTERNATIVES)
+    assert emitted == [{"id": 1}, {"id": 2}]
+    assert parser.elements == emitted
+
+
+def test_lone_object_instead_of_array():
+    assert parse_stream(['Result: {"id": 1', '}'], target="array") == [{"id": 1}]
+
+
+def test_unbalanced_brace_in_prose_is_given_up():
+    chunks = ["I'm unsure :-{ but here ", '{"grade": "B"}']
+    assert parse_stream(chunks, accept=lambda obj: "grade" in obj) == {"grade": "B"}
+
+
+def test_no_json():
+    with pytest.raises(ValueError):
+        parse_stream(["no json here"], target="array")
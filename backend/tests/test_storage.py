@@ -0,0 +1,188 @@
+"""The Store contract, run against both backends."""
+import datetime
+import os
+
+import pytest
+
+import database
+from storage import MemoryStore, SQLiteStore
+
+URL = "https://www.amazon.in/dp/B01N7PGSYF"
+OTHER_URL = "https://www.amazon.in/dp/B07XJ8C8F5"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    path = os.path.join(tmp_path, "store.db")
+    database.init_db(path)
+    return SQLiteStore(path)
+
+
+def user(store, user_id):
+    row = store.get_user(user_id)
+    return (row["current_streak"], row["longest_streak"], row["total_carbon_credits"], row["carbon_rewards"])
+
+
+def this_month(store, user_id):
+    rows = store.get_user_monthly_stats(user_id)
+    assert [r["month"] for r in rows] == [datetime.date.today().isoformat()[:7]]
+    return {k: rows[0][k] for k in ("sustainable_count", "non_sustainable_count", "credits", "score_count")}
+
+
+# Users and orders
+
+def test_unknown_user_and_order(store):
+    assert store.get_user("u1") is None
+    assert store.get_order("o1") is None
+    store.create_user("u1")
+    store.create_user("u1")
+    assert user(store, "u1") == (0, 0, 0.0, 0)
+
+
+def test_delivered_sustainable_order_counts_once(store):
+    store.update_order_status("u1", "o1", "placed", "Bamboo toothbrush", 8, 0.8)
+    assert user(store, "u1") == (0, 0, 0.0, 0)
+    assert store.get_order("o1")["order_status"] == "placed"
+
+    store.update_order_status("u1", "o1", "delivered")
+    store.update_order_status("u1", "o1", "delivered")
+    order = store.get_order("o1")
+    assert (order["order_status"], order["is_sustainable"], order["streak_awarded"]) == ("delivered", 1, 1)
+    assert user(store, "u1") == (1, 1, 0.8, 0)
+    assert this_month(store, "u1") == {
+        "sustainable_count": 1, "non_sustainable_count": 0, "credits": 0.8, "score_count": 1,
+    }
+
+
+def test_return_reverts_streak_credits_and_stats(store):
+    store.update_order_status("u1", "o1", "delivered", "Bamboo toothbrush", 8, 0.8)
+    store.update_order_status("u1", "o2", "delivered", "Jute bag", 6, 0.6)
+    assert user(store, "u1")[:2] == (2, 2)
+
+    store.update_order_status("u1", "o1", "returned")
+    assert store.get_order("o1")["streak_awarded"] == 0
+    streak, longest, credits, _ = user(store, "u1")
+    assert (streak, longest, credits) == (1, 2, pytest.approx(0.6))
+    assert this_month(store, "u1")["sustainable_count"] == 1
+
+
+def test_non_sustainable_delivery_resets_streak(store):
+    store.update_order_status("u1", "o1", "delivered", "Bamboo toothbrush", 8, 0.8)
+    store.update_order_status("u1", "o2", "delivered", "Polyester shirt", -3, 0.0)
+    assert user(store, "u1")[:2] == (0, 1)
+    assert this_month(store, "u1")["non_sustainable_count"] == 1
+
+
+def test_carbon_rewards_per_five_credits(store):
+    for i in range(6):
+        store.update_order_status("u1", f"o{i}", "delivered", "Hemp tote", 10, 1.0)
+    assert user(store, "u1") == (6, 6, 6.0, 1)
+
+
+# Price history
+
+def test_prices_and_history(store):
+    assert store.get_product_id(URL) is None
+    product_id = store.get_or_create_product(URL, "Flask")
+    assert store.get_or_create_product(URL) == product_id
+    assert store.get_product_id(URL) == product_id
+    assert store.get_or_create_product(OTHER_URL) != product_id
+    assert store.get_last_price(product_id) is None
+
+    store.insert_price(product_id, URL, 499.0, 200)
+    store.insert_price(product_id, URL, 549.5, 100)
+    store.insert_price(product_id, URL, 450.25, 300)
+    assert store.get_price_history(product_id) == [(100, 549.5), (200, 499.0), (300, 450.25)]
+    assert tuple(store.get_last_price(product_id)) == (300, 450.25)
+
+    # The same second again: the last price wins
+    store.insert_price(product_id, URL, 455.0, 300)
+    assert store.get_price_history(product_id)[-1] == (300, 455.0)
+
+
+def test_hot_products(store):
+    named = store.get_or_create_product(URL, "Flask")
+    unnamed = store.get_or_create_product(OTHER_URL)
+    for ts in (100, 200, 300):
+        store.insert_price(named, URL, 10.0, ts)
+        store.insert_price(unnamed, OTHER_URL, 10.0, ts)
+    hot = store.get_hot_products(since_ts=150)
+    assert [(r["product_id"], r["visits"]) for r in hot] == [(named, 2)]
+    assert list(store.get_hot_products(since_ts=400)) == []
+
+
+# Price watches and notifications
+
+def test_watch_fires_once_and_rearms(store):
+    product_id = store.get_or_create_product(URL, "Flask")
+    watch = store.add_watch("u1", URL, 500.0, "Flask")
+    assert (watch["product_url"], watch["target_price"], watch["triggered_at"]) == (URL, 500.0, None)
+
+    assert store.insert_price(product_id, URL, 520.0, 100) == 0
+    assert store.insert_price(product_id, URL, 480.0, 200) == 1
+    assert store.insert_price(product_id, URL, 470.0, 300) == 0   # already fired
+    assert store.insert_price(product_id, URL, 530.0, 400) == 0   # re-arms
+    assert store.insert_price(product_id, URL, 490.0, 500) == 1
+
+    pending = store.list_pending_notifications("u1")
+    assert [(n["price"], n["target_price"], n["product_url"]) for n in pending] == [
+        (480.0, 500.0, URL), (490.0, 500.0, URL),
+    ]
+
+
+def test_watches_only_fire_on_their_url(store):
+    product_id = store.get_or_create_product(URL)
+    other_id = store.get_or_create_product(OTHER_URL)
+    store.add_watch("u1", URL, 500.0)
+    store.add_watch("u2", URL, 400.0)
+    store.add_watch("u2", OTHER_URL, 1000.0)
+
+    assert store.insert_price(product_id, URL, 450.0, 100) == 1
+    assert store.insert_price(other_id, OTHER_URL, 450.0, 100) == 1
+    assert [n["product_url"] for n in store.list_pending_notifications("u1")] == [URL]
+    assert [n["product_url"] for n in store.list_pending_notifications("u2")] == [OTHER_URL]
+
+
+def test_add_watch_updates_and_rearms(store):
+    product_id = store.get_or_create_product(URL)
+    first = store.add_watch("u1", URL, 500.0, "Flask")
+    store.insert_price(product_id, URL, 450.0, 100)
+
+    again = store.add_watch("u1", URL, 400.0)
+    assert again["id"] == first["id"]
+    assert (again["target_price"], again["product_name"], again["triggered_at"]) == (400.0, "Flask", None)
+    assert store.insert_price(product_id, URL, 390.0, 200) == 1
+
+
+def test_list_and_remove_watches(store):
+    store.add_watch("u1", OTHER_URL, 100.0)
+    store.add_watch("u1", URL, 200.0)
+    store.add_watch("u2", URL, 300.0)
+    assert [w["product_url"] for w in store.list_watches("u1")] == [OTHER_URL, URL]
+
+    assert store.remove_watch("u1", OTHER_URL) is True
+    assert store.remove_watch("u1", OTHER_URL) is False
+    assert [w["product_url"] for w in store.list_watches("u1")] == [URL]
+    assert [w["target_price"] for w in store.list_watches("u2")] == [300.0]
+
+    # A removed watch no longer fires
+    product_id = store.get_or_create_product(OTHER_URL)
+    assert store.insert_price(product_id, OTHER_URL, 50.0, 100) == 0
+
+
+def test_notifications_stay_pending_until_acked(store):
+    product_id = store.get_or_create_product(URL)
+    store.add_watch("u1", URL, 500.0)
+    store.insert_price(product_id, URL, 450.0, 100)
+
+    # Listing is read-only: a second read (retry, another tab) sees the same alerts
+    ids = [n["id"] for n in store.list_pending_notifications("u1")]
+    assert len(ids) == 1
+    assert [n["id"] for n in store.list_pending_notifications("u1")] == ids
+
+    assert store.ack_notifications("u2", ids) == 0
+    assert store.ack_notifications("u1", ids) == 1
+    assert store.ack_notifications("u1", ids) == 0
+    assert list(store.list_pending_notifications("u1")) == []
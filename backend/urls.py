@@ -0,0 +1,195 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Bump when the rules below change the key of URLs already stored:
+# init_db() then re-keys products, watches and analyses (merge_duplicate_products).
+RULES_VERSION = 3
+
+# Query parameters that never identify the product
+TRACKING_PARAMS = {
+    "ref", "ref_", "tag", "gclid", "fbclid", "msclkid", "yclid", "dclid", "igshid",
+    "mc_cid", "mc_eid", "srsltid", "_encoding", "psc",
+}
+TRACKING_PREFIXES = ("utm_", "pd_rd_", "pf_rd_")
+
+# Per-marketplace rules. A product page reduces to `canonical_path` on
+# `canonical_host` (mobile, smile, deep-link hosts fold into one), keeping only
+# the `keep_params` that select a variant. `host` is matched against the whole
+# host name; its named groups fill `canonical_host`. The product ID comes from
+# `id_path` (searched in the path) or the `id_query` parameter. Pages without a
+# product ID (search, category) get the generic treatment on the canonical host,
+# minus the marketplace's own tracking parameters (`drop_params`).
+# `examples` are (input, expected) pairs checked by `python urls.py`.
+MARKETPLACE_RULES = [
+    {
+        "name": "amazon",
+        "host": r"(?:www\.|m\.|smile\.)?amazon\.(?P<tld>com|in|co\.uk|de|fr|it|es|ca|com\.au|co\.jp|ae|sg)",
+        "canonical_host": "www.amazon.{tld}",
+        "id_path": r"/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin)/(?P<id>[a-z0-9]{10})(?:[/?]|$)",
+        "id_query": "asin",
+        "upper_id": True,
+        "canonical_path": "/dp/{id}",
+        "keep_params": (),
+        "drop_params": (),
+        "examples": [
+            ("https://www.amazon.in/Milton-Thermosteel-Flask/dp/B01N7PGSYF/ref=sr_1_3?dib=eyJ2&keywords=steel+bottle&qid=1712345678&sr=8-3",
+             "https://www.amazon.in/dp/B01N7PGSYF"),
+            ("https://m.amazon.in/dp/b01n7pgsyf?th=1&psc=1", "https://www.amazon.in/dp/B01N7PGSYF"),
+            ("http://smile.amazon.com/gp/product/B07XJ8C8F5/?content-id=amzn1.sym.1234#reviews",
+             "https://www.amazon.com/dp/B07XJ8C8F5"),
+            ("https://www.amazon.co.uk/gp/aw/d/B08N5WRWNW", "https://www.amazon.co.uk/dp/B08N5WRWNW"),
+            ("https://www.amazon.in/s?k=bamboo+toothbrush&ref=nb_sb_noss", "https://www.amazon.in/s?k=bamboo+toothbrush"),
+        ],
+    },
+    {
+        "name": "flipkart",
+        "host": r"(?:www\.|m\.|dl\.)?flipkart\.com",
+        "canonical_host": "www.flipkart.com",
+        "id_path": r"/p/(?P<id>itm[0-9a-z]+)(?:/|$)",
+        "id_query": None,
+        "upper_id": False,
+        "canonical_path": "/product/p/{id}",
+        "keep_params": ("pid",),
+        "drop_params": ("otracker", "otracker1", "fm", "iid", "ssid", "qh", "srno", "affid"),
+        "examples": [
+            ("https://www.flipkart.com/boat-airdopes-141/p/itm5b1f3a8e6c2d1?pid=ACCG6DS7WDJHGWSH&lid=LSTACCG6DS7&marketplace=FLIPKART&store=0pm&srno=s_1_1&otracker=search&fm=organic&iid=abc&ssid=xyz&qH=123",
+             "https://www.flipkart.com/product/p/itm5b1f3a8e6c2d1?pid=ACCG6DS7WDJHGWSH"),
+            ("https://dl.flipkart.com/dl/boat-airdopes-141/p/itm5b1f3a8e6c2d1?pid=ACCG6DS7WDJHGWSH&affid=foo",
+             "https://www.flipkart.com/product/p/itm5b1f3a8e6c2d1?pid=ACCG6DS7WDJHGWSH"),
+            ("https://www.flipkart.com/search?q=jute+bag&otracker=search&otracker1=search&fm=organic",
+             "https://www.flipkart.com/search?q=jute+bag"),
+        ],
+    },
+    {
+        "name": "myntra",
+        "host": r"(?:www\.|m\.)?myntra\.com",
+        "canonical_host": "www.myntra.com",
+        "id_path": r"/(?P<id>\d{6,})(?:/buy)?/?$",
+        "id_query": None,
+        "upper_id": False,
+        "canonical_path": "/{id}",
+        "keep_params": (),
+        "drop_params": (),
+        "examples": [
+            ("https://www.myntra.com/tshirts/roadster/roadster-men-organic-cotton-tshirt/22145678/buy?utm_source=share",
+             "https://www.myntra.com/22145678"),
+            ("https://myntra.com/22145678", "https://www.myntra.com/22145678"),
+        ],
+    },
+    {
+        "name": "meesho",
+        "host": r"(?:www\.|m\.)?meesho\.com",
+        "canonical_host": "www.meesho.com",
+        "id_path": r"/p/(?P<id>[0-9a-z]+)/?$",
+        "id_query": None,
+        "upper_id": False,
+        "canonical_path": "/s/p/{id}",
+        "keep_params": (),
+        "drop_params": (),
+        "examples": [
+            ("https://www.meesho.com/women-cotton-kurta/p/2x7k1q?utm_medium=share", "https://www.meesho.com/s/p/2x7k1q"),
+            ("https://meesho.com/s/p/2x7k1q", "https://www.meesho.com/s/p/2x7k1q"),
+        ],
+    },
+]
+
+# Checked by `python urls.py` along with the marketplace examples
+GENERIC_EXAMPLES = [
+    ("HTTPS://Shop.Example.com/item/42/?utm_source=x&color=red&size=m#top", "https://shop.example.com/item/42?color=red&size=m"),
+    ("http://shop.example.com", "https://shop.example.com/"),
+    ("ftp://example.com/x", ""),
+    ("not a url", ""),
+]
+
+
+def _compile(rule):
+    return dict(
+        rule,
+        host=re.compile(rule["host"]),
+        id_path=re.compile(rule["id_path"], re.IGNORECASE),
+    )
+
+
+_RULES = [_compile(rule) for rule in MARKETPLACE_RULES]
+
+
+def _match_marketplace(hostname):
+    for rule in _RULES:
+        match = rule["host"].fullmatch(hostname or "")
+        if match:
+            return rule, match
+    return None, None
+
+
+def _product_id(rule, path, query):
+    match = rule["id_path"].search(path)
+    product_id = match.group("id") if match else None
+    if product_id is None and rule["id_query"]:
+        product_id = next((v for k, v in query if k.lower() == rule["id_query"] and v), None)
+    if product_id and rule["upper_id"]:
+        product_id = product_id.upper()
+    return product_id
+
+
+def canonical_url(url: str) -> str:
+    """
+    Canonical form of a product URL used as a storage/cache key.
+    Marketplace product pages (MARKETPLACE_RULES) reduce to their product ID on
+    one host. Anything else: lower-case scheme and host, no credentials or
+    default port, no fragment, no tracking parameters, remaining query
+    parameters sorted, no trailing slash.
+    Returns "" for anything that isn't an http(s) URL with a host name.
+    """
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return ""
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return ""
+    try:
+        port = parts.port
+    except ValueError:
+        return ""
+
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    # No credentials, and no port the scheme implies
+    host = parts.hostname
+    if port and port != {"http": 80, "https": 443}[scheme]:
+        host = f"{host}:{port}"
+    dropped = TRACKING_PARAMS
+    rule, match = _match_marketplace(parts.hostname)
+    if rule is not None:
+        host = rule["canonical_host"].format(**match.groupdict())
+        product_id = _product_id(rule, parts.path, query)
+        if product_id:
+            kept = sorted((k.lower(), v) for k, v in query if k.lower() in rule["keep_params"])
+            return urlunsplit(("https", host, rule["canonical_path"].format(id=product_id), urlencode(kept), ""))
+        dropped = TRACKING_PARAMS.union(rule["drop_params"])
+
+    query = [
+        (k, v) for k, v in query
+        if k.lower() not in dropped and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    query.sort()
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def check_rules():
+    """(url, expected, got) for every example the rules get wrong."""
+    examples = [ex for rule in MARKETPLACE_RULES for ex in rule["examples"]] + GENERIC_EXAMPLES
+    return [(url, expected, got) for url, expected in examples if (got := canonical_url(url)) != expected]
+
+
+if __name__ == "__main__":
+    import sys
+
+    failures = check_rules()
+    for url, expected, got in failures:
+        print(f"{url}\n  expected {expected}\n  got      {got}")
+    total = sum(len(rule["examples"]) for rule in MARKETPLACE_RULES) + len(GENERIC_EXAMPLES)
+    print(f"{total - len(failures)}/{total} examples pass")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,39 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process counts as the single worker
+    fcntl = None
+
+from structured_log import get_logger
+
+log = get_logger("worker_lock")
+
+_held = {}  # path -> open lock file, kept for the life of the process
+
+
+def hold_lock(path):
+    """
+    True if this process holds the exclusive lock file `path`, taking it if
+    it is free. Used to pick the one gunicorn worker that runs process-wide
+    singletons (snapshot writer, cache warmer). The lock is released by the
+    OS when the process exits, so another worker can take over after a restart.
+    """
+    if path in _held:
+        return True
+    if fcntl is None:
+        _held[path] = None
+        return True
+    f = open(path, "a+")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    _held[path] = f
+    log.info("Holding %s", path)
+    return True
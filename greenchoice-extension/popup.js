@@ -1,6 +1,6 @@
 // popup.js
 const API_BASE = "http://localhost:5000";
-async function classifyAI(title, breadcrumb, description) {
+async function classifyAI(title, breadcrumb, description, url) {
   try {
     const resp = await fetch(API_BASE + "/classify", {
       method: "POST",
@@ -8,7 +8,8 @@ async function classifyAI(title, breadcrumb, description) {
       body: JSON.stringify({
         title: title || "",
         breadcrumb: breadcrumb || "",
-        description: description || ""
+        description: description || "",
+        url: url || ""
       })
     });
 
@@ -142,22 +143,49 @@ async function analyzeProduct() {
         }
 
         try {
+          // Last analysis for this URL + its ETag, so an unchanged result
+          // comes back as an empty 304 instead of the full body.
+          const cacheKey = 'analysis:' + (productData.url || '');
+          const cached = await getCachedAnalysis(cacheKey);
+          const headers = { 'Content-Type': 'application/json' };
+          if (cached && cached.etag) headers['If-None-Match'] = cached.etag;
+
           const resp = await fetch(API_BASE + '/analyze', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers,
             body: JSON.stringify({
               url: productData.url || '',
               title: productData.title || '',
-              description: productData.description || ''
+              description: productData.description || '',
+              async: true
             })
           });
           console.log('[popup] /analyze status:', resp.status);
-          if (!resp.ok) throw new Error('HTTP ' + resp.status);
 
-          const data = await resp.json();
+          let data;
+          if (resp.status === 304 && cached) {
+            data = cached.data;
+          } else {
+            if (!resp.ok) throw new Error('HTTP ' + resp.status);
+            data = await resp.json();
+            const etag = resp.headers.get('ETag');
+            if (etag && productData.url) {
+              chrome.storage.local.set({ [cacheKey]: { etag, data } });
+            }
+          }
           console.log('[popup] /analyze data:', data);
           displayResult(data, productData);
           setStatus('');
+
+          // Instant heuristic result: poll for the AI one and re-render
+          if (data.pending && data.jobId) {
+            setStatus('Refining with AI...');
+            const upgraded = await pollAnalysisJob(data.jobId);
+            if (upgraded) {
+              displayResult(upgraded, productData);
+            }
+            setStatus('');
+          }
         } catch (err) {
           console.error('[popup] analyzeProduct fetch error:', err);
           setStatus('Analysis failed. Is backend running?');
@@ -167,6 +195,33 @@ async function analyzeProduct() {
   });
 }
 
+async function pollAnalysisJob(jobId) {
+  // Long-poll: each request waits up to 20 s on the server
+  for (let attempt = 0; attempt < 3; attempt++) {
+    try {
+      const resp = await fetch(API_BASE + '/analysis/' + encodeURIComponent(jobId) + '?wait=20');
+      if (!resp.ok) return null;
+      const job = await resp.json();
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed') return null;
+    } catch (e) {
+      console.warn('[popup] analysis job poll failed:', e);
+      return null;
+    }
+  }
+  return null;
+}
+
+function getCachedAnalysis(key) {
+  return new Promise((resolve) => {
+    try {
+      chrome.storage.local.get(key, (items) => resolve((items && items[key]) || null));
+    } catch (e) {
+      resolve(null);
+    }
+  });
+}
+
 function displayResult(data, productData) {
   document.getElementById('result').classList.remove('hidden');
 
@@ -1322,7 +1377,8 @@ async function compareAcrossSites() {
     const ai = await classifyAI(
       productData?.title,
       productData?.breadcrumb,
-      productData?.description
+      productData?.description,
+      productData?.url
     );
 
     let category = ai?.category || "unknown";
@@ -1634,6 +1690,43 @@ async function fetchStreak() {
   }
 }
 
+// Pending price-drop alerts: shown, then acknowledged so they don't come back
+async function fetchNotifications() {
+  const userId = await getUserId();
+  try {
+    const resp = await fetch(API_BASE + "/notifications?user_id=" + userId);
+    if (!resp.ok) return;
+    const data = await resp.json();
+    const alerts = data.notifications || [];
+    const section = document.getElementById("priceAlertsSection");
+    const list = document.getElementById("priceAlertsList");
+    if (!alerts.length || !section || !list) return;
+
+    list.innerHTML = "";
+    alerts.forEach((n) => {
+      const li = document.createElement("li");
+      const link = document.createElement("a");
+      link.href = n.url;
+      link.target = "_blank";
+      link.textContent = n.name || n.url;
+      li.appendChild(link);
+      li.appendChild(document.createTextNode(
+        " is now ₹" + n.price + " (target ₹" + n.targetPrice + ")"
+      ));
+      list.appendChild(li);
+    });
+    section.style.display = "block";
+
+    await fetch(API_BASE + "/notifications/ack", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ user_id: userId, ids: alerts.map((n) => n.id) })
+    });
+  } catch (e) {
+    console.warn("Failed to fetch notifications", e);
+  }
+}
+
 // Listen for updates from background while popup is open
 chrome.runtime.onMessage.addListener((req, sender, sendResponse) => {
   if (req.action === "streakUpdated" && req.data) {
@@ -1662,6 +1755,7 @@ document.addEventListener('DOMContentLoaded', () => {
   // Decide which buttons to show based on the current page
   initActionButtonsVisibility();
   fetchStreak();
+  fetchNotifications();
 
   const checkBtn = document.getElementById('checkBtn');
   const altsBtn = document.getElementById('altsBtn');